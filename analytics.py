@@ -0,0 +1,283 @@
+"""Rolling analytics over the daily history: moving averages, streaks and load.
+
+`RollingAnalytics` keeps one contiguous NumPy array per daily series,
+indexed by days since the first logged day, and only cumulative state
+derived from them: running sums, the last rest day before each day and the
+interpolated weight. Triggers log every day whose daily_summary or body
+measurement row changes in `day_changes` (see models.py); `refresh` reads
+the log entries added since the last refresh, re-reads the days from the
+earliest one they name and recomputes the state from there on. Logging
+today's workout costs a few array operations and a read of one day,
+however long the history is. Moving averages are differences of running
+sums, taken when a snapshot is asked for.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+
+import archive
+from models import Workout, BodyMeasurement, DailySummary, DayChange
+
+WINDOWS = (7, 30)
+# Trailing window of the smoothed weight trend, in days
+WEIGHT_SMOOTHING_DAYS = 7
+
+# Columns of the per-day array, in DailySummary order
+WORKOUTS, BURNED, MEALS, CONSUMED = range(4)
+
+EPOCH = date(1970, 1, 1)
+# Julian day number of EPOCH
+EPOCH_JULIAN_DAY = 2440587.5
+
+def _epoch_day(date_column):
+    """SQL expression for the days since EPOCH, so rows arrive as plain integers"""
+    return cast(func.julianday(date_column) - EPOCH_JULIAN_DAY, Integer)
+
+def _fetch_rows(db, stmt):
+    """Run a select and get the raw driver rows, skipping result processing"""
+    result = db.connection().execute(stmt)
+    rows = result.cursor.fetchall()
+    result.close()
+    return rows
+
+def _extend_cumsum(cum, values, start):
+    """Recompute a running sum from `start` on"""
+    base = cum[start - 1] if start else 0
+    cum[start:] = base + np.cumsum(values[start:], axis=0)
+
+def _window_sum(cum, end, window):
+    """Sum of the `window` days ending at each index in `end`, from a running sum"""
+    lower = end - window
+    return cum[end] - np.where(lower >= 0, cum[np.maximum(lower, 0)], 0)
+
+class RollingAnalytics:
+    """Incrementally maintained daily series for one database"""
+
+    def __init__(self):
+        self._changes_seen = None  # last day_changes id read, None before the first refresh
+        self._reset(None)
+
+    def _reset(self, start):
+        self.start = start                   # date of index 0
+        self.daily = np.zeros((0, 4))        # WORKOUTS, BURNED, MEALS, CONSUMED
+        self.weight = np.zeros(0)            # NaN on days without a measurement
+        self.types = []                      # columns of `volume`
+        self.volume = np.zeros((0, 0))       # workout minutes per day and type
+
+        self._daily_cum = np.zeros((0, 4))
+        self._meal_days_cum = np.zeros(0)
+        self._last_rest = np.zeros(0, dtype=np.int64)
+        self._weight_cum = np.zeros(0)
+
+    def __len__(self):
+        return len(self.daily)
+
+    def day_index(self, day):
+        return (day - self.start).days
+
+    def refresh(self, db, today):
+        """Bring the series up to date with the database, returning the first
+        recomputed day index (None when nothing changed)"""
+        # The change log and the rows it points to, as of one snapshot
+        archive.begin_snapshot(db)
+        oldest, newest = db.execute(select(func.min(DayChange.id), func.max(DayChange.id))).one()
+        if self._changes_seen is None or (oldest is not None and oldest > self._changes_seen + 1):
+            # First refresh, or the log was pruned past what was read last
+            return self._rebuild(db, today, newest)
+
+        changed_from = None
+        if newest is not None and newest > self._changes_seen:
+            changed_from = db.execute(select(func.min(DayChange.date)).where(
+                DayChange.id > self._changes_seen
+            )).scalar()
+            self._changes_seen = newest
+        if changed_from is not None and changed_from < self.start:
+            return self._rebuild(db, today, newest)
+
+        last = self.day_index(today)
+        if changed_from is None:
+            if last < len(self):
+                return None
+            dirty = len(self)
+        else:
+            dirty = min(self.day_index(changed_from), len(self))
+        self._load(*self._read(db, self.start + timedelta(days=dirty)), dirty, last)
+        self._recompute(db, dirty)
+        return dirty
+
+    def _rebuild(self, db, today, newest):
+        """Read the whole history again"""
+        self._changes_seen = newest or 0
+        rows, weights = self._read(db)
+        first_days = [int(r[0, 0]) for r in (rows, weights) if len(r)]
+        self._reset(EPOCH + timedelta(days=min(first_days, default=(today - EPOCH).days)))
+        self._load(rows, weights, 0, self.day_index(today))
+        self._recompute(db, 0)
+        return 0
+
+    def _read(self, db, from_date=None):
+        """Get the per-day rows and the weights from `from_date` on, with days since EPOCH"""
+        rows = select(
+            _epoch_day(DailySummary.date), DailySummary.workout_count,
+            DailySummary.calories_burned, DailySummary.meal_count, DailySummary.calories_consumed,
+        ).order_by(DailySummary.date)
+        weights = select(
+            _epoch_day(BodyMeasurement.date), BodyMeasurement.weight
+        ).order_by(BodyMeasurement.date)
+        if from_date is not None:
+            rows = rows.where(DailySummary.date >= from_date)
+            weights = weights.where(BodyMeasurement.date >= from_date)
+        return (
+            np.array(_fetch_rows(db, rows), dtype=np.float64).reshape(-1, 5),
+            np.array(_fetch_rows(db, weights), dtype=np.float64).reshape(-1, 2),
+        )
+
+    def _load(self, rows, weights, dirty, last):
+        """Replace the series from index `dirty` on with the rows read from
+        there, extending them to index `last` at least"""
+        offset = (self.start - EPOCH).days
+        last_days = [int(r[-1, 0]) - offset for r in (rows, weights) if len(r)]
+        n = max(last_days + [last, dirty - 1]) + 1
+        daily = np.zeros((n, 4))
+        weight = np.full(n, np.nan)
+        daily[:dirty] = self.daily[:dirty]
+        weight[:dirty] = self.weight[:dirty]
+        daily[rows[:, 0].astype(np.int64) - offset] = rows[:, 1:]
+        weight[weights[:, 0].astype(np.int64) - offset] = weights[:, 1]
+        self.daily, self.weight = daily, weight
+
+    def _recompute(self, db, dirty):
+        n = len(self.daily)
+        for name in ("_daily_cum", "_meal_days_cum", "_last_rest", "_weight_cum"):
+            old = getattr(self, name)
+            grown = np.zeros((n,) + old.shape[1:], dtype=old.dtype)
+            grown[:min(len(old), n)] = old[:n]
+            setattr(self, name, grown)
+
+        _extend_cumsum(self._daily_cum, self.daily, dirty)
+        _extend_cumsum(self._meal_days_cum, (self.daily[:, MEALS] > 0).astype(np.float64), dirty)
+
+        # Index of the latest day without a workout, up to each day
+        index = np.arange(dirty, n)
+        rest = np.where(self.daily[dirty:, WORKOUTS] > 0, -1, index)
+        seed = self._last_rest[dirty - 1] if dirty else -1
+        self._last_rest[dirty:] = np.maximum.accumulate(np.maximum(rest, seed))
+
+        self._recompute_weight(dirty)
+        self._recompute_volume(db, dirty)
+
+    def _recompute_weight(self, dirty):
+        # Days between measurements are interpolated linearly, so the first
+        # affected day is the last measurement before `dirty`
+        measured = np.flatnonzero(~np.isnan(self.weight))
+        if not measured.size:
+            self._weight_cum[:] = 0
+            return
+        earlier = measured[measured < dirty]
+        start = int(earlier[-1]) if earlier.size else 0
+        days = np.arange(start, len(self.weight))
+        known = measured[measured >= start]
+        interpolated = np.interp(days, known, self.weight[known])
+        # Before the first measurement there is nothing to trend
+        interpolated[days < measured[0]] = 0
+        base = self._weight_cum[start - 1] if start else 0
+        self._weight_cum[start:] = base + np.cumsum(interpolated)
+
+    def _recompute_volume(self, db, dirty):
+        n = len(self.daily)
+        from_date = self.start + timedelta(days=dirty)
+        archive.begin_snapshot(db)
+        rows = _fetch_rows(db, select(
+            _epoch_day(Workout.date), Workout.exercise_type, func.sum(Workout.duration)
+        ).where(Workout.date >= from_date).group_by(Workout.date, Workout.exercise_type))
+        rows += [
+            ((date.fromisoformat(day) - EPOCH).days, exercise_type, minutes)
+            for day, exercise_type, _, minutes in archive.sum_by(
+                db, "workouts", ["date", "exercise_type"], ["duration"], start_date=from_date
+            )
+        ]
+
+        days, types, minutes = zip(*rows) if rows else ((), (), ())
+        names, type_index = np.unique(np.array(types, dtype=object), return_inverse=True)
+        for exercise_type in names:
+            if exercise_type not in self.types:
+                self.types.append(exercise_type)
+        columns = np.array([self.types.index(name) for name in names], dtype=np.int64)[type_index]
+
+        volume = np.zeros((n, len(self.types)))
+        keep = min(dirty, len(self.volume))
+        volume[:keep, :self.volume.shape[1]] = self.volume[:keep]
+        offset = (self.start - EPOCH).days
+        # Added up: a day's workouts can be both archived and logged since
+        np.add.at(volume, (np.array(days, dtype=np.int64) - offset, columns),
+                  np.array(minutes, dtype=np.float64))
+        self.volume = volume
+
+    def _day(self, day):
+        return min(max(self.day_index(day), 0), len(self) - 1)
+
+    def streaks(self, today):
+        """Get (current, longest) runs of consecutive workout days
+
+        A streak still counts as current when today has no workout yet.
+        """
+        if not len(self):
+            return 0, 0
+        runs = np.arange(len(self)) - self._last_rest
+        index = self._day(today)
+        current = runs[index]
+        if not current and index:
+            current = runs[index - 1]
+        return int(current), int(runs.max())
+
+    def daily_frame(self, today, days=90):
+        """Get the last `days` days of intake, burn, balance and trends"""
+        import pandas as pd
+        end = self._day(today)
+        index = np.arange(max(end - days + 1, 0), end + 1)
+        frame = pd.DataFrame({
+            'Date': pd.to_datetime(self.start) + pd.to_timedelta(index, unit="D"),
+            'Calories In': self.daily[index, CONSUMED],
+            'Calories Out': self.daily[index, BURNED],
+        })
+        frame['Net Balance'] = frame['Calories In'] - frame['Calories Out']
+        for window in WINDOWS:
+            consumed = _window_sum(self._daily_cum[:, CONSUMED], index, window)
+            meal_days = _window_sum(self._meal_days_cum, index, window)
+            burned = _window_sum(self._daily_cum[:, BURNED], index, window)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                # Intake averages over the days something was logged
+                frame[f'In ({window}d avg)'] = np.where(meal_days > 0, consumed / meal_days, np.nan)
+            frame[f'Out ({window}d avg)'] = burned / np.minimum(index + 1, window)
+
+        measured = np.flatnonzero(~np.isnan(self.weight))
+        if measured.size:
+            window = np.minimum(index - measured[0] + 1, WEIGHT_SMOOTHING_DAYS)
+            trend = _window_sum(self._weight_cum, index, WEIGHT_SMOOTHING_DAYS) / np.maximum(window, 1)
+            frame['Weight Trend'] = np.where(index >= measured[0], trend, np.nan)
+        else:
+            frame['Weight Trend'] = np.nan
+        return frame
+
+    def weekly_volume(self, today, weeks=12):
+        """Get workout minutes per exercise type for the last `weeks` weeks
+
+        Weeks start on Monday. Returns a long-format DataFrame with Week,
+        Exercise and Minutes columns.
+        """
+        import pandas as pd
+        if not self.types:
+            return pd.DataFrame(columns=['Week', 'Exercise', 'Minutes'])
+        end = self._day(today)
+        monday = end - today.weekday()
+        first = monday - 7 * (weeks - 1)
+        index = np.arange(first, monday + 7)
+        in_range = (index >= 0) & (index <= end)
+        minutes = np.where(in_range[:, None], self.volume[np.clip(index, 0, len(self) - 1)], 0)
+        totals = minutes.reshape(weeks, 7, len(self.types)).sum(axis=1)
+        week_starts = pd.to_datetime(self.start) + pd.to_timedelta(index[::7], unit="D")
+        frame = pd.DataFrame(totals, columns=self.types)
+        frame.insert(0, 'Week', week_starts)
+        frame = frame.melt(id_vars='Week', var_name='Exercise', value_name='Minutes')
+        return frame[frame['Minutes'] > 0].reset_index(drop=True)
@@ -1,11 +1,23 @@
+import os
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
-from database import init_db, get_db
-from models import Workout, Meal, BodyMeasurement
+from database import activate, current_engine, init_db
+from models import calculate_bmi
+from changes import change_feed
+import archive
+import bulk
+import catalog
+import exporter
+import importer
+import instrumentation
+import queries
+import shards
+import thumbnails
+import writer
+from timeseries import choose_bucket
+
+# pandas and plotly are imported inside the views that draw tables and
+# charts, so a process whose first session lands elsewhere starts faster
 
 st.set_page_config(
     page_title="Health & Fitness Tracker",
@@ -14,60 +26,112 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-init_db()
+show_query_panel = st.sidebar.toggle("🛠️ SQL query panel", key="sql_panel")
+query_log = instrumentation.start_recording() if show_query_panel else None
+
+@st.cache_resource(show_spinner=False)
+def prepare_database():
+    """Create or migrate the schema, once per server process"""
+    init_db()
+
+def use_database():
+    """Point this run at the signed-in user's database, or the shared one"""
+    if shards.shard_pool:
+        # Every signed-in user reads and writes their own database
+        user = st.experimental_user.email
+        if not user:
+            st.error("🔒 Please sign in to use the tracker.")
+            st.stop()
+        activate(shards.shard_pool.engine(user))
+    else:
+        prepare_database()
+
+with instrumentation.section("startup"):
+    use_database()
+
+# Seconds a rerun waits for this session's queued writes before reading
+WRITE_TIMEOUT = 30
 
-col_hero1, col_hero2, col_hero3 = st.columns(3)
-with col_hero1:
-    st.image("attached_assets/stock_images/fitness_gym_workout__79603433.jpg", use_container_width=True)
-with col_hero2:
-    st.image("attached_assets/stock_images/fitness_gym_workout__a2b68091.jpg", use_container_width=True)
-with col_hero3:
-    st.image("attached_assets/stock_images/fitness_gym_workout__6292474c.jpg", use_container_width=True)
+def queue_write(future, message):
+    """Remember a queued write; the next rerun waits for it and reports it"""
+    st.session_state.setdefault("pending_writes", []).append((future, message))
+
+def settle_writes():
+    """Wait for this session's queued writes, so its reads include them"""
+    pending = st.session_state.pop("pending_writes", [])
+    for future, message in pending:
+        try:
+            future.result(timeout=WRITE_TIMEOUT)
+        except TimeoutError:
+            st.warning("⏳ Still saving your changes, they will show up shortly.")
+            st.session_state.setdefault("pending_writes", []).append((future, message))
+        except Exception as exc:
+            st.error(f"❌ Could not save your change: {exc}")
+        else:
+            st.toast(message)
+
+settle_writes()
+change_feed.sync()
+
+HERO_IMAGES = [
+    "attached_assets/stock_images/fitness_gym_workout__79603433.jpg",
+    "attached_assets/stock_images/fitness_gym_workout__a2b68091.jpg",
+    "attached_assets/stock_images/fitness_gym_workout__6292474c.jpg",
+]
+
+@st.cache_data(show_spinner=False)
+def hero_thumbnail(path, modified):
+    """Resized hero image; `modified` keys out the copy of a replaced file"""
+    return thumbnails.thumbnail(path)
+
+for col_hero, hero_path in zip(st.columns(3), HERO_IMAGES):
+    with col_hero:
+        if os.path.exists(hero_path):
+            st.image(hero_thumbnail(hero_path, os.path.getmtime(hero_path)), use_container_width=True)
 
 st.markdown("<h1 style='text-align: center; color: #FF4B4B; font-size: 3.5rem;'>💪 FITNESS TRACKER PRO</h1>", unsafe_allow_html=True)
 st.markdown("<p style='text-align: center; font-size: 1.2rem; color: #FAFAFA; margin-bottom: 2rem;'>Transform Your Body, Track Your Progress, Achieve Your Goals</p>", unsafe_allow_html=True)
 st.markdown("---")
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
+# Only the selected view runs on a rerun; st.tabs would execute all five
+VIEW_NAMES = [
     "📊 Dashboard", 
     "🏋️ Log Workout", 
     "🍎 Log Meal", 
     "📏 Body Measurements",
-    "📈 Activity History"
-])
-
-def calculate_bmi(weight, height):
-    """Calculate BMI from weight (kg) and height (cm)"""
-    if height > 0:
-        height_m = height / 100
-        return round(weight / (height_m ** 2), 2)
-    return None
+    "📈 Activity History",
+    "🗂️ Data",
+    "🧹 Bulk Edit"
+]
+active_view = st.radio(
+    "View",
+    VIEW_NAMES,
+    horizontal=True,
+    key="active_view",
+    label_visibility="collapsed"
+)
 
-with tab1:
-    st.header("Your Health Dashboard")
+def render_dashboard():
+    """Dashboard metrics, 30-day activity, weight trend and rolling trends"""
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
     
-    db = get_db()
+    st.header("Your Health Dashboard")
     
     col1, col2, col3, col4 = st.columns(4)
     
     today = date.today()
     week_ago = today - timedelta(days=7)
     
-    total_workouts = db.query(Workout).count()
-    workouts_this_week = db.query(Workout).filter(Workout.date >= week_ago).count()
-    
-    total_calories_burned = db.query(func.sum(Workout.calories_burned)).scalar() or 0
-    calories_this_week = db.query(func.sum(Workout.calories_burned)).filter(
-        Workout.date >= week_ago
-    ).scalar() or 0
+    totals = queries.get_dashboard_totals(today, week_ago)
+    total_workouts = totals["total_workouts"]
+    workouts_this_week = totals["workouts_this_week"]
+    total_calories_burned = totals["total_calories_burned"]
+    calories_this_week = totals["calories_this_week"]
+    calories_consumed_today = totals["calories_consumed_today"]
     
-    latest_weight = db.query(BodyMeasurement).order_by(
-        BodyMeasurement.date.desc()
-    ).first()
-    
-    calories_consumed_today = db.query(func.sum(Meal.calories)).filter(
-        Meal.date == today
-    ).scalar() or 0
+    latest_weight = queries.get_latest_measurement()
     
     with col1:
         st.metric("Total Workouts", total_workouts, f"+{workouts_this_week} this week")
@@ -93,23 +157,9 @@ with tab1:
         st.subheader("Workout Activity (Last 30 Days)")
         
         thirty_days_ago = today - timedelta(days=30)
-        workouts_30d = db.query(Workout).filter(
-            Workout.date >= thirty_days_ago
-        ).order_by(Workout.date).all()
+        workout_summary = queries.get_workout_activity(thirty_days_ago)
         
-        if workouts_30d:
-            workout_df = pd.DataFrame([{
-                'Date': w.date,
-                'Exercise': w.exercise_type,
-                'Duration': w.duration,
-                'Calories': w.calories_burned
-            } for w in workouts_30d])
-            
-            workout_summary = workout_df.groupby('Date').agg({
-                'Duration': 'sum',
-                'Calories': 'sum'
-            }).reset_index()
-            
+        if not workout_summary.empty:
             fig = px.bar(workout_summary, x='Date', y='Calories',
                         title='Calories Burned per Day',
                         labels={'Calories': 'Calories Burned'})
@@ -120,17 +170,9 @@ with tab1:
     with col_chart2:
         st.subheader("Weight Trend")
         
-        measurements = db.query(BodyMeasurement).order_by(
-            BodyMeasurement.date
-        ).all()
+        meas_df = queries.get_weight_trend()
         
-        if measurements:
-            meas_df = pd.DataFrame([{
-                'Date': m.date,
-                'Weight': m.weight,
-                'BMI': m.bmi
-            } for m in measurements])
-            
+        if not meas_df.empty:
             fig = go.Figure()
             fig.add_trace(go.Scatter(
                 x=meas_df['Date'], 
@@ -152,9 +194,7 @@ with tab1:
     st.markdown("---")
     st.subheader("Daily Calorie Balance")
     
-    calories_burned_today = db.query(func.sum(Workout.calories_burned)).filter(
-        Workout.date == today
-    ).scalar() or 0
+    calories_burned_today = totals["calories_burned_today"]
     
     net_calories = calories_consumed_today - calories_burned_today
     
@@ -167,9 +207,49 @@ with tab1:
         st.metric("Net", f"{net_calories} cal", 
                  "Surplus" if net_calories > 0 else "Deficit")
     
-    db.close()
+    st.markdown("---")
+    st.subheader("Trends")
+    
+    trends = queries.get_rolling_analytics(today)
+    daily = trends["daily"]
+    latest = daily.iloc[-1]
+    
+    def per_day(value):
+        return "No data" if pd.isna(value) else f"{value:.0f} cal"
+    
+    col_trend1, col_trend2, col_trend3, col_trend4 = st.columns(4)
+    with col_trend1:
+        st.metric("Intake (7-day avg)", per_day(latest['In (7d avg)']),
+                 f"30-day: {per_day(latest['In (30d avg)'])}", delta_color="off")
+    with col_trend2:
+        st.metric("Burned (7-day avg)", per_day(latest['Out (7d avg)']),
+                 f"30-day: {per_day(latest['Out (30d avg)'])}", delta_color="off")
+    with col_trend3:
+        st.metric("Workout Streak", f"{trends['current_streak']} days",
+                 f"Best: {trends['longest_streak']} days", delta_color="off")
+    with col_trend4:
+        if pd.isna(latest['Weight Trend']):
+            st.metric("Weight Trend", "No data")
+        else:
+            st.metric("Weight Trend", f"{latest['Weight Trend']:.1f} kg", "7-day smoothed", delta_color="off")
+    
+    col_chart3, col_chart4 = st.columns(2)
+    with col_chart3:
+        fig = px.line(daily, x='Date',
+                     y=['In (7d avg)', 'In (30d avg)', 'Out (7d avg)', 'Out (30d avg)'],
+                     title='Calories In and Out (Moving Averages)',
+                     labels={'value': 'Calories', 'variable': ''})
+        st.plotly_chart(fig, use_container_width=True)
+    with col_chart4:
+        if not trends["weekly_volume"].empty:
+            fig = px.bar(trends["weekly_volume"], x='Week', y='Minutes', color='Exercise',
+                        title='Weekly Training Volume')
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No workouts in the last 12 weeks.")
 
-with tab2:
+def render_log_workout():
+    """Workout form and recent workouts"""
     st.header("🏋️ Log Your Workout")
     
     with st.form("workout_form"):
@@ -193,27 +273,19 @@ with tab2:
         submitted = st.form_submit_button("Log Workout", type="primary")
         
         if submitted:
-            db = get_db()
-            new_workout = Workout(
+            queue_write(writer.add_workout(
                 date=workout_date,
                 exercise_type=exercise_type,
                 duration=duration,
                 calories_burned=calories_burned,
                 notes=notes if notes else None
-            )
-            db.add(new_workout)
-            db.commit()
-            db.close()
-            st.success(f"✅ Logged {exercise_type} workout for {duration} minutes!")
+            ), f"✅ Logged {exercise_type} workout for {duration} minutes!")
             st.rerun()
     
     st.markdown("---")
     st.subheader("Recent Workouts")
     
-    db = get_db()
-    recent_workouts = db.query(Workout).order_by(
-        Workout.date.desc()
-    ).limit(5).all()
+    recent_workouts = queries.get_recent_workouts(5)
     
     if recent_workouts:
         for workout in recent_workouts:
@@ -226,22 +298,67 @@ with tab2:
                 with col3:
                     st.write(f"⏱️ {workout.duration} min | 🔥 {workout.calories_burned} cal")
                 with col4:
-                    if st.button("🗑️", key=f"del_workout_{workout.id}"):
-                        db.delete(workout)
-                        db.commit()
-                        db.close()
+                    archived = archive.is_archived(workout)
+                    if st.button("🗑️", key=f"del_workout_{workout.id}", disabled=archived,
+                                 help="Archived months are read-only" if archived else None):
+                        queue_write(writer.delete_workout(workout), f"🗑️ Deleted {workout.exercise_type} workout")
                         st.rerun()
                 if workout.notes:
                     st.caption(f"📝 {workout.notes}")
                 st.markdown("---")
     else:
         st.info("No workouts logged yet. Start logging your first workout above!")
-    
-    db.close()
 
-with tab3:
+def recent_foods():
+    """This session's recently used foods, primed from the latest meals"""
+    if "recent_foods" not in st.session_state:
+        recent = catalog.RecentFoods()
+        for food in reversed(catalog.recent_foods(bind=current_engine())):
+            recent.add(food)
+        st.session_state["recent_foods"] = recent
+    return st.session_state["recent_foods"]
+
+def prefill_meal():
+    """Copy the picked food's name and nutrition into the meal form"""
+    food = st.session_state.get("food_pick")
+    if food is None:
+        return
+    recent_foods().add(food)
+    st.session_state["meal_food_name"] = food.name
+    st.session_state["meal_calories"] = food.calories
+    st.session_state["meal_protein"] = food.protein or 0.0
+    st.session_state["meal_carbs"] = food.carbs or 0.0
+    st.session_state["meal_fats"] = food.fats or 0.0
+    st.session_state["food_pick"] = None
+
+def render_log_meal():
+    """Meal form with food autocomplete, and today's meals"""
     st.header("🍎 Log Your Meals")
     
+    # Form fields are prefilled through their session state keys
+    for key, default in [("meal_food_name", ""), ("meal_calories", 300),
+                         ("meal_protein", 0.0), ("meal_carbs", 0.0), ("meal_fats", 0.0)]:
+        st.session_state.setdefault(key, default)
+    
+    recent = recent_foods()
+    col1, col2 = st.columns(2)
+    with col1:
+        food_query = st.text_input(
+            "🔎 Find a food",
+            placeholder="Start typing, e.g. chicken",
+            key="food_query"
+        )
+    with col2:
+        st.selectbox(
+            "Suggestions" if food_query.strip() else "Recent foods",
+            catalog.suggest(food_query, recent, bind=current_engine()),
+            index=None,
+            format_func=lambda food: f"{food.name} · {food.calories} cal",
+            placeholder="Pick a food to fill in the form",
+            key="food_pick",
+            on_change=prefill_meal
+        )
+    
     with st.form("meal_form"):
         col1, col2 = st.columns(2)
         
@@ -251,20 +368,24 @@ with tab3:
                 "Meal Type",
                 ["Breakfast", "Lunch", "Dinner", "Snack"]
             )
-            food_name = st.text_input("Food/Meal Name", placeholder="e.g., Grilled Chicken Salad")
+            food_name = st.text_input("Food/Meal Name", placeholder="e.g., Grilled Chicken Salad",
+                                      key="meal_food_name")
         
         with col2:
-            calories = st.number_input("Calories", min_value=0, value=300)
-            protein = st.number_input("Protein (g)", min_value=0.0, value=0.0, step=0.1)
-            carbs = st.number_input("Carbs (g)", min_value=0.0, value=0.0, step=0.1)
-            fats = st.number_input("Fats (g)", min_value=0.0, value=0.0, step=0.1)
+            calories = st.number_input("Calories", min_value=0, key="meal_calories")
+            protein = st.number_input("Protein (g)", min_value=0.0, step=0.1, key="meal_protein")
+            carbs = st.number_input("Carbs (g)", min_value=0.0, step=0.1, key="meal_carbs")
+            fats = st.number_input("Fats (g)", min_value=0.0, step=0.1, key="meal_fats")
         
         submitted_meal = st.form_submit_button("Log Meal", type="primary")
         
         if submitted_meal:
             if food_name:
-                db = get_db()
-                new_meal = Meal(
+                recent.add(catalog.FoodFacts(
+                    food_name.strip(), calories,
+                    protein or None, carbs or None, fats or None
+                ))
+                queue_write(writer.add_meal(
                     date=meal_date,
                     meal_type=meal_type,
                     food_name=food_name,
@@ -272,11 +393,7 @@ with tab3:
                     protein=protein if protein > 0 else None,
                     carbs=carbs if carbs > 0 else None,
                     fats=fats if fats > 0 else None
-                )
-                db.add(new_meal)
-                db.commit()
-                db.close()
-                st.success(f"✅ Logged {food_name} ({calories} cal)")
+                ), f"✅ Logged {food_name} ({calories} cal)")
                 st.rerun()
             else:
                 st.error("Please enter a food/meal name")
@@ -284,16 +401,14 @@ with tab3:
     st.markdown("---")
     st.subheader("Today's Meals")
     
-    db = get_db()
-    today_meals = db.query(Meal).filter(
-        Meal.date == date.today()
-    ).order_by(Meal.created_at).all()
+    today_meals = queries.get_meals_on(date.today())
     
     if today_meals:
-        total_cal = sum(m.calories for m in today_meals)
-        total_protein = sum(m.protein or 0 for m in today_meals)
-        total_carbs = sum(m.carbs or 0 for m in today_meals)
-        total_fats = sum(m.fats or 0 for m in today_meals)
+        macros_today = queries.get_meal_macros(date.today())
+        total_cal = macros_today["calories"]
+        total_protein = macros_today["protein"]
+        total_carbs = macros_today["carbs"]
+        total_fats = macros_today["fats"]
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -321,17 +436,16 @@ with tab3:
                     st.write(macros)
                 with col4:
                     if st.button("🗑️", key=f"del_meal_{meal.id}"):
-                        db.delete(meal)
-                        db.commit()
-                        db.close()
+                        queue_write(writer.delete_meal(meal), f"🗑️ Deleted {meal.food_name}")
                         st.rerun()
                 st.markdown("---")
     else:
         st.info("No meals logged today. Start tracking your nutrition!")
-    
-    db.close()
 
-with tab4:
+def render_body_measurements():
+    """Measurement form and history"""
+    import pandas as pd
+    
     st.header("📏 Track Body Measurements")
     
     with st.form("measurement_form"):
@@ -351,43 +465,20 @@ with tab4:
         if submitted_meas:
             bmi = calculate_bmi(weight, height)
             
-            db = get_db()
-            
-            existing = db.query(BodyMeasurement).filter(
-                BodyMeasurement.date == meas_date
-            ).first()
-            
-            if existing:
-                existing.weight = weight
-                existing.height = height
-                existing.bmi = bmi
-                existing.body_fat_percentage = body_fat if body_fat > 0 else None
-                existing.notes = notes_meas if notes_meas else None
-                message = "✅ Updated measurement"
-            else:
-                new_measurement = BodyMeasurement(
-                    date=meas_date,
-                    weight=weight,
-                    height=height,
-                    bmi=bmi,
-                    body_fat_percentage=body_fat if body_fat > 0 else None,
-                    notes=notes_meas if notes_meas else None
-                )
-                db.add(new_measurement)
-                message = f"✅ Saved measurement - BMI: {bmi}"
-            
-            db.commit()
-            db.close()
-            st.success(message)
+            queue_write(writer.save_measurement(
+                date=meas_date,
+                weight=weight,
+                height=height,
+                bmi=bmi,
+                body_fat_percentage=body_fat if body_fat > 0 else None,
+                notes=notes_meas if notes_meas else None
+            ), f"✅ Saved measurement - BMI: {bmi}")
             st.rerun()
     
     st.markdown("---")
     st.subheader("Measurement History")
     
-    db = get_db()
-    measurements = db.query(BodyMeasurement).order_by(
-        BodyMeasurement.date.desc()
-    ).limit(10).all()
+    measurements = queries.get_measurement_history(10)
     
     if measurements:
         meas_data = []
@@ -413,13 +504,53 @@ with tab4:
                 st.info("➡️ Your weight has remained stable")
     else:
         st.info("No measurements recorded yet. Add your first measurement above!")
+
+HISTORY_PAGE_SIZES = [25, 50, 100, 250]
+
+def render_history_table(name, fetch_page, start_date, end_date, total_rows):
+    """One page of a history table, with page size, sort and paging controls"""
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("Rows per page", HISTORY_PAGE_SIZES, index=1, key=f"{name}_page_size")
+    with col2:
+        sort = st.selectbox("Sort", ["Newest first", "Oldest first"], key=f"{name}_sort")
+    descending = sort == "Newest first"
+    
+    # (date, id) where each visited page starts, restarted when the range or
+    # the controls change
+    view = (start_date, end_date, page_size, descending)
+    if st.session_state.get(f"{name}_view") != view:
+        st.session_state[f"{name}_view"] = view
+        st.session_state[f"{name}_cursors"] = [None]
+    cursors = st.session_state[f"{name}_cursors"]
+    
+    page = fetch_page(start_date, end_date, cursors[-1], page_size, descending)
+    st.dataframe(
+        page.drop(columns='id'),
+        use_container_width=True,
+        hide_index=True,
+        column_config={'Date': st.column_config.DateColumn()}
+    )
     
-    db.close()
+    page_count = max(1, -(-total_rows // page_size))
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        if st.button("◀ Previous", key=f"{name}_previous", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors)} of {page_count:,} · {total_rows:,} entries")
+    with col3:
+        if st.button("Next ▶", key=f"{name}_next", disabled=len(cursors) >= page_count or page.empty):
+            last = page.iloc[-1]
+            cursors.append((last['Date'].date(), int(last['id'])))
+            st.rerun()
 
-with tab5:
-    st.header("📈 Activity History & Analytics")
+def render_activity_history():
+    """Workout and nutrition history for a date range"""
+    import plotly.express as px
     
-    db = get_db()
+    st.header("📈 Activity History & Analytics")
     
     date_range = st.date_input(
         "Select Date Range",
@@ -429,40 +560,27 @@ with tab5:
     
     if len(date_range) == 2:
         start_date, end_date = date_range
+        totals = queries.get_range_totals(start_date, end_date)
         
         st.subheader("Workout Summary")
         
-        workouts = db.query(Workout).filter(
-            Workout.date >= start_date,
-            Workout.date <= end_date
-        ).order_by(Workout.date.desc()).all()
-        
-        if workouts:
-            workout_df = pd.DataFrame([{
-                'Date': w.date,
-                'Exercise': w.exercise_type,
-                'Duration (min)': w.duration,
-                'Calories Burned': w.calories_burned,
-                'Notes': w.notes or ''
-            } for w in workouts])
-            
+        if totals["workout_count"]:
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Workouts", len(workouts))
+                st.metric("Total Workouts", totals["workout_count"])
             with col2:
-                st.metric("Total Duration", f"{workout_df['Duration (min)'].sum()} min")
+                st.metric("Total Duration", f"{totals['workout_duration']} min")
             with col3:
-                st.metric("Total Calories", f"{workout_df['Calories Burned'].sum():,}")
+                st.metric("Total Calories", f"{totals['calories_burned']:,}")
             
-            st.dataframe(workout_df, use_container_width=True)
+            render_history_table(
+                "workout_history", queries.get_workout_page,
+                start_date, end_date, totals["workout_count"]
+            )
             
             st.subheader("Exercise Type Breakdown")
-            exercise_summary = workout_df.groupby('Exercise').agg({
-                'Duration (min)': 'sum',
-                'Calories Burned': 'sum'
-            }).reset_index()
-            
-            fig = px.pie(exercise_summary, values='Duration (min)', names='Exercise',
+            by_exercise = queries.get_exercise_breakdown(start_date, end_date)
+            fig = px.pie(by_exercise, values='Duration (min)', names='Exercise',
                         title='Workout Duration by Exercise Type')
             st.plotly_chart(fig, use_container_width=True)
         else:
@@ -471,37 +589,378 @@ with tab5:
         st.markdown("---")
         st.subheader("Nutrition Summary")
         
-        meals = db.query(Meal).filter(
-            Meal.date >= start_date,
-            Meal.date <= end_date
-        ).order_by(Meal.date.desc()).all()
-        
-        if meals:
-            meal_df = pd.DataFrame([{
-                'Date': m.date,
-                'Meal Type': m.meal_type,
-                'Food': m.food_name,
-                'Calories': m.calories,
-                'Protein (g)': m.protein or 0,
-                'Carbs (g)': m.carbs or 0,
-                'Fats (g)': m.fats or 0
-            } for m in meals])
-            
-            daily_cal = meal_df.groupby('Date')['Calories'].sum().reset_index()
-            
-            fig = px.line(daily_cal, x='Date', y='Calories',
-                         title='Daily Calorie Intake',
+        if totals["meal_count"]:
+            bucket = choose_bucket(start_date, end_date)
+            daily_calories = queries.get_calorie_intake(start_date, end_date, bucket)
+            title = 'Daily Calorie Intake'
+            if bucket != "day":
+                title += f" ({bucket}ly average)"
+            fig = px.line(daily_calories, x='Date', y='Calories',
+                         title=title,
                          markers=True)
             st.plotly_chart(fig, use_container_width=True)
             
-            avg_calories = meal_df['Calories'].sum() / len(daily_cal)
-            st.metric("Average Daily Calories", f"{avg_calories:.0f}")
+            st.metric("Average Daily Calories", f"{totals['calories_consumed'] / totals['meal_days']:.0f}")
             
-            st.dataframe(meal_df, use_container_width=True)
+            render_history_table(
+                "meal_history", queries.get_meal_page,
+                start_date, end_date, totals["meal_count"]
+            )
         else:
             st.info("No meals found in this date range.")
+
+# Larger exports are left to `python exporter.py`: the download button
+# needs the whole file in memory
+MAX_EXPORT_MB = 100
+
+def prepare_export(entity, fmt, start_date, end_date):
+    """Build an export file in memory, or None if it outgrows MAX_EXPORT_MB"""
+    chunks, size = [], 0
+    for chunk in exporter.stream_export(entity, fmt, start_date, end_date, bind=current_engine()):
+        size += len(chunk)
+        if size > MAX_EXPORT_MB * 1e6:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def forget_export():
+    """Drop the prepared export once downloaded"""
+    st.session_state.pop("export_file", None)
+
+def render_data():
+    """Bulk import and export of workout, meal and measurement history"""
+    st.header("🗂️ Your Data")
+    
+    st.subheader("Import")
+    st.caption(
+        "Upload a CSV or JSONL file whose columns match the tracker's fields, e.g. "
+        "`date, exercise_type, duration, calories_burned, notes` for workouts. "
+        "Measurements replace any existing entry on the same date. Foods fill the "
+        "meal form's food search: `name, calories, protein, carbs, fats`."
+    )
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        import_entity = st.selectbox(
+            "Data Type",
+            ["workouts", "meals", "measurements", "foods"],
+            format_func=str.capitalize,
+            key="import_entity"
+        )
+    with col2:
+        uploaded = st.file_uploader(
+            "CSV or JSONL file",
+            type=["csv", "jsonl", "ndjson"],
+            key="import_file"
+        )
+    
+    if uploaded is not None and st.button("Import", type="primary"):
+        status = st.empty()
+        
+        def report(result):
+            status.info(f"⏳ {result.processed:,} rows processed ({result.rows_per_second:,.0f} rows/s)")
+        
+        try:
+            result = importer.import_file(
+                import_entity, uploaded, importer.detect_format(uploaded.name),
+                bind=current_engine(), progress=report
+            )
+        except ValueError as exc:
+            status.error(f"Import failed: {exc}")
+        else:
+            change_feed.sync()
+            status.success(
+                f"✅ Imported {result.inserted:,} {import_entity} in {result.elapsed:.1f}s "
+                f"({result.rows_per_second:,.0f} rows/s)"
+            )
+            if result.rejected:
+                st.warning(f"Skipped {result.rejected:,} invalid rows")
+                for row_number, message in result.errors:
+                    st.caption(f"Row {row_number}: {message}")
+    
+    st.markdown("---")
+    st.subheader("Export")
+    st.caption("Exported files use the same columns as imports, so they can be imported again.")
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        export_entity = st.selectbox(
+            "Data Type",
+            ["workouts", "meals", "measurements"],
+            format_func=str.capitalize,
+            key="export_entity"
+        )
+    with col2:
+        export_format = st.radio("Format", exporter.FORMATS, format_func=str.upper,
+                                 horizontal=True, key="export_format")
+    with col3:
+        limit_range = st.checkbox("Limit to a date range", key="export_limit_range")
+        export_range = st.date_input(
+            "Date Range",
+            value=(date.today() - timedelta(days=365), date.today()),
+            key="export_date_range",
+            disabled=not limit_range
+        )
+    
+    start_date, end_date = None, None
+    if limit_range and len(export_range) == 2:
+        start_date, end_date = export_range
+    
+    # A prepared file is kept only while the choices it was made with are
+    export_request = (export_entity, export_format, start_date, end_date)
+    if st.session_state.get("export_file", (export_request,))[0] != export_request:
+        forget_export()
+    
+    if st.button("Prepare Export"):
+        forget_export()
+        try:
+            data = prepare_export(*export_request)
+        except ImportError as exc:
+            st.error(str(exc))
+        else:
+            if data is None:
+                st.error(
+                    f"This export is over {MAX_EXPORT_MB} MB. Pick a shorter date range or run "
+                    f"`python exporter.py {export_entity} {export_entity}.{export_format}`."
+                )
+            else:
+                st.session_state["export_file"] = (export_request, f"{export_entity}.{export_format}", data)
+    
+    if "export_file" in st.session_state:
+        _, file_name, data = st.session_state["export_file"]
+        st.download_button(
+            f"⬇️ Download {file_name} ({len(data) / 1e6:,.1f} MB)",
+            data,
+            file_name=file_name,
+            mime="text/csv" if file_name.endswith(".csv") else "application/octet-stream",
+            key="export_download",
+            on_click=forget_export
+        )
+
+def apply_bulk(selection, action, field, value, bind):
+    """Run the operation set up in the Bulk Edit view"""
+    try:
+        if action == "Delete":
+            changed = bulk.delete_rows(selection, bind)
+            message = f"🗑️ Deleted {changed:,} {selection.entity}"
+        else:
+            changed = bulk.edit_rows(selection, field, bulk.convert(selection.entity, field, value), bind)
+            message = f"✏️ Set {field.replace('_', ' ')} of {changed:,} {selection.entity} to {value}"
+    except ValueError as exc:
+        st.session_state["bulk_outcome"] = (st.error, f"❌ {exc}")
+        return
+    change_feed.sync(bind)
+    st.session_state["bulk_outcome"] = (st.success, message)
+    st.session_state["bulk_confirm"] = False
+
+def undo_bulk(bind):
+    """Revert the newest bulk operation"""
+    operation = bulk.undo_last(bind)
+    change_feed.sync(bind)
+    if operation is not None:
+        st.session_state["bulk_outcome"] = (
+            st.success, f"↩️ Undid {operation.action} of {operation.rows:,} {operation.description}"
+        )
+
+def render_bulk_edit():
+    """Delete or edit many workouts or meals at once, with undo"""
+    import pandas as pd
+    
+    st.header("🧹 Bulk Edit")
+    st.caption(
+        "Pick rows by date range, type or food, check the preview, then delete or edit "
+        "them all at once. The last few operations can be undone."
+    )
+    
+    outcome = st.session_state.pop("bulk_outcome", None)
+    if outcome:
+        show, message = outcome
+        show(message)
+    
+    bind = current_engine()
+    col1, col2, col3 = st.columns([1, 2, 2])
+    with col1:
+        entity = st.radio("Entries", list(bulk.MODELS), format_func=str.capitalize, key="bulk_entity")
+    with col2:
+        date_range = st.date_input(
+            "Date Range",
+            value=(date.today() - timedelta(days=7), date.today()),
+            key="bulk_date_range"
+        )
+    if len(date_range) != 2:
+        st.info("Pick the last day of the range too.")
+        return
+    start_date, end_date = date_range
+    kind_label = "Exercise Type" if entity == "workouts" else "Meal Type"
+    with col3:
+        kind = st.selectbox(
+            kind_label,
+            ["Any", *bulk.kinds(entity, start_date, end_date, bind)],
+            key=f"bulk_kind_{entity}"
+        )
+        food_name = None
+        if entity == "meals":
+            food_name = st.text_input("Food Name", placeholder="Any food", key="bulk_food_name")
+    selection = bulk.Selection(
+        entity, start_date, end_date, None if kind == "Any" else kind, food_name or None
+    )
     
-    db.close()
+    st.subheader("Preview")
+    preview = bulk.preview(selection, bind)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Matching Rows", f"{preview['rows']:,}")
+    with col2:
+        st.metric("Dates", f"{preview['first_date']} to {preview['last_date']}" if preview["rows"] else "-")
+    with col3:
+        calories = preview["totals"]["calories_burned" if entity == "workouts" else "calories"]
+        st.metric("Calories", f"{calories:,}")
+    if preview["by_kind"]:
+        st.dataframe(
+            pd.DataFrame(preview["by_kind"], columns=[kind_label, "Rows"]),
+            hide_index=True,
+            use_container_width=True
+        )
+    if preview["archived"]:
+        st.info(
+            f"🔒 {preview['archived']:,} more matching {entity} are in archived months, "
+            "which are read-only; they stay as they are."
+        )
+    
+    if preview["rows"]:
+        action = st.radio("Action", ["Delete", "Edit a field"], horizontal=True, key="bulk_action")
+        field, value = None, None
+        if action == "Edit a field":
+            col1, col2 = st.columns(2)
+            with col1:
+                field = st.selectbox(
+                    "Field",
+                    bulk.EDITABLE[entity],
+                    format_func=lambda name: name.replace("_", " ").capitalize(),
+                    key=f"bulk_field_{entity}"
+                )
+            with col2:
+                if field == "date":
+                    value = st.date_input("New Value", key="bulk_value_date")
+                else:
+                    value = st.text_input("New Value", key=f"bulk_value_{entity}_{field}")
+        verb = "delete" if action == "Delete" else f"change {field.replace('_', ' ')} of"
+        confirmed = st.checkbox(f"Yes, {verb} {preview['rows']:,} {entity}", key="bulk_confirm")
+        st.button(
+            "Apply",
+            type="primary",
+            disabled=not confirmed,
+            on_click=apply_bulk,
+            args=(selection, action, field, value, bind),
+            key="bulk_apply"
+        )
+    
+    st.markdown("---")
+    st.subheader("Journal")
+    last = bulk.last_undoable(bind)
+    if last is not None:
+        st.button(
+            f"↩️ Undo {last.action} of {last.rows:,} {last.description}",
+            on_click=undo_bulk,
+            args=(bind,),
+            key="bulk_undo"
+        )
+    operations = bulk.journal(bind=bind)
+    if operations:
+        st.dataframe(pd.DataFrame([{
+            'When': operation.created_at.strftime("%Y-%m-%d %H:%M"),
+            'Action': operation.action if operation.action != "edit" else f"set {operation.field} to {operation.value}",
+            'Rows': operation.rows,
+            'Selection': operation.description,
+            'Status': operation.status,
+        } for operation in operations]), hide_index=True, use_container_width=True)
+    else:
+        st.caption("No bulk operations yet.")
+
+VIEWS = dict(zip(VIEW_NAMES, [
+    render_dashboard,
+    render_log_workout,
+    render_log_meal,
+    render_body_measurements,
+    render_activity_history,
+    render_data,
+    render_bulk_edit
+]))
+# What each view shows: an open page reruns when another session or
+# process changes one of these, and only the results reading them are
+# queried again
+VIEW_ENTITIES = dict(zip(VIEW_NAMES, [
+    ("workouts", "meals", "measurements"),
+    ("workouts",),
+    ("meals", "foods"),
+    ("measurements",),
+    ("workouts", "meals"),
+    (),
+    ("workouts", "meals")
+]))
+# Seconds between an open page's checks for changes
+CHANGE_CHECK_SECONDS = 2
+
+@st.fragment(run_every=CHANGE_CHECK_SECONDS)
+def watch_changes(entities):
+    """Rerun the page once what it shows has changed
+    
+    Runs on its own timer without rerunning the page. The database is
+    checked at most once per interval per process however many pages are
+    open, so an idle page costs a comparison of counters.
+    """
+    use_database()
+    change_feed.sync(max_age=CHANGE_CHECK_SECONDS)
+    if change_feed.versions(entities) != st.session_state.get("seen_versions"):
+        st.rerun()
+
+if VIEW_ENTITIES[active_view]:
+    # Recorded after this run's sync and before its reads, so no change
+    # can fall in between
+    st.session_state["seen_versions"] = change_feed.versions(VIEW_ENTITIES[active_view])
+    watch_changes(VIEW_ENTITIES[active_view])
+
+with instrumentation.section(active_view):
+    VIEWS[active_view]()
+
+def render_query_panel(log):
+    """Developer panel with the SQL statements issued by this rerun"""
+    import pandas as pd
+    
+    with st.expander(
+        f"🛠️ SQL this rerun: {len(log.records)} statements in {log.total_ms:.1f} ms",
+        expanded=True
+    ):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Statements", len(log.records))
+        with col2:
+            st.metric("Total Time", f"{log.total_ms:.1f} ms")
+        with col3:
+            st.metric("Rows", f"{log.total_rows:,}")
+        
+        st.dataframe(pd.DataFrame([
+            {'Section': name, 'Statements': count, 'Time (ms)': round(ms, 2)}
+            for name, (count, ms) in log.by_section().items()
+        ]), use_container_width=True)
+        
+        top_n = st.number_input("Slowest statements to show", min_value=1, value=10, key="sql_top_n")
+        st.dataframe(pd.DataFrame([{
+            'Time (ms)': round(record.duration_ms, 2),
+            'Section': record.section,
+            'Rows': record.rows,
+            'Statement': " ".join(record.statement.split())
+        } for record in log.slowest(top_n)]), use_container_width=True)
+        
+        if instrumentation.SLOW_QUERY_MS:
+            st.caption(
+                f"Statements over {instrumentation.SLOW_QUERY_MS:g} ms are appended to "
+                f"{instrumentation.SLOW_QUERY_LOG}"
+            )
+
+if query_log is not None:
+    instrumentation.stop_recording()
+    render_query_panel(query_log)
 
 st.markdown("---")
 st.caption("💪 Health & Fitness Tracker - Track your journey to a healthier you!")
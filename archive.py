@@ -0,0 +1,413 @@
+"""Tiered storage: closed months of workouts and meals kept in Parquet files.
+
+Workouts and meals are the tables that grow without bound. The archival
+job moves every month that ended more than KEEP_MONTHS months ago out of
+SQLite into one Snappy-compressed Parquet file per entity and month, in a
+folder next to the database file:
+
+    fittrack_archive/workouts/2023-04.1.parquet
+
+`archived_months` lists each archived month's file. A month's rows are
+deleted from SQLite, written out and listed in one transaction, so a
+reader that lists the months in the same snapshot as its SQLite query
+(`begin_snapshot`) sees every row exactly once. daily_summary keeps the archived days'
+totals, so the dashboard metrics, range totals and calorie charts never
+open a file. The reads that need raw rows (`read_raw`, `read_rows`,
+`sum_by`) take a date range and open only the months overlapping it.
+
+Rows logged later for an archived month stay in SQLite, where readers
+find them too, until the next run folds them into a new version of the
+month's file. Archived rows are read-only. Body measurements, one row per
+day, stay in SQLite. Reading or writing an archive needs pyarrow.
+
+    python archive.py --keep-months 3
+    python archive.py --list
+    python archive.py --all-shards
+"""
+import argparse
+import functools
+import operator
+import os
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, DateTime, Float, Integer, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database import create_sqlite_engine, engine, init_db
+from models import Workout, Meal, ArchivedMonth
+import shards
+import versions
+
+MODELS = {"workouts": Workout, "meals": Meal}
+ENTITIES = list(MODELS)
+# Months kept in SQLite besides the current one
+KEEP_MONTHS = 3
+# Snappy rather than zstd: a month is a small file, and zstd's per-column
+# decoder setup would dominate reads spanning years of them
+COMPRESSION = "snappy"
+# Seconds a replaced file is kept for readers that listed it before
+GRACE_SECONDS = 3600
+
+def archive_dir(bind=engine):
+    """Get the archive folder of a database: `<name>_archive` next to its file"""
+    database = bind.url.database
+    if not database or database == ":memory:":
+        raise ValueError("Only a database file can have an archive")
+    return os.path.splitext(os.path.abspath(database))[0] + "_archive"
+
+def _engine(db):
+    # A connection knows its engine, a session its bind
+    return db.engine if hasattr(db, "engine") else db.get_bind()
+
+def cutoff(today, keep_months=KEEP_MONTHS):
+    """Get the first day of the oldest month kept in SQLite"""
+    month = today.year * 12 + today.month - 1 - keep_months
+    return date(month // 12, month % 12 + 1, 1)
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+def arrow_schema(entity):
+    """Get the Arrow schema of an entity's archive files: the table's columns"""
+    import pyarrow as pa
+    fields = []
+    for column in MODELS[entity].__table__.columns:
+        if isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=bool(column.nullable)))
+    return pa.schema(fields)
+
+# ---------------------------------------------------------------- reading
+
+def begin_snapshot(db):
+    """Make the next reads on a session or connection share one snapshot
+
+    The sqlite3 module only opens transactions for writes, so each select
+    would see the database as of its own start, and a month archived
+    between a SQLite query and the listing of the files could be missed or
+    read twice. The transaction ends when the session or connection does.
+    """
+    if hasattr(db, "get_bind"):
+        db = db.connection()
+    dbapi_connection = db.connection.driver_connection
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute("BEGIN")
+
+def partitions(db, entity, start_date=None, end_date=None, descending=False):
+    """Get the paths of the archived months of `entity` overlapping a date
+    range, in month order
+
+    `db` is a session or connection; call `begin_snapshot` on it before the
+    SQLite side of a read.
+    """
+    stmt = select(ArchivedMonth.file).where(ArchivedMonth.entity == entity)
+    if start_date is not None:
+        stmt = stmt.where(ArchivedMonth.month >= start_date.replace(day=1))
+    if end_date is not None:
+        stmt = stmt.where(ArchivedMonth.month <= end_date)
+    stmt = stmt.order_by(ArchivedMonth.month.desc() if descending else ArchivedMonth.month)
+    files = db.execute(stmt).scalars().all()
+    if not files:
+        return []
+    folder = os.path.join(archive_dir(_engine(db)), entity)
+    return [os.path.join(folder, file) for file in files]
+
+def _condition(start_date=None, end_date=None, after=None, descending=False):
+    """Arrow filter for a date range continuing after a (date, id) keyset position"""
+    import pyarrow.compute as pc
+    day, row_id = pc.field("date"), pc.field("id")
+    conditions = []
+    if start_date is not None:
+        conditions.append(day >= start_date)
+    if end_date is not None:
+        conditions.append(day <= end_date)
+    if after is not None:
+        after_date, after_id = after
+        if descending:
+            conditions.append((day < after_date) | ((day == after_date) & (row_id < after_id)))
+        else:
+            conditions.append((day > after_date) | ((day == after_date) & (row_id > after_id)))
+    return functools.reduce(operator.and_, conditions) if conditions else None
+
+def _raw(table):
+    """Rows of an Arrow table as tuples, dates as the ISO text SQLite stores"""
+    import pyarrow as pa
+    columns = [
+        column.cast(pa.string()) if pa.types.is_date(column.type) else column
+        for column in table.columns
+    ]
+    # Through NumPy is many times faster than to_pylist, but would turn
+    # missing numbers into NaN
+    return list(zip(*(
+        column.to_pylist() if column.null_count and not pa.types.is_string(column.type)
+        else column.to_numpy(zero_copy_only=False).tolist()
+        for column in columns
+    )))
+
+def _read(path, columns, condition=None):
+    """Read columns of one archive file, keeping the rows that match `condition`"""
+    import pyarrow.parquet as pq
+    # A file is one month in one row group and `partitions` already pruned
+    # by date, so a plain read beats the dataset scanner's per-file setup
+    table = pq.ParquetFile(path).read(columns=columns, use_threads=False)
+    return table.filter(condition) if condition is not None else table
+
+def iter_raw(db, entity, columns, start_date=None, end_date=None, after=None, descending=False,
+             fill=None):
+    """Yield the archived rows of `entity` in a date range a month at a time
+
+    Rows are tuples of `columns` in (date, id) order, as a SQLite cursor
+    gives them (dates as ISO text). `after` is the (date, id) to continue
+    from, as in keyset pagination. `fill` maps columns to a value for
+    missing ones, like SQL's coalesce.
+    """
+    if after is not None:
+        # Months before or beyond the position cannot hold the next rows
+        if descending:
+            end_date = min(end_date, after[0]) if end_date else after[0]
+        else:
+            start_date = max(start_date, after[0]) if start_date else after[0]
+    paths = partitions(db, entity, start_date, end_date, descending)
+    if not paths:
+        return
+    condition = _condition(start_date, end_date, after, descending)
+    order = "descending" if descending else "ascending"
+    for path in paths:
+        table = _read(path, list(dict.fromkeys([*columns, "date", "id"])), condition)
+        if table.num_rows:
+            table = table.sort_by([("date", order), ("id", order)]).select(columns)
+            for name, value in (fill or {}).items():
+                position = columns.index(name)
+                table = table.set_column(position, name, table.column(name).fill_null(value))
+            yield _raw(table)
+
+def read_raw(db, entity, columns, start_date=None, end_date=None, after=None,
+             descending=False, limit=None, fill=None):
+    """Get the archived rows of `iter_raw`, reading months until `limit` rows are found"""
+    rows = []
+    for month in iter_raw(db, entity, columns, start_date, end_date, after, descending, fill):
+        rows.extend(month)
+        if limit is not None and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+_row_types = set()
+
+@functools.lru_cache(maxsize=None)
+def _row_type(columns):
+    row_type = namedtuple("ArchivedRow", columns)
+    _row_types.add(row_type)
+    return row_type
+
+def read_rows(db, entity, columns, start_date=None, end_date=None, descending=False, limit=None):
+    """Get archived rows like query result rows: attribute access, dates as dates"""
+    row_type = _row_type(tuple(columns))
+    position = columns.index("date")
+    rows = []
+    for values in read_raw(db, entity, columns, start_date, end_date, descending=descending, limit=limit):
+        values = list(values)
+        values[position] = date.fromisoformat(values[position])
+        rows.append(row_type(*values))
+    return rows
+
+def is_archived(row):
+    """Whether a row came from `read_rows`; archived rows cannot be changed"""
+    return type(row) in _row_types
+
+def sum_by(db, entity, keys, columns, start_date=None, end_date=None):
+    """Get (*keys, row count, *sums of `columns`) per group of archived rows
+    in a date range
+
+    Dates are ISO text; missing values add nothing.
+    """
+    paths = partitions(db, entity, start_date, end_date)
+    if not paths:
+        return []
+    import pyarrow as pa
+
+    names = list(dict.fromkeys([*keys, *columns, "date"]))
+    # Filtered once, not per file: only the first and last month can hold
+    # rows outside the range anyway
+    table = pa.concat_tables([_read(path, names) for path in paths])
+    condition = _condition(start_date, end_date)
+    if condition is not None:
+        table = table.filter(condition)
+    grouped = table.group_by(keys).aggregate([([], "count_all"), *((name, "sum") for name in columns)])
+    grouped = grouped.select([*keys, "count_all", *(f"{name}_sum" for name in columns)])
+    sums = [
+        column.fill_null(0) if name.endswith("_sum") else column
+        for name, column in zip(grouped.column_names, grouped.columns)
+    ]
+    return _raw(pa.Table.from_arrays(sums, names=grouped.column_names))
+
+# ---------------------------------------------------------------- archiving
+
+def _write_file(table, path):
+    """Write a Parquet file and make sure it is on disk before it is listed"""
+    import pyarrow.parquet as pq
+    with open(path, "wb") as f:
+        pq.write_table(table, f, compression=COMPRESSION)
+        f.flush()
+        os.fsync(f.fileno())
+    folder = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(folder)
+    finally:
+        os.close(folder)
+
+def _next_file(folder, month):
+    # A new name for every version, so readers of the listed one are never
+    # disturbed; unlisted leftovers of earlier runs count too
+    prefix = f"{month:%Y-%m}."
+    numbers = [
+        int(name.split(".")[1]) for name in os.listdir(folder)
+        if name.startswith(prefix) and name.endswith(".parquet")
+    ]
+    return f"{prefix}{max(numbers, default=0) + 1}.parquet"
+
+def archive_month(entity, month, bind=engine):
+    """Move the rows of `entity` dated in `month` (its first day) from SQLite
+    to the month's file, returning how many were moved"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    model = MODELS[entity]
+    folder = os.path.join(archive_dir(bind), entity)
+    os.makedirs(folder, exist_ok=True)
+    schema = arrow_schema(entity)
+    path = None
+    try:
+        with bind.begin() as conn:
+            # The delete takes the write lock first, so no write to the month
+            # can come between taking its rows and listing the file
+            rows = conn.execute(delete(model).where(
+                model.date >= month, model.date < _next_month(month)
+            ).returning(*model.__table__.columns)).all()
+            if not rows:
+                return 0
+            versions.touch(conn, entity)
+            table = pa.Table.from_arrays(
+                [pa.array(values, field.type) for field, values in zip(schema, zip(*rows))],
+                schema=schema
+            )
+            listed = conn.execute(select(ArchivedMonth.file).where(
+                ArchivedMonth.entity == entity, ArchivedMonth.month == month
+            )).scalar()
+            if listed:
+                # Rows logged for the month since it was archived
+                table = pa.concat_tables([pq.read_table(os.path.join(folder, listed), schema=schema), table])
+            table = table.sort_by([("date", "ascending"), ("id", "ascending")])
+
+            file = _next_file(folder, month)
+            path = os.path.join(folder, file)
+            _write_file(table, path)
+            values = {"file": file, "rows": table.num_rows, "archived_at": datetime.utcnow()}
+            conn.execute(insert(ArchivedMonth).values(entity=entity, month=month, **values)
+                         .on_conflict_do_update(index_elements=["entity", "month"], set_=values))
+    except BaseException:
+        if path and os.path.exists(path):
+            os.remove(path)
+        raise
+    return len(rows)
+
+def remove_superseded(bind=engine, entity="workouts", grace=GRACE_SECONDS):
+    """Delete an entity's archive files that are no longer listed and older
+    than `grace` seconds, returning how many"""
+    folder = os.path.join(archive_dir(bind), entity)
+    if not os.path.isdir(folder):
+        return 0
+    with bind.connect() as conn:
+        listed = set(conn.execute(
+            select(ArchivedMonth.file).where(ArchivedMonth.entity == entity)
+        ).scalars())
+    removed = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name not in listed and time.time() - os.path.getmtime(path) > grace:
+            os.remove(path)
+            removed += 1
+    return removed
+
+def archive_months(bind=engine, keep_months=KEEP_MONTHS, today=None, entities=ENTITIES, progress=None):
+    """Archive every month before the current one and the `keep_months` before it
+
+    Returns a list of (entity, month, rows moved); `progress` is called with
+    each of them.
+    """
+    before = cutoff(today or date.today(), keep_months)
+    moved = []
+    for entity in entities:
+        model = MODELS[entity]
+        remove_superseded(bind, entity)
+        with bind.connect() as conn:
+            months = conn.execute(
+                select(func.substr(model.date, 1, 7)).where(model.date < before).distinct()
+            ).scalars().all()
+        for month in sorted(months):
+            month = date.fromisoformat(f"{month}-01")
+            result = (entity, month, archive_month(entity, month, bind))
+            moved.append(result)
+            if progress:
+                progress(result)
+    return moved
+
+def _run(bind, args):
+    init_db(bind)
+    if args.list:
+        with bind.connect() as conn:
+            listed = conn.execute(select(ArchivedMonth).order_by(ArchivedMonth.entity, ArchivedMonth.month)).all()
+        for row in listed:
+            size = os.path.getsize(os.path.join(archive_dir(bind), row.entity, row.file))
+            print(f"{row.entity:<10}{row.month:%Y-%m}{row.rows:>10,} rows{size / 1024:>10,.0f} KB  {row.file}")
+        print(f"📦 {len(listed)} archived months in {archive_dir(bind)}")
+        return 0, 0
+
+    moved = archive_months(bind, args.keep_months, progress=lambda result: print(
+        f"📦 {result[0]} {result[1]:%Y-%m}: {result[2]:,} rows"
+    ))
+    if args.vacuum and moved:
+        with bind.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    return sum(rows for *_, rows in moved), len(moved)
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed months of workouts and meals to Parquet")
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS,
+                        help="months kept in SQLite besides the current one")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: the app's fittrack.db)")
+    parser.add_argument("--all-shards", action="store_true",
+                        help="every user shard in $FITTRACK_SHARD_DIR instead (see shards.py)")
+    parser.add_argument("--list", action="store_true", help="list the archived months instead")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="shrink the database file afterwards (needs a moment without writers)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.all_shards:
+        if not shards.SHARD_DIR:
+            parser.error("--all-shards needs FITTRACK_SHARD_DIR")
+        rows, months, count = 0, 0, 0
+        for path, bind in shards.open_shards():
+            print(f"🗄️ {os.path.relpath(path, shards.SHARD_DIR)}")
+            shard_rows, shard_months = _run(bind, args)
+            rows, months, count = rows + shard_rows, months + shard_months, count + 1
+        where = f" of {count:,} shards"
+    else:
+        rows, months = _run(create_sqlite_engine(args.database) if args.database else engine, args)
+        where = ""
+    if not args.list:
+        print(f"✅ Archived {rows:,} rows from {months} months{where} "
+              f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Performance benchmarks for the fitness tracker, run with `python -m benchmarks.<name>`"""
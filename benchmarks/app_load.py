@@ -0,0 +1,284 @@
+"""Concurrent sessions of app.py: rerun latency, errors and memory as sessions are added
+
+Every session is an AppTest of the real app.py in a thread of its own, all
+in one process the way one Streamlit server serves its browser tabs, so
+they share the engine, query cache, change feed and write queue. A session
+repeats the things people do: switch views, log workouts, meals and
+measurements, delete a workout and pick another date range in the
+activity history, pausing --think seconds on average between actions.
+Each --sessions level runs in a new process on a new copy of one populated
+database, so its peak memory is its own; "MB/session" is what the peak
+grew past one warmed-up session, divided by the sessions.
+
+A rerun fails when it ends with an exception or an st.error message (a
+queued write that failed shows up as one on the next rerun); "locked"
+counts the failures saying "database is locked".
+
+AppTest installs a new mock runtime around every run and polls for its end
+every millisecond; overlapping runs would remove each other's runtime.
+`SessionAppTest` runs every session against one runtime installed for the
+whole test and waits on the run's shutdown event instead.
+
+    python -m benchmarks.app_load --sessions 10 25 50 --seconds 30
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.rerun import APP_PATH, write_placeholder_images
+from benchmarks.shards import build_template
+
+LOCKED = "database is locked"
+# Actions and how often a session picks each
+ACTIONS = {
+    "switch view": 8,
+    "history range": 3,
+    "log workout": 3,
+    "log meal": 3,
+    "save measurement": 2,
+    "delete workout": 1,
+}
+FOODS = ["Oatmeal", "Chicken Salad", "Greek Yogurt", "Salmon Bowl", "Protein Shake"]
+
+class SessionAppTest(AppTest):
+    """AppTest whose runs can overlap with other sessions' runs"""
+
+    script_cache = None
+    config_patch = None
+
+    def _run(self, widget_state=None, timeout=None):
+        from streamlit.runtime.pages_manager import PagesManager
+        from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+        from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+        runner = LocalScriptRunner(
+            self._script_path, self.session_state, PagesManager(self._script_path, setup_watcher=False)
+        )
+        # Compiled once for every session, as a server does
+        runner._script_cache = self.script_cache
+        finished = threading.Event()
+
+        def on_event(sender, event, **kwargs):
+            if event == ScriptRunnerEvent.SHUTDOWN:
+                finished.set()
+
+        runner.on_event.connect(on_event, weak=False)
+        runner.request_rerun(RerunData(widget_states=widget_state, page_script_hash=self._page_hash))
+        runner.start()
+        if not finished.wait(timeout or self.default_timeout):
+            runner.request_stop()
+            raise TimeoutError(f"Rerun still going after {timeout or self.default_timeout}s")
+        self._tree = parse_tree_from_messages(runner.forward_msgs())
+        self._tree._runner = self
+        return self
+
+def install_runtime():
+    """Install the runtime every session's runs share, for the whole process"""
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.util import patch_config_options
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    SessionAppTest.script_cache = ScriptCache()
+    # Kept referenced: a collected patch would undo itself
+    SessionAppTest.config_patch = patch_config_options({"global.appTest": True})
+    SessionAppTest.config_patch.__enter__()
+
+class Session:
+    """One simulated browser tab"""
+
+    def __init__(self, seed, today, timeout):
+        self.at = SessionAppTest(APP_PATH, default_timeout=timeout)
+        self.rng = random.Random(seed)
+        self.today = today
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.failed = 0
+
+    def rerun(self, action, change=None):
+        """Apply a widget change (the first page load without one) and time the rerun"""
+        start = time.perf_counter()
+        try:
+            (change() if change else self.at).run()
+        except Exception as exc:
+            self.failed += 1
+            self.errors[f"{type(exc).__name__}: {exc}"] += 1
+            return
+        self.latencies[action].append((time.perf_counter() - start) * 1000)
+        messages = [str(element.value) for element in [*self.at.exception, *self.at.error]]
+        if messages:
+            self.failed += 1
+            for message in messages:
+                self.errors[message.splitlines()[0][:120]] += 1
+
+    def open(self, view):
+        if self.at.radio(key="active_view").value != view:
+            self.rerun("switch view", lambda: self.at.radio(key="active_view").set_value(view))
+
+    def widget(self, kind, label):
+        return next(widget for widget in getattr(self.at, kind) if widget.label == label)
+
+    def act(self):
+        action = self.rng.choices(list(ACTIONS), list(ACTIONS.values()))[0]
+        rng, at = self.rng, self.at
+        if action == "switch view":
+            views = at.radio(key="active_view").options
+            self.rerun(action, lambda: at.radio(key="active_view").set_value(rng.choice(views)))
+        elif action == "history range":
+            self.open("📈 Activity History")
+            end = self.today - timedelta(days=rng.randrange(365))
+            start = end - timedelta(days=rng.choice([7, 30, 90, 365]))
+            self.rerun(action, lambda: at.date_input(key="history_date_range").set_value((start, end)))
+        elif action == "log workout":
+            self.open("🏋️ Log Workout")
+            self.widget("selectbox", "Exercise Type").set_value(rng.choice(["Running", "Cycling", "Yoga"]))
+            self.widget("number_input", "Duration (minutes)").set_value(rng.randint(15, 90))
+            self.rerun(action, lambda: self.widget("button", "Log Workout").click())
+        elif action == "log meal":
+            self.open("🍎 Log Meal")
+            at.text_input(key="meal_food_name").set_value(rng.choice(FOODS))
+            at.number_input(key="meal_calories").set_value(rng.randint(100, 900))
+            self.rerun(action, lambda: self.widget("button", "Log Meal").click())
+        elif action == "save measurement":
+            self.open("📏 Body Measurements")
+            at.date_input(key="meas_date").set_value(self.today - timedelta(days=rng.randrange(365)))
+            self.widget("number_input", "Weight (kg)").set_value(round(rng.uniform(60, 90), 1))
+            self.rerun(action, lambda: self.widget("button", "Save Measurement").click())
+        else:
+            self.open("🏋️ Log Workout")
+            buttons = [button for button in at.button if button.key and button.key.startswith("del_workout_")
+                       and not button.disabled]
+            if buttons:
+                self.rerun(action, rng.choice(buttons).click)
+
+    def play(self, think, stop):
+        while not stop.is_set():
+            try:
+                self.act()
+            except (KeyError, StopIteration) as exc:
+                # A failed rerun left the page without the widget to use next
+                self.errors[f"skipped, no widget {exc}"] += 1
+            if think:
+                stop.wait(self.rng.expovariate(1 / think))
+
+def _peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _level(template, sessions, seconds, think, timeout, today, results):
+    """Run one level of concurrent sessions in this (new) process"""
+    folder = tempfile.mkdtemp()
+    try:
+        # database.DATABASE_URL is relative to the working directory
+        os.chdir(folder)
+        shutil.copy(template, "fittrack.db")
+        write_placeholder_images(folder)
+        install_runtime()
+
+        warmup = Session(-1, today, timeout)
+        warmup.rerun("page load")
+        baseline = _peak_mb()
+        players = [Session(seed, today, timeout) for seed in range(sessions)]
+        for player in players:
+            player.rerun("page load")
+        stop = threading.Event()
+        threads = [threading.Thread(target=player.play, args=(think, stop)) for player in players]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = defaultdict(list)
+        errors = Counter()
+        for player in players:
+            for action, samples in player.latencies.items():
+                latencies[action].extend(samples)
+            errors.update(player.errors)
+        results.put({
+            "latencies": dict(latencies),
+            "failed": sum(player.failed for player in players),
+            "errors": errors,
+            "elapsed": elapsed,
+            "peak": _peak_mb(),
+            "baseline": baseline,
+        })
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def run(template, sessions, seconds, think, timeout, today):
+    """Run a level in a new process, returning its results"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    worker = context.Process(target=_level, args=(template, sessions, seconds, think, timeout, today, results))
+    worker.start()
+    result = results.get()
+    worker.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--seconds", type=float, default=30, help="duration of each level")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a session's actions")
+    parser.add_argument("--years", type=float, default=2, help="history in the database")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a rerun counts as failed")
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_template(template, today, args.years)
+        print(f"{args.years:g} years of history, {args.seconds:g}s per level, "
+              f"{args.think:g}s mean think time, {os.cpu_count()} CPUs\n")
+        print(f"{'sessions':>8}{'reruns/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'errors':>9}{'locked':>8}{'peak MB':>9}{'MB/session':>12}")
+        by_action = {}
+        for sessions in args.sessions:
+            result = run(template, sessions, args.seconds, args.think, args.timeout, today)
+            samples = sorted(sample for action in result["latencies"].values() for sample in action)
+            reruns = len(samples) + result["failed"]
+            locked = sum(count for message, count in result["errors"].items() if LOCKED in message)
+            print(f"{sessions:>8}{reruns / result['elapsed']:>10.1f}"
+                  f"{statistics.median(samples):>9.0f}{_percentile(samples, 0.95):>9.0f}"
+                  f"{_percentile(samples, 0.99):>9.0f}{result['failed'] / max(reruns, 1):>9.1%}{locked:>8}"
+                  f"{result['peak']:>9,.0f}{(result['peak'] - result['baseline']) / sessions:>12.1f}")
+            for message, count in result["errors"].most_common(3):
+                print(f"{'':>8}  {count}x {message}")
+            by_action[sessions] = {
+                action: _percentile(sorted(values), 0.95) for action, values in result["latencies"].items()
+            }
+
+        print(f"\np95 ms by action\n{'action':<18}" + "".join(f"{sessions:>10}" for sessions in by_action))
+        for action in ["page load", *ACTIONS]:
+            print(f"{action:<18}" + "".join(
+                f"{levels[action]:>10.0f}" if action in levels else f"{'-':>10}" for levels in by_action.values()
+            ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Query latency and file size before and after archiving closed months
+
+Builds a database with the suite's generator, times the suite's units and
+a few deep-history reads with everything in SQLite, then archives all but
+the recent months to Parquet, vacuums, and times them again. Recent views
+should be unaffected or faster; reads reaching into the archive show what
+the merge costs.
+
+    python -m benchmarks.archive --rows 100000 --keep-months 3
+"""
+import argparse
+import os
+import tempfile
+from datetime import date, timedelta
+
+import archive
+import queries
+from benchmarks.suite import UNITS, YEARS, build_database, time_unit
+from database import SessionLocal
+
+def _workout_page_two_years_back(today):
+    start = today - timedelta(days=2 * 365)
+    queries.get_workout_page.uncached(start, start + timedelta(days=30))
+
+def _meal_pages_all_years(today, pages=5):
+    start = today - timedelta(days=YEARS * 366)
+    after = None
+    for _ in range(pages):
+        page = queries.get_meal_page.uncached(start, today, after, descending=False)
+        last = page.iloc[-1]
+        after = (last["Date"].date(), int(last["id"]))
+
+DEEP_UNITS = {
+    "workout_page_2y_back": _workout_page_two_years_back,
+    "meal_pages_oldest_first": _meal_pages_all_years,
+    "breakdown_all_years": lambda today: queries.get_exercise_breakdown.uncached(
+        today - timedelta(days=YEARS * 366), today
+    ),
+    "recent_workouts": lambda today: queries.get_recent_workouts.uncached(5),
+}
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(path) for name in names
+    )
+
+def time_units(today, repeat):
+    return {name: time_unit(unit, today, repeat) for name, unit in {**UNITS, **DEEP_UNITS}.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="workouts and meals generated")
+    parser.add_argument("--keep-months", type=int, default=archive.KEEP_MONTHS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        bind = build_database(path, args.rows, today)
+        SessionLocal.configure(bind=bind)
+        before = time_units(today, args.repeat)
+        db_before = _size(path)
+
+        moved = archive.archive_months(bind, args.keep_months, today)
+        with bind.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        after = time_units(today, args.repeat)
+        bind.dispose()
+
+        rows = sum(count for *_, count in moved)
+        print(f"{args.rows:,} rows, {rows:,} archived from {len(moved)} months "
+              f"(keeping {args.keep_months} + the current)\n")
+        print(f"{'unit':<30}{'before ms':>12}{'after ms':>12}")
+        for name in before:
+            print(f"{name:<30}{before[name]:>12.2f}{after[name]:>12.2f}")
+        print(f"\nSQLite file  {db_before / 1e6:>8.1f} MB -> {_size(path) / 1e6:.1f} MB")
+        print(f"Archive      {_size(archive.archive_dir(bind)) / 1e6:>8.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Food search latency on a large catalog
+
+Builds a temporary database, logs a year of synthetic meals (whose foods
+seed the catalog), then bulk imports synthetic dataset foods through the
+importer, the path a real nutrition dataset takes. Times `catalog.suggest`
+for short, broad and multi-word queries as a user types them.
+
+    python -m benchmarks.catalog --foods 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+import catalog
+from database import create_sqlite_engine, init_db
+from importer import write_columns
+from populate_sample_data import populate
+
+INGREDIENTS = [
+    "chicken", "beef", "pork", "salmon", "tuna", "shrimp", "turkey", "egg", "tofu",
+    "rice", "pasta", "noodles", "bread", "oats", "quinoa", "potato", "beans", "lentils",
+    "apple", "banana", "orange", "grapes", "avocado", "tomato", "carrot", "broccoli",
+    "spinach", "cheese", "yogurt", "milk", "butter", "almonds", "peanut", "chocolate",
+]
+STYLES = [
+    "grilled", "roasted", "fried", "raw", "boiled", "baked", "steamed", "smoked",
+    "dried", "canned", "frozen", "organic", "low fat", "whole", "sliced", "spicy",
+]
+DISHES = ["salad", "soup", "sandwich", "wrap", "bowl", "stir fry", "curry", "pie", "bar", "shake"]
+# Queries as typed, one keystroke at a time after the second
+QUERIES = ["ch", "chi", "chick", "sal", "grilled chi", "oat", "banana br", "brand12", "zucchini"]
+
+def generate_foods(rng, count, chunk=100_000):
+    """Yield schema columns of unique synthetic dataset foods in chunks"""
+    made = 0
+    while made < count:
+        n = min(chunk, count - made)
+        names = [
+            f"{rng.choice(STYLES)} {rng.choice(INGREDIENTS)} {rng.choice(DISHES)}, brand{made + i}"
+            for i in range(n)
+        ]
+        yield [
+            names,
+            [rng.randint(20, 900) for _ in range(n)],
+            [round(rng.uniform(0, 50), 1) for _ in range(n)],
+            [round(rng.uniform(0, 90), 1) for _ in range(n)],
+            [round(rng.uniform(0, 40), 1) for _ in range(n)],
+        ]
+        made += n
+
+def time_suggest(query, bind, recent, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        catalog.suggest(query, recent, bind=bind)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--foods", type=int, default=1_000_000, help="dataset foods to import")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per query")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        bind = create_sqlite_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        init_db(bind)
+        populate(bind, years=1, end=date.today())
+
+        start = time.perf_counter()
+        imported = sum(write_columns("foods", columns, bind) for columns in generate_foods(rng, args.foods))
+        elapsed = time.perf_counter() - start
+        print(f"Imported {imported:,} foods in {elapsed:.1f}s ({imported / elapsed:,.0f} foods/s)\n")
+
+        recent = catalog.RecentFoods()
+        for food in reversed(catalog.recent_foods(bind=bind)):
+            recent.add(food)
+
+        print(f"{'query':<16}{'p50 ms':>10}{'max ms':>10}  top suggestion")
+        for query in QUERIES:
+            p50, worst = time_suggest(query, bind, catalog.RecentFoods(), args.repeat)
+            top = catalog.suggest(query, bind=bind)
+            print(f"{query:<16}{p50:>10.2f}{worst:>10.2f}  {top[0].name if top else '-'}")
+        p50, worst = time_suggest("chick", bind, recent, args.repeat)
+        print(f"{'chick (recent)':<16}{p50:>10.2f}{worst:>10.2f}  recent foods first")
+        bind.dispose()
+
+if __name__ == "__main__":
+    main()
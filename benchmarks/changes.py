@@ -0,0 +1,128 @@
+"""Database load of open pages: timed auto-refresh against change notification
+
+Session threads keep pages open, spread over the dashboard, the body
+measurements and the meal log, while another connection logs a workout
+every --write-every seconds (0: nobody writes). "refresh" reruns every
+page each --interval seconds, the usual auto-refresh workaround; "notify"
+runs the page's change check instead (`watch_changes` in app.py) and reruns
+only pages showing an entity that changed. Statements are counted on the
+app's engine, so cache hits cost nothing.
+
+    python -m benchmarks.changes --sessions 30 --interval 2 --seconds 20
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+import importer
+import queries
+from benchmarks.suite import build_database
+from changes import change_feed
+from database import SessionLocal, create_sqlite_engine
+
+def _dashboard(today):
+    queries.get_dashboard_totals(today, today - timedelta(days=7))
+    queries.get_workout_activity(today - timedelta(days=30))
+    queries.get_weight_trend()
+    queries.get_rolling_analytics(today)
+
+def _measurements(today):
+    queries.get_latest_measurement()
+    queries.get_measurement_history()
+    queries.get_weight_trend()
+
+def _meal_log(today):
+    queries.get_meals_on(today)
+    queries.get_meal_macros(today)
+
+# Page, and the entities it shows as in app.VIEW_ENTITIES
+PAGES = [
+    (_dashboard, ("workouts", "meals", "measurements")),
+    (_measurements, ("measurements",)),
+    (_meal_log, ("meals", "foods")),
+]
+
+def _session(mode, page, entities, interval, today, stop, reruns):
+    change_feed.sync()
+    seen = change_feed.versions(entities)
+    page(today)
+    while not stop.wait(interval):
+        if mode == "refresh":
+            change_feed.sync()
+        else:
+            change_feed.sync(max_age=interval)
+            if change_feed.versions(entities) == seen:
+                continue
+        seen = change_feed.versions(entities)
+        page(today)
+        reruns[page.__name__] += 1
+
+def _log_workouts(bind, every, today, stop):
+    while not stop.wait(every):
+        importer.write_columns(
+            "workouts", [[today.isoformat()], ["Running"], [30], [300], [None]], bind
+        )
+
+def run(mode, bind, writer_bind, sessions, interval, write_every, seconds, today):
+    """Keep the pages open for `seconds`, returning statements and reruns per page"""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(bind, "before_cursor_execute", count)
+    stop = threading.Event()
+    reruns = {page.__name__: 0 for page, _ in PAGES}
+    threads = [
+        threading.Thread(target=_session, args=(
+            mode, *PAGES[number % len(PAGES)], interval, today, stop, reruns
+        ))
+        for number in range(sessions)
+    ]
+    if write_every:
+        threads.append(threading.Thread(target=_log_workouts, args=(writer_bind, write_every, today, stop)))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    event.remove(bind, "before_cursor_execute", count)
+    return statements[0], reruns
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="workouts and meals generated")
+    parser.add_argument("--sessions", type=int, default=30, help="open pages")
+    parser.add_argument("--interval", type=float, default=2, help="seconds between refreshes or checks")
+    parser.add_argument("--write-every", type=float, nargs="+", default=[0, 5])
+    parser.add_argument("--seconds", type=float, default=20, help="duration of each run")
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_database(path, args.rows, today).dispose()
+        bind = create_sqlite_engine(f"sqlite:///{path}")
+        writer_bind = create_sqlite_engine(f"sqlite:///{path}")
+        SessionLocal.configure(bind=bind)
+        names = [page.__name__.lstrip("_") for page, _ in PAGES]
+        print(f"{args.sessions} open pages, {args.interval:g}s interval, {args.seconds:g}s per run\n")
+        print(f"{'writes':<12}{'mode':<9}{'statements/s':>13}" + "".join(f"{name + ' reruns':>20}" for name in names))
+        for write_every in args.write_every:
+            for mode in ("refresh", "notify"):
+                statements, reruns = run(
+                    mode, bind, writer_bind, args.sessions, args.interval, write_every, args.seconds, today
+                )
+                print(f"{f'every {write_every:g}s' if write_every else 'none':<12}{mode:<9}"
+                      f"{statements / args.seconds:>13.1f}" + "".join(f"{count:>20}" for count in reruns.values()))
+        bind.dispose()
+        writer_bind.dispose()
+
+if __name__ == "__main__":
+    main()
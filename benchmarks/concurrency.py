@@ -0,0 +1,134 @@
+"""Read and write throughput with many simultaneous sessions
+
+Each reader thread plays a browser session rerunning the dashboard and the
+30-day history; each writer thread logs workouts the way the form does.
+All threads share one engine, as the sessions of one Streamlit server do.
+The same load runs against an engine with SQLite's default settings and one
+from `database.create_sqlite_engine` (WAL, pragmas, busy timeout, pool),
+and "queued" runs the tuned engine with writes going through the app's
+background write queue (`writer`) instead of one transaction each.
+
+    python -m benchmarks.concurrency --readers 16 --writers 4 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import queries
+import summary
+import writer
+from database import SessionLocal, create_sqlite_engine, init_db, session_scope
+from models import Workout
+from populate_sample_data import populate
+
+def _default_engine(url):
+    # Engine settings as shipped before the WAL/pool configuration
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+ENGINES = {
+    "default": _default_engine,
+    "tuned": create_sqlite_engine,
+    "queued": create_sqlite_engine,
+}
+
+def _read(today):
+    queries.get_dashboard_totals.uncached(today, today - timedelta(days=7))
+    queries.get_range_totals.uncached(today - timedelta(days=30), today)
+    queries.get_workout_page.uncached(today - timedelta(days=30), today)
+
+def _write(today):
+    workout = Workout(date=today, exercise_type="Running", duration=30, calories_burned=300)
+    with session_scope() as db:
+        db.add(workout)
+        summary.add_workout(db, workout)
+
+def _queued_write(today):
+    writer.add_workout(date=today, exercise_type="Running", duration=30, calories_burned=300).result()
+
+def _worker(action, today, stop, latencies, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            action(today)
+        except OperationalError as exc:
+            errors[str(exc.orig)] += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+def run_load(bind, readers, writers, seconds, today, write=_write):
+    """Run the load against an engine, returning per-kind results"""
+    SessionLocal.configure(bind=bind)
+    stop = threading.Event()
+    latencies = {"read": [], "write": []}
+    errors = {"read": Counter(), "write": Counter()}
+    threads = [
+        threading.Thread(target=_worker, args=(_read, today, stop, latencies["read"], errors["read"]))
+        for _ in range(readers)
+    ] + [
+        threading.Thread(target=_worker, args=(write, today, stop, latencies["write"], errors["write"]))
+        for _ in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for kind, samples in latencies.items():
+        samples.sort()
+        results[kind] = {
+            "ops_per_second": len(samples) / seconds,
+            "p50_ms": statistics.median(samples) if samples else None,
+            "p99_ms": samples[int(len(samples) * 0.99)] if samples else None,
+            "errors": dict(errors[kind]),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=16, help="concurrent reading sessions")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writing sessions")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run")
+    parser.add_argument("--years", type=int, default=2, help="history to generate before the run")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    args = parser.parse_args()
+
+    today = date.today()
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per engine\n")
+    print(f"{'engine':<10}{'kind':<7}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}  errors")
+    for name in args.engines:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            setup = create_sqlite_engine(url)
+            init_db(setup)
+            populate(setup, years=args.years, end=today)
+            setup.dispose()
+            if name == "default":
+                # WAL mode is persistent, so switch the file back
+                bind = _default_engine(url)
+                with bind.connect() as conn:
+                    conn.exec_driver_sql("PRAGMA journal_mode = DELETE")
+            else:
+                bind = ENGINES[name](url)
+
+            write = _queued_write if name == "queued" else _write
+            results = run_load(bind, args.readers, args.writers, args.seconds, today, write)
+            bind.dispose()
+        for kind, result in results.items():
+            p50 = f"{result['p50_ms']:.1f}" if result["p50_ms"] is not None else "-"
+            p99 = f"{result['p99_ms']:.1f}" if result["p99_ms"] is not None else "-"
+            errors = ", ".join(f"{message} x{count}" for message, count in result["errors"].items())
+            print(f"{name:<10}{kind:<7}{result['ops_per_second']:>10.1f}{p50:>10}{p99:>10}  {errors or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Query plans and latencies of the app's date queries before and after migration 1
+
+Builds a temporary SQLite file with the current schema minus every index
+leading with the date, fills it with synthetic workouts and meals, then times
+the dashboard and history queries from app.py, applies migration 1 alone
+and times them again.
+
+    python -m benchmarks.indexes --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, func, select
+
+from database import Base, MIGRATIONS
+from models import Workout, Meal
+
+EXERCISES = ["Running", "Cycling", "Swimming", "Weightlifting", "Yoga", "HIIT"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+
+def build_queries(today):
+    """Statements issued by the dashboard and history tabs"""
+    week_ago = today - timedelta(days=7)
+    thirty_days_ago = today - timedelta(days=30)
+    return {
+        "workouts this week": select(func.count()).select_from(Workout).where(Workout.date >= week_ago),
+        "calories this week": select(func.sum(Workout.calories_burned)).where(Workout.date >= week_ago),
+        "burned today": select(func.sum(Workout.calories_burned)).where(Workout.date == today),
+        "consumed today": select(func.sum(Meal.calories)).where(Meal.date == today),
+        "workouts last 30 days": select(Workout).where(Workout.date >= thirty_days_ago).order_by(Workout.date),
+        "recent workouts": select(Workout).order_by(Workout.date.desc()).limit(5),
+        "today's meals": select(Meal).where(Meal.date == today).order_by(Meal.created_at),
+        "history workouts": select(Workout).where(
+            Workout.date >= thirty_days_ago, Workout.date <= today
+        ).order_by(Workout.date.desc()),
+        "history meals": select(Meal).where(
+            Meal.date >= thirty_days_ago, Meal.date <= today
+        ).order_by(Meal.date.desc()),
+        "history running": select(Workout).where(
+            Workout.date >= thirty_days_ago, Workout.exercise_type == "Running"
+        ),
+    }
+
+def populate(engine, rows, today, years=10):
+    """Insert `rows` workouts and meals spread over `years` of history"""
+    rng = random.Random(42)
+    days = years * 365
+    created = today.isoformat() + " 12:00:00.000000"
+
+    def day():
+        return (today - timedelta(days=rng.randrange(days))).isoformat()
+
+    workouts = [
+        (day(), rng.choice(EXERCISES), rng.randint(15, 90), rng.randint(100, 800), created)
+        for _ in range(rows)
+    ]
+    meals = [
+        (day(), rng.choice(MEAL_TYPES), "Meal", rng.randint(100, 900), 20.0, 40.0, 10.0, created)
+        for _ in range(rows)
+    ]
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO workouts (date, exercise_type, duration, calories_burned, created_at) "
+            "VALUES (?, ?, ?, ?, ?)", workouts
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO meals (date, meal_type, food_name, calories, protein, carbs, fats, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", meals
+        )
+
+def explain(conn, stmt):
+    """Get the SQLite query plan of a statement as one line"""
+    sql = str(stmt.compile(conn, compile_kwargs={"literal_binds": True}))
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+    return "; ".join(row[-1] for row in rows)
+
+def time_query(conn, stmt, repeat):
+    """Get the best wall time of a statement in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(stmt).all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def measure(engine, queries, repeat):
+    with engine.connect() as conn:
+        return {
+            name: (time_query(conn, stmt, repeat), explain(conn, stmt))
+            for name, stmt in queries.items()
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="workouts and meals to insert (each)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query, best is reported")
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        # Every table, so the schema matches the app's, but without any
+        # date-leading index: migration 1's (date, type) indexes and the
+        # (date, id) ones of the paginated history, which models.py declares
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for index in ("ix_workouts_date_exercise_type", "ix_meals_date_meal_type",
+                          "ix_workouts_date_id", "ix_meals_date_id"):
+                conn.exec_driver_sql(f"DROP INDEX {index}")
+
+        print(f"Populating {args.rows:,} workouts and {args.rows:,} meals...")
+        populate(engine, args.rows, today)
+        queries = build_queries(today)
+
+        before = measure(engine, queries, args.repeat)
+        start = time.perf_counter()
+        # Migration 1 only: later ones add other indexes and would blur its effect
+        with engine.begin() as conn:
+            for statement in MIGRATIONS[0]:
+                conn.exec_driver_sql(statement)
+        print(f"Migration applied in {time.perf_counter() - start:.2f}s")
+        after = measure(engine, queries, args.repeat)
+        engine.dispose()
+
+    print(f"\n{'query':<24}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in queries:
+        b, a = before[name][0], after[name][0]
+        print(f"{name:<24}{b:>12.2f}{a:>12.2f}{b / a:>9.1f}x")
+    print("\nQuery plans (before -> after):")
+    for name in queries:
+        print(f"  {name}:\n    {before[name][1]}\n    {after[name][1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Load generator for the ingest service
+
+Starts `ingest.py` on a temporary database (or targets a running one with
+--url) and posts batches of synthetic device readings from several client
+connections at once. A share of each batch is invalid, and a share of the
+requests are retried with the same Idempotency-Key, which must return the
+first response without writing again. Reports request latency
+percentiles and record throughput, and with the temporary database checks
+that the stored row counts match what the service accepted.
+
+    python -m benchmarks.ingest_load --clients 4 --requests 100 --batch 2000
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from sqlalchemy import func, select
+
+from database import create_sqlite_engine
+from models import Workout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXERCISES = ["Running", "Cycling", "Walking", "Swimming", "HIIT"]
+
+def make_batch(rng, size, measurement_share, invalid_share, today, days=3650):
+    """Build a request body of `size` records over the last `days` days,
+    some of them invalid"""
+    workouts, measurements = [], []
+    for _ in range(size):
+        day = (today - timedelta(days=rng.randrange(days))).isoformat()
+        if rng.random() < measurement_share:
+            record = {"date": day, "weight": round(rng.uniform(60, 90), 1),
+                      "body_fat_percentage": round(rng.uniform(10, 25), 1)}
+            measurements.append(record)
+        else:
+            minutes = rng.randint(10, 90)
+            record = {"date": day, "exercise_type": rng.choice(EXERCISES), "duration": minutes,
+                      "calories_burned": minutes * rng.randint(4, 11), "notes": "watch sync"}
+            workouts.append(record)
+        if rng.random() < invalid_share:
+            record["date"] = "not a date"
+    return json.dumps({"workouts": workouts, "measurements": measurements}).encode("utf-8")
+
+def client(url, args, seed, latencies, totals, lock):
+    rng = random.Random(seed)
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    today = date.today()
+    previous = None
+    for _ in range(args.requests):
+        if previous and rng.random() < args.retry_share:
+            body, key = previous
+        else:
+            body = make_batch(rng, args.batch, args.measurement_share, args.invalid_share, today, args.days)
+            key = str(uuid.uuid4())
+        start = time.perf_counter()
+        conn.request("POST", "/ingest", body, {"Content-Type": "application/json", "Idempotency-Key": key})
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            totals["status"][response.status] = totals["status"].get(response.status, 0) + 1
+            if response.status != 200:
+                continue
+            if response.getheader("Idempotent-Replayed"):
+                totals["replayed"] += 1
+            else:
+                for entity in ("workouts", "measurements"):
+                    totals["accepted"][entity] += payload["accepted"][entity]
+                    totals["rejected"][entity] += payload["rejected"][entity]
+        previous = (body, key)
+    conn.close()
+
+def wait_until_up(url, seconds=30):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + seconds
+    while True:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="a running service; default: start one on a temporary database")
+    parser.add_argument("--port", type=int, default=8599, help="port of the service started here")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent connections")
+    parser.add_argument("--requests", type=int, default=100, help="requests per client")
+    parser.add_argument("--batch", type=int, default=2000, help="records per request")
+    parser.add_argument("--days", type=int, default=30,
+                        help="days a batch's records spread over; a device sync covers recent ones")
+    parser.add_argument("--measurement-share", type=float, default=0.05)
+    parser.add_argument("--invalid-share", type=float, default=0.01)
+    parser.add_argument("--retry-share", type=float, default=0.05, help="requests resent with the same key")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server, database = None, None
+        url = args.url
+        if not url:
+            database = f"sqlite:///{os.path.join(tmp, 'ingest.db')}"
+            url = f"http://127.0.0.1:{args.port}"
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "ingest.py"), "--port", str(args.port),
+                 "--database", database],
+                cwd=tmp, stdout=subprocess.DEVNULL
+            )
+        try:
+            wait_until_up(url)
+            latencies = []
+            totals = {"status": {}, "replayed": 0,
+                      "accepted": {"workouts": 0, "measurements": 0},
+                      "rejected": {"workouts": 0, "measurements": 0}}
+            lock = threading.Lock()
+            threads = [
+                threading.Thread(target=client, args=(url, args, seed, latencies, totals, lock))
+                for seed in range(args.clients)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+        latencies.sort()
+        records = sum(totals["accepted"].values()) + sum(totals["rejected"].values())
+        print(f"{args.clients} clients x {args.requests} requests of {args.batch:,} records "
+              f"over {args.days} days\n")
+        print(f"requests/s   {len(latencies) / elapsed:,.1f}")
+        print(f"records/s    {records / elapsed:,.0f}")
+        print(f"latency ms   p50 {statistics.median(latencies):.1f}  "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:.1f}  "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:.1f}  max {latencies[-1]:.1f}")
+        print(f"statuses     {totals['status']}, replayed {totals['replayed']}")
+        print(f"accepted     {totals['accepted']}")
+        print(f"rejected     {totals['rejected']}")
+
+        if database:
+            bind = create_sqlite_engine(database)
+            with bind.connect() as conn:
+                stored = conn.execute(select(func.count()).select_from(Workout)).scalar()
+            bind.dispose()
+            ok = "✅" if stored == totals["accepted"]["workouts"] else "❌"
+            print(f"{ok} {stored:,} workouts stored for {totals['accepted']['workouts']:,} accepted")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Batch progress reports: one aggregation pass per user against a query set per report
+
+Every user gets a shard copied from one generated history, then the
+reports for the last --count weeks and months of each are built the way
+`python reports.py --all-shards` does. "per user" reads a user's data once
+for all of their reports (`reports.build_user`); "per report" reads it
+again for every report, as rendering reports one by one would. Each runs on
+every --workers process count; peak RSS is the largest of the workers.
+
+    python -m benchmarks.reports --users 1000 --count 4 --workers 1 4
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+from datetime import date
+
+import reports
+import shards
+from benchmarks.shards import build_template
+from database import create_sqlite_engine
+
+def _per_report(task):
+    user, url, out_dir, spans = task
+    bind = create_sqlite_engine(url, pool_size=1, max_overflow=0)
+    written = []
+    folder = os.path.join(out_dir, user)
+    os.makedirs(folder, exist_ok=True)
+    for period, periods in spans.items():
+        for span in periods:
+            (report,) = reports.summarize(reports.read_user(bind, *span), [span])
+            name = reports.report_file(period, report["first"])
+            reports._write(os.path.join(folder, name), reports.render(user, period, report))
+            written.append(name)
+    bind.dispose()
+    return user, written, None
+
+def run(build, targets, spans, out_dir, workers):
+    """Build every report, returning (seconds, reports written)"""
+    written = [0]
+
+    def progress(result):
+        written[0] += len(result[1])
+
+    start = time.perf_counter()
+    reports.build_all(targets, spans, out_dir, workers, progress, build)
+    return time.perf_counter() - start, written[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--years", type=float, default=1, help="history of every user")
+    parser.add_argument("--count", type=int, default=4, help="weeks and months reported per user")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count()}))
+    args = parser.parse_args()
+
+    today = date.today()
+    spans = {period: reports.windows(period, args.count, today) for period in reports.PERIODS}
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_template(template, today, args.years)
+        root = os.path.join(tmp, "shards")
+        for number in range(args.users):
+            path = shards.shard_file(f"user{number}@example.com", root)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy(template, path)
+        targets = reports.users(root)
+
+        print(f"{args.users:,} users with {args.years:g} years each, {args.count} weeks and "
+              f"{args.count} months per user, {os.cpu_count()} CPUs\n")
+        print(f"{'reads':<12}{'workers':>8}{'seconds':>9}{'users/s':>9}{'reports/s':>11}")
+        for name, build in (("per report", _per_report), ("per user", reports.build_user)):
+            for workers in args.workers:
+                out_dir = os.path.join(tmp, "out")
+                shutil.rmtree(out_dir, ignore_errors=True)
+                seconds, written = run(build, targets, spans, out_dir, workers)
+                print(f"{name:<12}{workers:>8}{seconds:>9.1f}{args.users / seconds:>9.1f}"
+                      f"{written / seconds:>11.1f}")
+        peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+        print(f"\npeak RSS {peak / 1024:,.0f} MB")
+
+if __name__ == "__main__":
+    main()
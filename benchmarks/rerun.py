@@ -0,0 +1,91 @@
+"""Rerun latency of app.py per view on a large dataset
+
+Only the selected view executes on a rerun, so each view's latency is
+reported next to the sum over all views, which is what every rerun cost
+while st.tabs executed all five bodies. Runs are measured cold (query
+cache cleared before each rerun) and warm.
+
+    python -m benchmarks.rerun --rows 500000
+"""
+import argparse
+import base64
+import os
+import statistics
+import tempfile
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+HERO_IMAGES = [
+    "fitness_gym_workout__79603433.jpg",
+    "fitness_gym_workout__a2b68091.jpg",
+    "fitness_gym_workout__6292474c.jpg",
+]
+# 1x1 PNG standing in for the hero images, which are not part of the benchmark
+PLACEHOLDER_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+def write_placeholder_images(root):
+    folder = os.path.join(root, "attached_assets", "stock_images")
+    os.makedirs(folder, exist_ok=True)
+    for name in HERO_IMAGES:
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(PLACEHOLDER_IMAGE)
+
+def time_view(at, view, runs, clear_cache):
+    from cache import query_cache
+
+    samples = []
+    for _ in range(runs):
+        if clear_cache:
+            query_cache.clear()
+        start = time.perf_counter()
+        at.radio(key="active_view").set_value(view).run()
+        samples.append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000, help="workouts and meals to generate (each)")
+    parser.add_argument("--years", type=int, default=10, help="years of history to spread them over")
+    parser.add_argument("--runs", type=int, default=5, help="reruns per view, median is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.DATABASE_URL is relative to the working directory
+        os.chdir(tmp)
+        write_placeholder_images(tmp)
+
+        from streamlit.testing.v1 import AppTest
+        from database import engine, init_db
+        from populate_sample_data import populate
+
+        init_db()
+        per_day = args.rows / (args.years * 365)
+        print(f"Generating ~{args.rows:,} workouts and meals over {args.years} years...")
+        populate(engine, years=args.years, workouts_per_day=per_day, meals_per_day=per_day,
+                 measure_every=1)
+
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.run()
+        views = at.radio(key="active_view").options
+
+        results = {}
+        for view in views:
+            cold = time_view(at, view, args.runs, clear_cache=True)
+            warm = time_view(at, view, args.runs, clear_cache=False)
+            results[view] = (cold, warm)
+        engine.dispose()
+
+    print(f"\n{'view':<26}{'cold ms':>10}{'warm ms':>10}")
+    for view, (cold, warm) in results.items():
+        print(f"{view:<26}{cold:>10.1f}{warm:>10.1f}")
+    total_cold = sum(cold for cold, _ in results.values())
+    total_warm = sum(warm for _, warm in results.values())
+    print(f"{'all views (st.tabs)':<26}{total_cold:>10.1f}{total_warm:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Many users on one host: one shared database against per-user shards
+
+Session threads play browser sessions of random users: each activates its
+user's database the way app.py does for a rerun, logs a workout in its own
+transaction and reads the dashboard and 30-day history, for --reruns reruns
+before another user's session takes over. "shared" puts every user in one
+database file, as before sharding; "sharded" gives each user a shard from a
+`ShardPool` holding at most --max-open engines, so a new session of a large
+user base usually has to open its shard first. Every shard starts as a copy
+of the same generated history.
+
+    python -m benchmarks.shards --users 2000 --sessions 16 --reruns 20
+"""
+import argparse
+import os
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+import queries
+import shards
+import summary
+from database import SessionLocal, activate, create_sqlite_engine, init_db, session_scope
+from models import Workout
+from populate_sample_data import populate
+
+def _session(pick_engine, users, reruns, today, stop, latencies, errors, seed):
+    rng = random.Random(seed)
+    rerun = 0
+    while not stop.is_set():
+        if rerun % reruns == 0:
+            user = rng.choice(users)
+        rerun += 1
+        start = time.perf_counter()
+        try:
+            activate(pick_engine(user))
+            with session_scope() as db:
+                workout = Workout(date=today, exercise_type="Running", duration=30, calories_burned=300)
+                db.add(workout)
+                summary.add_workout(db, workout)
+            written = time.perf_counter()
+            queries.get_dashboard_totals.uncached(today, today - timedelta(days=7))
+            queries.get_workout_page.uncached(today - timedelta(days=30), today)
+        except OperationalError as exc:
+            errors[str(exc.orig)] += 1
+            continue
+        latencies["write"].append((written - start) * 1000)
+        latencies["read"].append((time.perf_counter() - written) * 1000)
+
+def run_load(pick_engine, users, sessions, reruns, seconds, today):
+    """Run the sessions for `seconds`, returning latencies and errors"""
+    stop = threading.Event()
+    latencies = {"write": [], "read": []}
+    errors = Counter()
+    threads = [
+        threading.Thread(
+            target=_session, args=(pick_engine, users, reruns, today, stop, latencies, errors, seed)
+        )
+        for seed in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+def build_template(path, today, years):
+    bind = create_sqlite_engine(f"sqlite:///{path}")
+    init_db(bind)
+    populate(bind, years=years, end=today)
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    bind.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent session threads")
+    parser.add_argument("--reruns", type=int, default=20, help="reruns of a session before the next user")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run")
+    parser.add_argument("--years", type=float, default=0.25, help="history of every user")
+    parser.add_argument("--max-open", type=int, default=shards.MAX_OPEN_SHARDS)
+    args = parser.parse_args()
+
+    today = date.today()
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_template(template, today, args.years)
+
+        shared_path = os.path.join(tmp, "shared.db")
+        shutil.copy(template, shared_path)
+        shared = create_sqlite_engine(f"sqlite:///{shared_path}")
+        root = os.path.join(tmp, "shards")
+        for user in users:
+            path = shards.shard_file(user, root)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy(template, path)
+        pool = shards.ShardPool(root, args.max_open)
+
+        print(f"{args.users:,} users, {args.sessions} sessions of {args.reruns} reruns, "
+              f"{args.seconds:g}s per run, at most {args.max_open} shards open\n")
+        print(f"{'layout':<9}{'kind':<7}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  errors")
+        for layout, pick_engine in (("shared", lambda user: shared), ("sharded", pool.engine)):
+            SessionLocal.configure(bind=shared)
+            latencies, errors = run_load(pick_engine, users, args.sessions, args.reruns, args.seconds, today)
+            for kind, samples in latencies.items():
+                samples.sort()
+                if not samples:
+                    continue
+                print(f"{layout:<9}{kind:<7}{len(samples) / args.seconds:>9.1f}"
+                      f"{statistics.median(samples):>9.1f}{samples[int(len(samples) * 0.95)]:>9.1f}"
+                      f"{samples[int(len(samples) * 0.99)]:>9.1f}  "
+                      f"{', '.join(f'{message} x{count}' for message, count in errors.items()) or '-'}")
+        stats = pool.stats()
+        print(f"\nshards opened {stats['opened']:,} times, {stats['open']} open at the end, "
+              f"{len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else '?'} open files, "
+              f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB")
+        pool.close()
+        shared.dispose()
+
+if __name__ == "__main__":
+    main()
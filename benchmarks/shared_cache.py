@@ -0,0 +1,129 @@
+"""Cache hit rate and latency as server processes are added, with and without the shared cache
+
+Every process plays browser sessions rerunning the dashboard or the
+history view over one of --windows date ranges, checking for other
+processes' writes first the way app.py does; the first process also logs a
+workout every --write-every seconds. "local" keeps only each process's own
+query cache; "shared" adds one cache file for all of them. A result counts
+as a hit when no process had to query for it. Every tenth rerun also
+starts with a read of the database and checks that the cached dashboard
+is not older: "stale" must stay 0.
+
+    python -m benchmarks.shared_cache --processes 1 2 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.suite import build_database
+
+def _dashboard(queries, today, start):
+    queries.get_dashboard_totals(today, today - timedelta(days=7))
+    queries.get_workout_activity(today - timedelta(days=30))
+    queries.get_weight_trend()
+    queries.get_rolling_analytics(today)
+
+def _history(queries, today, start):
+    from timeseries import choose_bucket
+
+    queries.get_range_totals(start, today)
+    queries.get_workout_page(start, today)
+    queries.get_exercise_breakdown(start, today)
+    queries.get_calorie_intake(start, today, choose_bucket(start, today))
+
+def _is_stale(queries, change_feed, today):
+    week_ago = today - timedelta(days=7)
+    before = queries.get_dashboard_totals.uncached(today, week_ago)["total_workouts"]
+    # A rerun starting now must see at least that; only workouts are added,
+    # so an older result has fewer
+    change_feed.sync()
+    return queries.get_dashboard_totals(today, week_ago)["total_workouts"] < before
+
+def _process(db_path, cache_path, seconds, windows, write_every, seed, today, results):
+    import queries
+    import writer
+    from cache import query_cache
+    from changes import change_feed
+    from database import SessionLocal, create_sqlite_engine
+    from shared_cache import SharedCache
+
+    SessionLocal.configure(bind=create_sqlite_engine(f"sqlite:///{db_path}"))
+    query_cache.shared = SharedCache(cache_path) if cache_path else None
+    rng = random.Random(seed)
+    starts = [today - timedelta(days=30 * (window + 1)) for window in range(windows)]
+    latencies, stale, reruns = [], 0, 0
+    next_write = time.perf_counter() + write_every
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        if seed == 0 and time.perf_counter() >= next_write:
+            writer.add_workout(date=today, exercise_type="Running", duration=30, calories_burned=300).result()
+            next_write += write_every
+        start = time.perf_counter()
+        change_feed.sync()
+        rng.choice((_dashboard, _history))(queries, today, rng.choice(starts))
+        latencies.append((time.perf_counter() - start) * 1000)
+        reruns += 1
+        if reruns % 10 == 0:
+            stale += _is_stale(queries, change_feed, today)
+    local = query_cache.stats()
+    computed = local["misses"] - (query_cache.shared.hits if query_cache.shared else 0)
+    results.put((latencies, local["hits"] + local["misses"], computed, stale))
+
+def run(db_path, cache_path, processes, seconds, windows, write_every, today):
+    """Run `processes` server processes at once, returning their combined numbers"""
+    if cache_path and os.path.exists(cache_path):
+        os.remove(cache_path)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=_process, args=(
+            db_path, cache_path, seconds, windows, write_every, seed, today, results
+        ))
+        for seed in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    parts = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    latencies = sorted(sample for part in parts for sample in part[0])
+    calls = sum(part[1] for part in parts)
+    computed = sum(part[2] for part in parts)
+    return {
+        "reruns": len(latencies),
+        "hit_rate": 1 - computed / calls if calls else 0,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "stale": sum(part[3] for part in parts),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="workouts and meals generated")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run")
+    parser.add_argument("--windows", type=int, default=12, help="history date ranges sessions pick from")
+    parser.add_argument("--write-every", type=float, default=2.0, help="seconds between workouts logged")
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build_database(db_path, args.rows, today).dispose()
+        print(f"{args.rows:,} rows, {args.seconds:g}s per run, a workout logged every "
+              f"{args.write_every:g}s, {args.windows} history ranges\n")
+        print(f"{'processes':>9}  {'cache':<7}{'reruns/s':>10}{'hit rate':>10}{'p50 ms':>9}{'p95 ms':>9}{'stale':>7}")
+        for processes in args.processes:
+            for mode, cache_path in (("local", None), ("shared", os.path.join(tmp, "cache.db"))):
+                result = run(db_path, cache_path, processes, args.seconds, args.windows, args.write_every, today)
+                print(f"{processes:>9}  {mode:<7}{result['reruns'] / args.seconds:>10.1f}"
+                      f"{result['hit_rate']:>10.1%}{result['p50']:>9.1f}{result['p95']:>9.1f}"
+                      f"{result['stale']:>7}")
+
+if __name__ == "__main__":
+    main()
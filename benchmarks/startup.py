@@ -0,0 +1,115 @@
+"""Cold start and warm rerun time of app.py
+
+Each cold sample is a fresh Python process, as after a server restart: it
+imports Streamlit, then runs the app once with AppTest, landing on the
+given view, and reruns it. Reported per landing view:
+
+- process: interpreter start to the first page rendered
+- first run: the first script run alone (the app's imports, schema check,
+  hero images and the view), Streamlit itself already imported
+- rerun: median of the warm reruns that follow in the same process
+
+The database is a synthetic history and the hero images full-size JPEG
+stand-ins, both in a temporary directory.
+
+    python -m benchmarks.startup --runs 5 --views "📊 Dashboard" "🏋️ Log Workout"
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+HERO_IMAGES = [
+    "fitness_gym_workout__79603433.jpg",
+    "fitness_gym_workout__a2b68091.jpg",
+    "fitness_gym_workout__6292474c.jpg",
+]
+# Typical size of the stock photos
+IMAGE_SIZE = (4000, 2667)
+
+def write_stand_in_images(root):
+    """Write noisy full-size JPEGs in place of the hero images"""
+    from PIL import Image
+
+    folder = os.path.join(root, "attached_assets", "stock_images")
+    os.makedirs(folder, exist_ok=True)
+    for seed, name in enumerate(HERO_IMAGES):
+        noise = Image.effect_noise(IMAGE_SIZE, 40 + seed * 10)
+        Image.merge("RGB", (noise, noise.rotate(180), noise.transpose(Image.FLIP_LEFT_RIGHT))).save(
+            os.path.join(folder, name), quality=90
+        )
+
+def child(view, reruns):
+    """Runs in the measured process; prints its timings as JSON"""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.session_state["active_view"] = view
+    at.run()
+    first_done = time.perf_counter()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(json.dumps({
+        "process_ms": None,
+        "streamlit_import_ms": (imported - started) * 1000,
+        "first_run_ms": (first_done - imported) * 1000,
+        "first_done": time.time() - (time.perf_counter() - first_done),
+        "rerun_ms": statistics.median(samples),
+    }))
+
+def measure(view, runs, reruns, cwd):
+    results = []
+    for _ in range(runs):
+        spawned = time.time()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", view, "--reruns", str(reruns)],
+            cwd=cwd, env={**os.environ, "PYTHONPATH": ROOT}, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_ms"] = (result.pop("first_done") - spawned) * 1000
+        results.append(result)
+    return {name: statistics.median(r[name] for r in results) for name in results[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--views", nargs="+", default=["📊 Dashboard", "🏋️ Log Workout", "🗂️ Data"],
+                        help="landing views to measure")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per view, median is reported")
+    parser.add_argument("--reruns", type=int, default=10, help="warm reruns per process")
+    parser.add_argument("--years", type=float, default=2, help="history to generate")
+    parser.add_argument("--child", metavar="VIEW", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.reruns)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_stand_in_images(tmp)
+        # database.DATABASE_URL is relative to the working directory
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, "populate_sample_data.py"), "--years", str(args.years)],
+            cwd=tmp, check=True, capture_output=True
+        )
+        print(f"{'landing view':<22}{'process ms':>12}{'first run ms':>14}{'rerun ms':>10}")
+        for view in args.views:
+            result = measure(view, args.runs, args.reruns, tmp)
+            print(f"{view:<22}{result['process_ms']:>12.0f}{result['first_run_ms']:>14.0f}"
+                  f"{result['rerun_ms']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Timing suite for the dashboard and history computations at several data sizes
+
+Each unit below is what one view computes on a rerun, called through the
+uncached functions in queries.py so the database and pandas work is timed,
+not the query cache. Every size gets its own SQLite file filled by the
+synthetic generator; results are printed as JSON and compared with a
+stored baseline, failing (exit status 1) when a unit got slower than the
+threshold allows. Timings only compare on the same machine, so no baseline
+is committed: save one on each machine before the change being measured.
+
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.suite --sizes 1000 100000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import queries
+from analytics import RollingAnalytics
+from database import SessionLocal, create_sqlite_engine, init_db
+from populate_sample_data import populate
+from timeseries import choose_bucket
+
+DEFAULT_SIZES = [1_000, 100_000, 10_000_000]
+YEARS = 10
+# Share of the generated rows that are meals; the rest are workouts
+MEAL_SHARE = 0.8
+# Slowdowns smaller than this are treated as timer noise
+MIN_REGRESSION_MS = 1.0
+
+def _dashboard_metrics(today):
+    queries.get_dashboard_totals.uncached(today, today - timedelta(days=7))
+    queries.get_latest_measurement.uncached()
+
+def _history_workouts(today):
+    start = today - timedelta(days=30)
+    queries.get_range_totals.uncached(start, today)
+    queries.get_workout_page.uncached(start, today)
+    queries.get_exercise_breakdown.uncached(start, today)
+
+def _history_nutrition(today, days=30):
+    start = today - timedelta(days=days)
+    queries.get_range_totals.uncached(start, today)
+    queries.get_meal_page.uncached(start, today)
+    queries.get_calorie_intake.uncached(start, today, choose_bucket(start, today))
+
+def _rolling_analytics(today):
+    # A fresh instance, so the full build is timed rather than a no-op refresh
+    series = RollingAnalytics()
+    with SessionLocal() as db:
+        series.refresh(db, today)
+    series.daily_frame(today)
+    series.weekly_volume(today)
+    series.streaks(today)
+
+UNITS = {
+    "dashboard_metrics": _dashboard_metrics,
+    "workout_activity_30d": lambda today: queries.get_workout_activity.uncached(today - timedelta(days=30)),
+    "weight_trend": lambda today: queries.get_weight_trend.uncached(),
+    "meal_macros_today": lambda today: queries.get_meal_macros.uncached(today),
+    "history_workout_summary": _history_workouts,
+    "history_nutrition_summary": _history_nutrition,
+    "history_nutrition_all_years": lambda today: _history_nutrition(today, YEARS * 366),
+    "rolling_analytics_full": _rolling_analytics,
+}
+
+def build_database(path, rows, today):
+    """Create and fill a database with about `rows` workouts and meals"""
+    bind = create_sqlite_engine(f"sqlite:///{path}")
+    if not os.path.exists(path):
+        init_db(bind)
+        per_day = rows / (YEARS * 365)
+        populate(
+            bind,
+            years=YEARS,
+            workouts_per_day=per_day * (1 - MEAL_SHARE),
+            meals_per_day=per_day * MEAL_SHARE,
+            end=today,
+        )
+    return bind
+
+def time_unit(unit, today, repeat):
+    """Get the median wall time of a unit in milliseconds, after one warm-up"""
+    unit(today)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        unit(today)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def run(sizes, data_dir, repeat, today):
+    results = {name: {} for name in UNITS}
+    for size in sizes:
+        path = os.path.join(data_dir, f"bench_{size}.db")
+        print(f"Preparing {size:,} rows...", file=sys.stderr)
+        bind = build_database(path, size, today)
+        SessionLocal.configure(bind=bind)
+        for name, unit in UNITS.items():
+            results[name][str(size)] = round(time_unit(unit, today, repeat), 3)
+            print(f"  {name:<28}{results[name][str(size)]:>10.2f} ms", file=sys.stderr)
+        bind.dispose()
+    return results
+
+def find_regressions(results, baseline, threshold):
+    """List (unit, size, baseline ms, current ms) slower than the threshold"""
+    regressions = []
+    for name, by_size in results.items():
+        for size, current in by_size.items():
+            previous = baseline.get("results", {}).get(name, {}).get(size)
+            if previous is None:
+                continue
+            if current > previous * (1 + threshold) and current - previous > MIN_REGRESSION_MS:
+                regressions.append((name, size, previous, current))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="total workout and meal rows per database")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per unit, median is reported")
+    parser.add_argument("--data-dir", help="keep generated databases here and reuse them across runs")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    args = parser.parse_args()
+
+    # Fixed date so a kept --data-dir matches every run
+    today = date(2025, 1, 1)
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        results = run(args.sizes, args.data_dir, args.repeat, today)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run(args.sizes, tmp, args.repeat, today)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "unit": "ms",
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, size, previous, current in regressions:
+            print(f"REGRESSION {name} @ {size} rows: {previous:.2f} -> {current:.2f} ms",
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
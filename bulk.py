@@ -0,0 +1,254 @@
+"""Set-based bulk deletes and edits of workouts and meals, with undo.
+
+A `Selection` picks the rows of one entity by date range, exercise or meal
+type and food name. `preview` describes them with SQL aggregates, and
+`delete_rows`/`edit_rows` change all of them with single statements in one
+transaction, daily_summary and the food catalog's meal counts included.
+Only rows in SQLite change: archived months are read-only, and `preview`
+counts their matches apart.
+
+Every operation is journaled in the database rather than in memory: per
+changed row, its id and a JSON object of the values the operation replaced
+(the whole row for a delete, the one column for an edit), copied with one
+INSERT ... SELECT. `undo_last` puts them back, newest operation first; the
+last JOURNAL_KEEP operations keep their journal.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+from sqlalchemy import delete, func, insert, literal, select, update
+
+import archive
+import catalog
+import importer
+import summary
+import versions
+from database import engine
+from models import Workout, Meal, BulkOperation, BulkUndoRow
+
+# Operations whose changes can still be undone
+JOURNAL_KEEP = 10
+
+MODELS = {"workouts": Workout, "meals": Meal}
+# Column of the type filter
+KIND_COLUMNS = {"workouts": "exercise_type", "meals": "meal_type"}
+# Columns a bulk edit can set, validated like imports
+EDITABLE = {entity: [name for name, *_ in importer.SCHEMAS[entity][1]] for entity in MODELS}
+# Columns totalled in a preview
+TOTALS = {
+    "workouts": ["duration", "calories_burned"],
+    "meals": ["calories", "protein", "carbs", "fats"],
+}
+
+@dataclass
+class Selection:
+    """Rows of one entity in a date range, optionally of one type or food"""
+    entity: str  # "workouts" or "meals"
+    start_date: date
+    end_date: date
+    kind: str = None  # exercise type of workouts, meal type of meals
+    food_name: str = None  # meals only, compared case-insensitively
+
+    @property
+    def model(self):
+        return MODELS[self.entity]
+
+    def conditions(self):
+        model = self.model
+        conditions = [model.date >= self.start_date, model.date <= self.end_date]
+        if self.kind:
+            conditions.append(getattr(model, KIND_COLUMNS[self.entity]) == self.kind)
+        if self.food_name and self.food_name.strip():
+            conditions.append(func.lower(Meal.food_name) == self.food_name.strip().lower())
+        return conditions
+
+    def describe(self):
+        parts = [f"{self.entity} from {self.start_date} to {self.end_date}"]
+        if self.kind:
+            parts.append(self.kind)
+        if self.food_name and self.food_name.strip():
+            parts.append(f'"{self.food_name.strip()}"')
+        return ", ".join(parts)
+
+def convert(entity, field, value):
+    """Check and convert an entered value for column `field`, raising
+    ValueError if imports would reject it"""
+    _, columns = importer.SCHEMAS[entity]
+    _, converter, required, minimum = next(column for column in columns if column[0] == field)
+    value = converter(value) if value is not None and str(value).strip() else None
+    if value is None:
+        if required:
+            raise ValueError(f"{field} cannot be empty")
+        return None
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{field} must be at least {minimum}")
+    # Dates come back from the import converter as ISO text
+    return date.fromisoformat(value) if field == "date" else value
+
+def kinds(entity, start_date, end_date, bind=engine):
+    """Get the exercise or meal types used in a date range, archived months included"""
+    model = MODELS[entity]
+    kind_name = KIND_COLUMNS[entity]
+    column = getattr(model, kind_name)
+    with bind.connect() as conn:
+        archive.begin_snapshot(conn)
+        used = conn.execute(select(column).distinct().where(
+            model.date >= start_date, model.date <= end_date
+        )).scalars().all()
+        archived = archive.sum_by(conn, entity, [kind_name], [], start_date, end_date)
+    return sorted({*used, *(row[0] for row in archived)})
+
+def preview(selection, bind=engine):
+    """Count and total the rows a selection matches, per type
+
+    Matches in archived months are counted in "archived" and are not
+    part of the rest.
+    """
+    model = selection.model
+    kind_name = KIND_COLUMNS[selection.entity]
+    with bind.connect() as conn:
+        archive.begin_snapshot(conn)
+        groups = conn.execute(select(
+            getattr(model, kind_name), func.count(), func.min(model.date), func.max(model.date),
+            *(func.coalesce(func.sum(getattr(model, name)), 0) for name in TOTALS[selection.entity]),
+        ).where(*selection.conditions()).group_by(getattr(model, kind_name))).all()
+        keys = [kind_name] + (["food_name"] if selection.food_name else [])
+        archived = archive.sum_by(conn, selection.entity, keys, [], selection.start_date, selection.end_date)
+    food = (selection.food_name or "").strip().lower()
+    return {
+        "rows": sum(group[1] for group in groups),
+        "first_date": min((group[2] for group in groups), default=None),
+        "last_date": max((group[3] for group in groups), default=None),
+        "totals": {
+            name: sum(group[4 + i] for group in groups)
+            for i, name in enumerate(TOTALS[selection.entity])
+        },
+        "by_kind": sorted(((group[0], group[1]) for group in groups), key=lambda item: -item[1]),
+        "archived": sum(
+            row[-1] for row in archived
+            if (not selection.kind or row[0] == selection.kind)
+            and (not food or row[1].lower() == food)
+        ),
+    }
+
+def _journal_values(model, names):
+    return func.json_object(*(part for name in names for part in (literal(name), getattr(model, name))))
+
+def _row_columns(model):
+    return [column.name for column in model.__table__.columns if column.name != "id"]
+
+def _count(conn, entity, field, rows, sign=1):
+    """Count changed rows in the rollups, or with `sign` -1 take them out"""
+    model = MODELS[entity]
+    summary.add_matching(conn, model, rows, sign)
+    if entity == "meals" and field in (None, "food_name"):
+        catalog.add_matching(conn, rows, sign)
+
+def _touched(entity, field):
+    """Entities whose data a delete (`field` None) or an edit of `field` changes"""
+    if entity == "meals" and field in (None, "food_name"):
+        return [entity, "foods"]
+    return [entity]
+
+def _apply(selection, action, field=None, value=None, bind=engine):
+    model = selection.model
+    with bind.begin() as conn:
+        operation = conn.execute(insert(BulkOperation).values(
+            entity=selection.entity, action=action, field=field,
+            value=None if value is None else str(value),
+            description=selection.describe(), rows=0,
+        )).inserted_primary_key[0]
+        names = _row_columns(model) if action == "delete" else [field]
+        journaled = conn.execute(insert(BulkUndoRow).from_select(
+            ["operation_id", "row_id", "data"],
+            select(literal(operation), model.id, _journal_values(model, names)).where(*selection.conditions())
+        )).rowcount
+        if not journaled:
+            conn.execute(delete(BulkOperation).where(BulkOperation.id == operation))
+            return 0
+
+        rows = model.id.in_(select(BulkUndoRow.row_id).where(BulkUndoRow.operation_id == operation))
+        first_date = conn.execute(select(func.min(model.date)).where(rows)).scalar()
+        if field == "date":
+            first_date = min(first_date, value)
+        _count(conn, selection.entity, field, rows, -1)
+        if action == "delete":
+            conn.execute(delete(model).where(rows))
+        else:
+            conn.execute(update(model).where(rows).values({field: value}))
+            _count(conn, selection.entity, field, rows)
+        conn.execute(update(BulkOperation).where(BulkOperation.id == operation).values(
+            rows=journaled, first_date=first_date
+        ))
+        _expire(conn)
+        versions.touch(conn, *_touched(selection.entity, field))
+    return journaled
+
+def _expire(conn):
+    """Drop the journal of all but the last JOURNAL_KEEP operations"""
+    expired = conn.execute(select(BulkOperation.id).where(
+        BulkOperation.action != "undo", BulkOperation.status == "applied"
+    ).order_by(BulkOperation.id.desc()).offset(JOURNAL_KEEP)).scalars().all()
+    if expired:
+        conn.execute(delete(BulkUndoRow).where(BulkUndoRow.operation_id.in_(expired)))
+        conn.execute(update(BulkOperation).where(BulkOperation.id.in_(expired)).values(status="expired"))
+
+def delete_rows(selection, bind=engine):
+    """Delete every row of a selection, returning how many"""
+    return _apply(selection, "delete", bind=bind)
+
+def edit_rows(selection, field, value, bind=engine):
+    """Set column `field` of every row of a selection to `value` (converted
+    with `convert`), returning how many rows changed"""
+    if field not in EDITABLE[selection.entity]:
+        raise ValueError(f"{field} cannot be edited in bulk")
+    return _apply(selection, "edit", field, value, bind=bind)
+
+def undo_last(bind=engine):
+    """Revert the newest operation not undone yet, returning it (None if
+    there is none)"""
+    undoable = select(func.max(BulkOperation.id)).where(
+        BulkOperation.action != "undo", BulkOperation.status == "applied"
+    ).scalar_subquery()
+    with bind.begin() as conn:
+        # Claimed with the first statement, which takes the write lock, so
+        # two sessions cannot revert the same operation
+        operation = conn.execute(update(BulkOperation).where(BulkOperation.id == undoable).values(
+            status="undone"
+        ).returning(*BulkOperation.__table__.columns)).first()
+        if operation is None:
+            return None
+
+        model = MODELS[operation.entity]
+        journal = BulkUndoRow.operation_id == operation.id
+        rows = model.id.in_(select(BulkUndoRow.row_id).where(journal))
+        if operation.action == "delete":
+            names = _row_columns(model)
+            conn.execute(insert(model).from_select(["id", *names], select(
+                BulkUndoRow.row_id, *(func.json_extract(BulkUndoRow.data, f"$.{name}") for name in names)
+            ).where(journal)))
+        else:
+            _count(conn, operation.entity, operation.field, rows, -1)
+            conn.execute(update(model).where(journal, BulkUndoRow.row_id == model.id).values({
+                operation.field: func.json_extract(BulkUndoRow.data, f"$.{operation.field}")
+            }))
+        _count(conn, operation.entity, operation.field, rows)
+        conn.execute(delete(BulkUndoRow).where(journal))
+        conn.execute(insert(BulkOperation).values(
+            entity=operation.entity, action="undo", description=operation.description,
+            rows=operation.rows, first_date=operation.first_date, undoes=operation.id,
+        ))
+        versions.touch(conn, *_touched(operation.entity, operation.field))
+    return operation
+
+def last_undoable(bind=engine):
+    """Get the operation `undo_last` would revert, or None"""
+    with bind.connect() as conn:
+        return conn.execute(select(BulkOperation).where(
+            BulkOperation.action != "undo", BulkOperation.status == "applied"
+        ).order_by(BulkOperation.id.desc()).limit(1)).first()
+
+def journal(limit=20, bind=engine):
+    """Get the latest operations, newest first"""
+    with bind.connect() as conn:
+        return conn.execute(select(BulkOperation).order_by(BulkOperation.id.desc()).limit(limit)).all()
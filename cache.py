@@ -0,0 +1,149 @@
+"""Process-wide LRU cache for read queries, keyed by data version.
+
+Every cached function declares the entities it reads ("workouts", "meals",
+"measurements"). Its entries are keyed by the function, its arguments and
+the current version of those entities. Write paths call `bump` after they
+commit, which moves the affected entities to a new version and drops only
+the entries that depend on them; everything else keeps being served
+without touching the database.
+
+Entries and versions are kept per database (`scope`), so in a multi-user
+deployment users never see each other's results and a write only
+invalidates its own user's entries.
+
+Functions cached with `shared=True` return picklable results (frames,
+dicts); on a miss they look in the cache shared by all server processes of
+the host (shared_cache.py), when one is configured, before computing.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from functools import wraps
+
+from database import database_key
+from shared_cache import shared_cache
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def _sizeof(value):
+    """Approximate memory footprint of a cached value in bytes"""
+    if hasattr(value, "memory_usage"):
+        # pandas objects know their own size
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    size = sys.getsizeof(value)
+    if isinstance(value, Mapping):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+class QueryCache:
+    """Bounded LRU cache whose entries are invalidated per entity"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, scope=lambda: None, shared=None):
+        self.max_bytes = max_bytes
+        self.scope = scope  # identifies the database the current thread reads
+        self.shared = shared  # SharedCache consulted on misses, if any
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size, entities)
+        self._versions = {}  # (scope, entity) -> version
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def version(self, entity, scope=None):
+        """Get the current data version of an entity"""
+        if scope is None:
+            scope = self.scope()
+        return self._versions.get((scope, entity), 0)
+
+    def bump(self, *entities, scope=None):
+        """Record a committed write to the given entities
+
+        `scope` defaults to the current thread's database.
+        """
+        if scope is None:
+            scope = self.scope()
+        with self._lock:
+            for entity in entities:
+                self._versions[scope, entity] = self._versions.get((scope, entity), 0) + 1
+            stale = [
+                key for key, (_, _, deps) in self._entries.items()
+                if key[0] == scope and deps.intersection(entities)
+            ]
+            for key in stale:
+                self._drop(key)
+
+    def clear(self):
+        """Drop every entry, keeping the data versions"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_or_compute(self, name, args, entities, compute, shared=False):
+        """Get a cached result, running `compute()` on a miss
+
+        With `shared`, a miss goes through the shared cache first.
+        """
+        # Versions are read before querying, so a write committed while
+        # `compute` runs leaves this result under a version nobody asks for
+        scope = self.scope()
+        versions = tuple(self.version(entity, scope) for entity in entities)
+        key = (scope, name, args, versions)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        if shared and self.shared is not None:
+            value = self.shared.get_or_compute(scope, name, args, entities, compute)
+        else:
+            value = compute()
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, frozenset(entities))
+            self._size += size
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def cached(self, *entities, shared=False):
+        """Decorator caching a read function that depends on `entities`"""
+        def decorator(func):
+            name = f"{func.__module__}.{func.__qualname__}"
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key_args = (args, tuple(sorted(kwargs.items())))
+                return self.get_or_compute(
+                    name, key_args, entities, lambda: func(*args, **kwargs), shared
+                )
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Get hit/miss counters and current memory use"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+# Shared by every session served from this process
+query_cache = QueryCache(scope=database_key, shared=shared_cache)
@@ -0,0 +1,227 @@
+"""Food catalog: nutrition values by food name, searchable by prefix.
+
+The `foods` table holds one row per distinct food name. It is seeded from
+the meals logged so far, kept up to date as meals are logged (the latest
+values logged for a food win) and can be filled from a nutrition dataset
+through the importer:
+
+    python importer.py foods nutrition.csv    # name,calories,protein,carbs,fats
+
+`suggest` completes what the user has typed so far. Each word of the query
+is matched as a prefix of a word in the name. Suggestions come, in order,
+from the user's recently used foods (a small LRU kept per session), the
+foods they have logged most often, then the FTS5 index over the whole
+catalog. The FTS5 lookup reads at most `CANDIDATES` matches in index order
+and ranks only those, so it costs about the same on a catalog of a
+thousand or a million foods.
+"""
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database import engine
+from models import Meal, Food
+
+# Shorter queries only get the recently used foods
+MIN_QUERY_CHARS = 2
+SUGGESTIONS = 8
+# FTS5 matches read per lookup before ranking
+CANDIDATES = 50
+RECENT_FOODS = 30
+
+NUTRIENTS = ["calories", "protein", "carbs", "fats"]
+
+@dataclass(frozen=True)
+class FoodFacts:
+    """Nutrition values of one food"""
+    name: str
+    calories: int
+    protein: float = None
+    carbs: float = None
+    fats: float = None
+
+def _words(text):
+    # Same word boundaries as the FTS5 unicode61 tokenizer
+    return re.findall(r"[^\W_]+", text.lower())
+
+def _matches(name, words):
+    """Whether every query word is the prefix of a word in `name`"""
+    name_words = _words(name)
+    return all(any(w.startswith(word) for w in name_words) for word in words)
+
+def match_expression(query):
+    """Get the FTS5 query matching names with a word starting with each query word"""
+    return " ".join(f'"{word}"*' for word in _words(query))
+
+class RecentFoods:
+    """Bounded LRU of the foods one user picked or logged lately"""
+
+    def __init__(self, capacity=RECENT_FOODS):
+        self.capacity = capacity
+        self._foods = OrderedDict()  # lower-case name -> FoodFacts
+
+    def __len__(self):
+        return len(self._foods)
+
+    def __iter__(self):
+        # Most recent first
+        return reversed(list(self._foods.values()))
+
+    def add(self, food):
+        key = food.name.lower()
+        self._foods.pop(key, None)
+        self._foods[key] = food
+        while len(self._foods) > self.capacity:
+            self._foods.popitem(last=False)
+
+    def match(self, query):
+        words = _words(query)
+        return [food for food in self if _matches(food.name, words)]
+
+def _logged_foods(conn, words, limit):
+    """The user's own foods matching every word, most often logged first"""
+    conditions, params = [], []
+    for word in words:
+        # Word starts, like the FTS5 prefix query
+        conditions.append("(name LIKE ? OR name LIKE ?)")
+        params += [f"{word}%", f"% {word}%"]
+    # times_logged > 0 selects the partial index; the catalog at large is
+    # never scanned
+    rows = conn.exec_driver_sql(
+        "SELECT name, calories, protein, carbs, fats FROM foods "
+        f"WHERE times_logged > 0 AND {' AND '.join(conditions)} "
+        "ORDER BY times_logged DESC LIMIT ?",
+        tuple(params + [limit])
+    ).fetchall()
+    return [FoodFacts(*row) for row in rows]
+
+def _catalog_foods(conn, query, limit):
+    """Catalog foods matching the query, names starting with it and short names first"""
+    rows = conn.exec_driver_sql(
+        "SELECT f.name, f.calories, f.protein, f.carbs, f.fats "
+        "FROM (SELECT rowid FROM foods_fts WHERE foods_fts MATCH ? LIMIT ?) AS hit "
+        "JOIN foods AS f ON f.id = hit.rowid",
+        (match_expression(query), CANDIDATES)
+    ).fetchall()
+    prefix = query.strip().lower()
+    rows.sort(key=lambda row: (not row[0].lower().startswith(prefix), len(row[0])))
+    return [FoodFacts(*row) for row in rows[:limit]]
+
+def suggest(query, recent=(), limit=SUGGESTIONS, bind=engine):
+    """Get up to `limit` foods completing `query`, best first"""
+    if len(query.strip()) < MIN_QUERY_CHARS:
+        return list(recent)[:limit]
+    words = _words(query)
+    if not words:
+        return []
+
+    found = OrderedDict()
+
+    def extend(foods):
+        for food in foods:
+            found.setdefault(food.name.lower(), food)
+
+    extend(food for food in recent if _matches(food.name, words))
+    if len(found) < limit:
+        with bind.connect() as conn:
+            extend(_logged_foods(conn, words, limit))
+            if len(found) < limit:
+                extend(_catalog_foods(conn, query, limit))
+    return list(found.values())[:limit]
+
+def recent_foods(limit=RECENT_FOODS, bind=engine):
+    """Get the foods of the latest logged meals, most recent first
+
+    Primes a session's RecentFoods, so recent foods survive restarts.
+    """
+    with bind.connect() as conn:
+        rows = conn.execute(
+            select(Meal.food_name, Meal.calories, Meal.protein, Meal.carbs, Meal.fats)
+            .order_by(Meal.date.desc(), Meal.id.desc())
+            # Meals repeat; read enough rows for `limit` distinct foods
+            .limit(limit * 4)
+        ).all()
+    foods = OrderedDict()
+    for row in rows:
+        foods.setdefault(row[0].lower(), FoodFacts(*row))
+    return list(foods.values())[:limit]
+
+def _upsert(stmt, accumulate):
+    """Make an insert into foods update the nutrition of names already there"""
+    logged = stmt.excluded.times_logged
+    return stmt.on_conflict_do_update(
+        index_elements=[Food.name],
+        set_={
+            **{name: getattr(stmt.excluded, name) for name in NUTRIENTS},
+            "times_logged": Food.times_logged + logged if accumulate else logged,
+        }
+    )
+
+def add_meal(db, meal):
+    """Record a newly logged meal's food and values in the catalog"""
+    values = {name: getattr(meal, name) for name in NUTRIENTS}
+    db.execute(_upsert(
+        insert(Food).values(name=meal.food_name.strip(), times_logged=1, **values), accumulate=True
+    ))
+
+def remove_meal(db, meal):
+    """Take a deleted meal out of its food's logged count"""
+    db.execute(update(Food).where(
+        Food.name == meal.food_name.strip(), Food.times_logged > 0
+    ).values(times_logged=Food.times_logged - 1))
+
+def _logged(condition):
+    """Select each food's latest logged values and meal count for the meals matching `condition`"""
+    name = func.trim(Meal.food_name)
+    latest = select(
+        func.max(Meal.id).label("id"), func.count().label("times_logged")
+    ).where(condition).group_by(name.collate("NOCASE")).subquery()
+    return select(
+        name, *(getattr(Meal, column) for column in NUTRIENTS), latest.c.times_logged
+    ).join(latest, Meal.id == latest.c.id).where(
+        # SQLite needs a WHERE before an upsert's ON CONFLICT in INSERT ... SELECT
+        condition
+    )
+
+def add_inserted(db, after_id):
+    """Record the foods of every meal with an id above `after_id`
+
+    For bulk writers; call it in the same transaction as the insert.
+    """
+    db.execute(_upsert(insert(Food).from_select(
+        ["name", *NUTRIENTS, "times_logged"], _logged(Meal.id > after_id)
+    ), accumulate=True))
+
+def add_matching(db, condition, sign=1):
+    """Count every meal matching `condition` in its food's logged count, or
+    with `sign` -1 take them out
+
+    For set-based changes, like summary.add_matching: take the meals out
+    before changing them and count them again after, in the same
+    transaction. Foods already in the catalog keep their values.
+    """
+    if sign == 1:
+        stmt = insert(Food).from_select(["name", *NUTRIENTS, "times_logged"], _logged(condition))
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[Food.name],
+            set_={"times_logged": Food.times_logged + stmt.excluded.times_logged}
+        ))
+        return
+    name = func.trim(Meal.food_name)
+    # Compared with foods.name, so NOCASE like the catalog
+    meals = select(func.count()).where(condition, name == Food.name).scalar_subquery()
+    db.execute(update(Food).where(Food.name.in_(select(name).where(condition))).values(
+        times_logged=func.max(Food.times_logged - meals, 0)
+    ))
+
+def seed_from_meals(conn):
+    """Add every logged food to the catalog and recount its meals
+
+    Accepts a connection or session; runs inside its current transaction.
+    """
+    conn.execute(_upsert(insert(Food).from_select(
+        ["name", *NUTRIENTS, "times_logged"], _logged(Meal.id > 0)
+    ), accumulate=False))
@@ -0,0 +1,101 @@
+"""Change notification: which entities changed, for every session of a process.
+
+Every commit to a database, whether from this process's writer, another
+Streamlit process, the ingest service or a command line import, replaces
+the data version tokens of the entities it wrote (versions.py). The change
+feed keeps one connection per database to read SQLite's `PRAGMA data_version`,
+which moves whenever another connection commits and costs no disk read.
+Only when it moves are the tokens read, to learn which entities changed,
+and only those are bumped in the query cache. Cached results of everything
+else keep being served.
+
+The cache's per-entity versions double as change counters for sessions:
+a page remembers the versions it was rendered with and reruns once one of
+the entities it shows moves on (`watch_changes` in app.py). However many
+sessions are open, a process checks each database at most once per
+interval.
+
+    change_feed.sync()             # start of a rerun: pick up every commit
+    change_feed.sync(max_age=2)    # open pages: at most one check per 2 s
+    change_feed.versions(("workouts", "meals"))
+"""
+import threading
+import time
+
+from sqlalchemy import event
+
+from cache import query_cache
+from database import current_engine, database_key
+
+class ChangeFeed:
+    """Per-entity changes of every database this process reads"""
+
+    def __init__(self, cache=query_cache):
+        self.cache = cache
+        self.checks = 0
+        self.changes = 0
+        self._watches = {}  # database key -> {"connection", "data_version", "tokens", "checked"}
+        self._lock = threading.Lock()
+
+    def sync(self, bind=None, max_age=0):
+        """Bump the entities other connections changed since the last check
+
+        Returns the changed entities. With `max_age`, a database checked
+        less than that many seconds ago is not checked again.
+        """
+        bind = bind or current_engine()
+        key = database_key(bind)
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None:
+                if not event.contains(bind, "engine_disposed", self._forget):
+                    event.listen(bind, "engine_disposed", self._forget)
+                watch = self._watches[key] = {
+                    "connection": bind.connect(), "data_version": None, "tokens": None, "checked": 0.0
+                }
+            now = time.monotonic()
+            if now - watch["checked"] < max_age:
+                return ()
+            watch["checked"] = now
+            self.checks += 1
+            conn = watch["connection"]
+            version = conn.exec_driver_sql("PRAGMA data_version").scalar()
+            if version == watch["data_version"]:
+                return ()
+            watch["data_version"] = version
+            tokens = dict(conn.exec_driver_sql("SELECT entity, version FROM data_versions").all())
+            previous, watch["tokens"] = watch["tokens"], tokens
+        if previous is None:
+            return ()
+        changed = tuple(entity for entity, token in tokens.items() if previous.get(entity) != token)
+        if changed:
+            self.changes += 1
+            self.cache.bump(*changed, scope=key)
+        return changed
+
+    def record(self, bind, tokens):
+        """Note tokens committed and bumped by this process itself, so the
+        next check does not count them as another change"""
+        with self._lock:
+            watch = self._watches.get(database_key(bind))
+            if watch is not None and watch["tokens"] is not None:
+                watch["tokens"].update(tokens)
+
+    def versions(self, entities, bind=None):
+        """Get the change counters of `entities`, to compare with later ones"""
+        scope = database_key(bind)
+        return tuple(self.cache.version(entity, scope) for entity in entities)
+
+    def stats(self):
+        """Get the number of checks made and of those that found changes"""
+        return {"databases": len(self._watches), "checks": self.checks, "changes": self.changes}
+
+    def _forget(self, bind):
+        # A closed shard (see shards.py) takes its watch with it
+        with self._lock:
+            watch = self._watches.pop(database_key(bind), None)
+        if watch:
+            watch["connection"].close()
+
+# Shared by every session served from this process
+change_feed = ChangeFeed()
@@ -1,38 +1,226 @@
-from sqlalchemy import create_engine
+import functools
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import streamlit as st
+from sqlalchemy.orm import Session, sessionmaker
+from instrumentation import instrument
 
 # ✅ Local SQLite database
 DATABASE_URL = "sqlite:///fittrack.db"
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False
-)
+# Applied to every new connection. WAL lets readers work while a writer
+# commits, and the busy timeout makes a writer queue for the single write
+# lock instead of failing with "database is locked".
+BUSY_TIMEOUT_MS = 5000
+SQLITE_PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),  # durable at checkpoints, safe with WAL
+    ("cache_size", -64000),     # 64 MB page cache per connection
+    ("mmap_size", 256 * 1024 * 1024),
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+]
+
+# Every browser session reruns on its own thread. The pool keeps a
+# connection per concurrent rerun up to POOL_SIZE and opens a few more for
+# bursts; past that, checkouts wait POOL_TIMEOUT seconds.
+POOL_SIZE = 8
+MAX_OVERFLOW = 8
+POOL_TIMEOUT = 30
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+def create_sqlite_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW):
+    """Create an engine for a SQLite database file with the app's settings"""
+    bind = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000},
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=POOL_TIMEOUT,
+        echo=False
+    )
+    event.listen(bind, "connect", _set_sqlite_pragmas)
+    instrument(bind)
+    return bind
+
+engine = create_sqlite_engine(DATABASE_URL)
+
+# The database of the user being served, in multi-user deployments (see
+# shards.py); unset, everything uses the session factory's own bind
+_active_engine = ContextVar("fittrack_engine", default=None)
+
+class RoutingSession(Session):
+    """Session running its statements on the active engine, if one is set"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        return _active_engine.get() or super().get_bind(mapper=mapper, clause=clause, **kwargs)
 
 SessionLocal = sessionmaker(
+    class_=RoutingSession,
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+def activate(bind):
+    """Make `bind` the database of the current thread's sessions and caches"""
+    _active_engine.set(bind)
+
+def current_engine():
+    """Get the engine sessions created now would use"""
+    return _active_engine.get() or SessionLocal.kw["bind"]
+
+@functools.lru_cache(maxsize=None)
+def _resolved(database):
+    # Resolved once per path: every cached read asks for its key
+    if not database or database == ":memory:":
+        return database
+    return os.path.realpath(database)
+
+def database_key(bind=None):
+    """Identify a database for per-database state: its file's resolved path,
+    the same in every process whatever its working directory"""
+    return _resolved((bind or current_engine()).url.database)
+
 Base = declarative_base()
 
-@st.cache_resource
-def get_engine():
-    """Get cached database engine"""
-    return engine
+# Schema migrations for existing fittrack.db files, applied in order.
+# The schema version is stored in SQLite's `PRAGMA user_version`; entry N
+# upgrades a database from version N to N + 1 and is a list of SQL strings or
+# callables taking the connection. Tables added to the models are created by
+# `create_all` beforehand. Steps must be idempotent so a migration interrupted
+# half-way can safely be re-run.
+def _rebuild_daily_summary(conn):
+    from summary import rebuild_daily_summary
+    rebuild_daily_summary(conn)
+
+def _create_food_catalog(conn):
+    from models import FOOD_SEARCH_DDL
+    from catalog import seed_from_meals
+    for statement in FOOD_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+    seed_from_meals(conn)
+
+def _log_day_changes(conn):
+    from models import DAY_CHANGE_DDL
+    for statement in DAY_CHANGE_DDL:
+        conn.exec_driver_sql(statement)
+
+def _autoincrement_ids(conn):
+    # Archiving empties the hot tables, and plain rowid tables would then
+    # hand out the archived rows' ids again. AUTOINCREMENT needs a rebuild.
+    from models import Workout, Meal
+    for model in (Workout, Meal):
+        table = model.__table__
+        sql = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+        ).scalar()
+        if "AUTOINCREMENT" in sql:
+            continue
+        for index in table.indexes:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO _{table.name}_old")
+        table.create(conn)
+        columns = ", ".join(column.name for column in table.columns)
+        conn.exec_driver_sql(
+            f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM _{table.name}_old"
+        )
+        conn.exec_driver_sql(f"DROP TABLE _{table.name}_old")
+
+MIGRATIONS = [
+    # 1: date indexes for the dashboard and history range queries
+    [
+        "CREATE INDEX IF NOT EXISTS ix_workouts_date_exercise_type "
+        "ON workouts (date, exercise_type)",
+        "CREATE INDEX IF NOT EXISTS ix_meals_date_meal_type "
+        "ON meals (date, meal_type)",
+    ],
+    # 2: backfill the daily_summary rollup from existing rows
+    [
+        _rebuild_daily_summary,
+    ],
+    # 3: (date, id) order for the paginated history tables
+    [
+        "CREATE INDEX IF NOT EXISTS ix_workouts_date_id ON workouts (date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_meals_date_id ON meals (date, id)",
+    ],
+    # 4: food catalog search index, seeded with the foods logged so far
+    [
+        _create_food_catalog,
+    ],
+    # 5: never reuse workout and meal ids once archived rows leave the tables
+    [
+        _autoincrement_ids,
+    ],
+    # 6: log the days whose rollup or measurement changed, for the rolling analytics
+    [
+        _log_day_changes,
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
 
 def get_db():
-    """Get database session"""
+    """Get a new database session; the caller must close it"""
+    return SessionLocal()
+
+@contextmanager
+def session_scope():
+    """Provide a session that commits on success and rolls back on error
+
+    For scripts such as the benchmarks; the app writes through writer.py.
+
+        with session_scope() as db:
+            db.add(workout)
+    """
     db = SessionLocal()
     try:
-        return db
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+def get_schema_version(bind=engine):
+    """Get the schema version recorded in the database file"""
+    with bind.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+def run_migrations(bind=engine):
+    """Apply pending schema migrations, returning the resulting version"""
+    version = get_schema_version(bind)
+    for number in range(version, SCHEMA_VERSION):
+        with bind.begin() as conn:
+            for statement in MIGRATIONS[number]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number + 1}")
+    return max(version, SCHEMA_VERSION)
+
+def init_db(bind=engine):
+    """Initialize database tables and migrate existing databases"""
+    with bind.connect() as conn:
+        tables = set(conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'").scalars())
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    if version == SCHEMA_VERSION and tables.issuperset(Base.metadata.tables):
+        # Up to date: opening a shard (see shards.py) should not cost more
+        return
+    is_new = "workouts" not in tables
+    Base.metadata.create_all(bind=bind)
+    if is_new:
+        # create_all already built the current schema
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    else:
+        run_migrations(bind)
@@ -0,0 +1,196 @@
+"""Streaming export of workouts, meals, body measurements and foods to CSV or Parquet.
+
+Rows are read from the database in batches and encoded as they arrive, so
+memory stays flat whatever the size of the export and the first bytes are
+ready before the query has finished. Columns are the importer's, so an
+exported file can be imported again as is. Parquet output, one row group
+per batch, uses pyarrow. Workouts and meals in
+archived months (see archive.py) are exported before the rest.
+
+Usage:
+
+    python exporter.py workouts workouts.csv
+    python exporter.py meals meals.parquet --start 2024-01-01 --end 2024-12-31
+    python exporter.py measurements - > measurements.csv
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import String, select, type_coerce
+
+import archive
+from database import engine, init_db
+from importer import SCHEMAS
+
+DEFAULT_BATCH_SIZE = 50_000
+FORMATS = ["csv", "parquet"]
+
+def detect_format(filename):
+    """Get the export format from a file name's extension"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {filename}; expected .csv or .parquet")
+
+def column_names(entity):
+    _, columns = SCHEMAS[entity]
+    return [name for name, *_ in columns]
+
+def iter_batches(entity, start_date=None, end_date=None, bind=engine, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield lists of raw row tuples in date order, `batch_size` rows at a time
+
+    Values come back as SQLite stores them (dates as ISO text) without
+    per-value conversion. Only one batch is held in memory at a time.
+    Archived months come first, then the rows in SQLite, including any
+    logged for an archived month since. Foods have no date; they come in
+    catalog order and ignore the range.
+    """
+    model, _ = SCHEMAS[entity]
+    columns = [getattr(model, name) for name in column_names(entity)]
+    if not hasattr(model, "date"):
+        stmt = select(*columns).order_by(model.id)
+    else:
+        # The date is read as the stored text
+        columns[0] = type_coerce(model.date, String).label("date")
+        stmt = select(*columns).order_by(model.date, model.id)
+        if start_date is not None:
+            stmt = stmt.where(model.date >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(model.date <= end_date)
+
+    with bind.connect() as conn:
+        if entity in archive.MODELS:
+            archive.begin_snapshot(conn)
+            batch = []
+            for month in archive.iter_raw(conn, entity, column_names(entity), start_date, end_date):
+                batch.extend(month)
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+            if batch:
+                yield batch
+        result = conn.execute(stmt)
+        # The driver's own tuples; SQLite steps the query as they are fetched
+        while batch := result.cursor.fetchmany(batch_size):
+            yield batch
+        result.close()
+
+def stream_csv(entity, start_date=None, end_date=None, bind=engine, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield a CSV export as UTF-8 chunks, one per batch after the header"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column_names(entity))
+    for batch in iter_batches(entity, start_date, end_date, bind, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export
+        yield buffer.getvalue().encode("utf-8")
+
+class _Chunks(io.RawIOBase):
+    """Write-only sink whose bytes are collected until taken"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+def parquet_schema(entity):
+    """Get the Arrow schema of a Parquet export"""
+    import pyarrow as pa
+    arrow_types = {int: pa.int64(), float: pa.float64()}
+    _, columns = SCHEMAS[entity]
+    return pa.schema([
+        pa.field(
+            name,
+            pa.date32() if name == "date" else arrow_types.get(convert, pa.string()),
+            nullable=not required
+        )
+        for name, convert, required, _ in columns
+    ])
+
+def stream_parquet(entity, start_date=None, end_date=None, bind=engine,
+                   batch_size=DEFAULT_BATCH_SIZE, compression="zstd"):
+    """Yield a Parquet export in chunks, one row group per batch
+
+    Raises ImportError when pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from None
+
+    schema = parquet_schema(entity)
+    sink = _Chunks()
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for batch in iter_batches(entity, start_date, end_date, bind, batch_size):
+            arrays = [
+                pa.array(values, pa.string()).cast(field.type)
+                if pa.types.is_date(field.type) else pa.array(values, field.type)
+                for field, values in zip(schema, zip(*batch))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+def stream_export(entity, fmt, start_date=None, end_date=None, bind=engine,
+                  batch_size=DEFAULT_BATCH_SIZE):
+    """Yield an export in the given format ("csv" or "parquet")"""
+    if entity not in SCHEMAS:
+        raise ValueError(f"Unknown entity: {entity}")
+    if fmt == "csv":
+        return stream_csv(entity, start_date, end_date, bind, batch_size)
+    if fmt == "parquet":
+        return stream_parquet(entity, start_date, end_date, bind, batch_size)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export workouts, meals, body measurements or foods")
+    parser.add_argument("entity", choices=sorted(SCHEMAS))
+    parser.add_argument("path", help="output .csv or .parquet file, or - for CSV on stdout")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--start", type=date.fromisoformat, help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last date (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    fmt = args.format or ("csv" if args.path == "-" else detect_format(args.path))
+    chunks = stream_export(args.entity, fmt, args.start, args.end, batch_size=args.batch_size)
+    start = time.perf_counter()
+    written = 0
+    out = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(
+        f"✅ Exported {args.entity} ({written / 1e6:,.1f} MB) in {time.perf_counter() - start:.2f}s",
+        file=sys.stderr
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""Streaming bulk import of workouts, meals and body measurements.
+
+Rows are read lazily from CSV or JSONL (one object per line), validated
+column by column, and written in chunks: each chunk is one transaction
+holding a single executemany insert plus one aggregate `daily_summary`
+update, so memory and lock time stay bounded whatever the file size. Measurements are upserted
+on their unique date, and foods (the nutrition catalog) on their name.
+Column names are the model attribute names, e.g.
+
+    date,exercise_type,duration,calories_burned,notes
+    2024-03-01,Running,45,450,5km morning run
+
+Usage:
+
+    python importer.py workouts history.csv
+    python importer.py meals meals.jsonl --chunk-size 20000
+    python importer.py foods nutrition.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from itertools import repeat
+from operator import itemgetter
+
+from sqlalchemy import func, select
+
+from database import engine, init_db
+from models import Workout, Meal, BodyMeasurement, Food, calculate_bmi
+import catalog
+import summary
+import versions
+
+DEFAULT_CHUNK_SIZE = 50_000
+MAX_REPORTED_ERRORS = 20
+
+def _date(value):
+    # Normalised to the ISO text SQLAlchemy stores Date columns as on SQLite
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value)).isoformat()
+
+def _text(value):
+    return str(value).strip() or None
+
+# entity -> (model, [(column, converter, required, minimum)])
+SCHEMAS = {
+    "workouts": (Workout, [
+        ("date", _date, True, None),
+        ("exercise_type", _text, True, None),
+        ("duration", int, True, 1),
+        ("calories_burned", int, True, 0),
+        ("notes", _text, False, None),
+    ]),
+    "meals": (Meal, [
+        ("date", _date, True, None),
+        ("meal_type", _text, True, None),
+        ("food_name", _text, True, None),
+        ("calories", int, True, 0),
+        ("protein", float, False, 0),
+        ("carbs", float, False, 0),
+        ("fats", float, False, 0),
+    ]),
+    "measurements": (BodyMeasurement, [
+        ("date", _date, True, None),
+        ("weight", float, True, 0),
+        ("height", float, False, 0),
+        ("bmi", float, False, 0),
+        ("body_fat_percentage", float, False, 0),
+        ("notes", _text, False, None),
+    ]),
+    "foods": (Food, [
+        ("name", _text, True, None),
+        ("calories", int, True, 0),
+        ("protein", float, False, 0),
+        ("carbs", float, False, 0),
+        ("fats", float, False, 0),
+    ]),
+}
+
+@dataclass
+class ImportResult:
+    """Outcome of an import, updated after every chunk"""
+    entity: str
+    inserted: int = 0
+    rejected: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)  # (row number, message)
+
+    @property
+    def processed(self):
+        return self.inserted + self.rejected
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+def detect_format(filename):
+    """Get the import format from a file name's extension"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {filename}; expected .csv or .jsonl")
+
+def read_rows(stream, fmt, entity):
+    """Yield raw values in schema column order from a CSV or JSONL stream
+
+    Lines that cannot be parsed are yielded as ValueError instances, so they
+    are counted as rejected rows instead of aborting the import.
+    """
+    _, columns = SCHEMAS[entity]
+    names = [name for name, *_ in columns]
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    if fmt == "csv":
+        reader = csv.reader(stream)
+        header = [name.strip() for name in next(reader, [])]
+        missing = [name for name, _, required, _ in columns if required and name not in header]
+        if missing:
+            raise ValueError(f"CSV header is missing {', '.join(missing)}")
+        positions = [header.index(name) if name in header else None for name in names]
+        if None in positions:
+            def pick(row):
+                return [row[i] if i is not None else None for i in positions]
+        else:
+            pick = itemgetter(*positions)
+        for row in reader:
+            if len(row) == len(header):
+                yield pick(row)
+            elif row:
+                yield ValueError(f"expected {len(header)} fields, got {len(row)}")
+    elif fmt == "jsonl":
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield ValueError(f"malformed JSON: {exc.msg}")
+                continue
+            if isinstance(record, dict):
+                yield [record.get(name) for name in names]
+            else:
+                yield ValueError("expected a JSON object")
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def _missing(raw):
+    return raw is None or (isinstance(raw, str) and not raw.strip())
+
+def _validate_value(name, convert, required, minimum, raw):
+    if _missing(raw):
+        if required:
+            raise ValueError(f"missing {name}")
+        return None
+    try:
+        value = convert(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid {name}: {raw!r}") from None
+    if required and value is None:
+        raise ValueError(f"missing {name}")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return value
+
+def validate(entity, raw_values):
+    """Convert one row of raw values into column values, or raise ValueError"""
+    _, columns = SCHEMAS[entity]
+    return [
+        _validate_value(name, convert, required, minimum, raw)
+        for (name, convert, required, minimum), raw in zip(columns, raw_values)
+    ]
+
+def _convert_column(raw_values, convert, required, minimum):
+    """Convert a whole column at once, raising on the first bad value
+
+    Dates, types and amounts repeat a lot, so each distinct raw value is
+    converted only once.
+    """
+    if required:
+        distinct = set(raw_values)
+        # str(None) would pass as text
+        if any(_missing(raw) for raw in distinct):
+            raise ValueError
+        converted = {raw: convert(raw) for raw in distinct}
+        if None in converted.values():
+            raise ValueError
+    else:
+        converted = {
+            raw: None if _missing(raw) else convert(raw) for raw in set(raw_values)
+        }
+    present = [value for value in converted.values() if value is not None]
+    if minimum is not None and present and min(present) < minimum:
+        raise ValueError
+    return list(map(converted.__getitem__, raw_values))
+
+def _validate_columns(schema, rows, row_numbers):
+    """Validate column by column, checking each distinct value once, and
+    drop the rows holding a bad one
+
+    A row is reported with the error of its first bad column, as `validate`
+    would. Raises TypeError on unhashable values.
+    """
+    bad = {}  # row index -> message
+    checked = []
+    for (name, convert, required, minimum), raw_values in zip(schema, zip(*rows)):
+        try:
+            # Usually only one or two columns hold the bad values
+            checked.append(_convert_column(raw_values, convert, required, minimum))
+            continue
+        except ValueError:
+            pass
+        converted, failed = {}, {}
+        for raw in set(raw_values):
+            try:
+                converted[raw] = _validate_value(name, convert, required, minimum, raw)
+            except ValueError as exc:
+                failed[raw] = str(exc)
+        for index, raw in enumerate(raw_values):
+            if raw in failed:
+                bad.setdefault(index, failed[raw])
+        checked.append([converted.get(raw) for raw in raw_values])
+    keep = [index for index in range(len(rows)) if index not in bad]
+    columns = [[values[index] for index in keep] for values in checked]
+    errors = [(row_numbers[index], bad[index]) for index in sorted(bad)]
+    return columns, errors
+
+def validate_chunk(entity, rows, row_numbers):
+    """Validate a chunk of raw rows, returning (value columns, errors)
+
+    Clean chunks are converted column by column with aggregate checks; a
+    chunk with any bad value is checked value by value to find and report
+    the culprits, row by row when values are not hashable (JSON lists).
+    """
+    _, schema = SCHEMAS[entity]
+    try:
+        columns = [
+            _convert_column(raw_values, convert, required, minimum)
+            for (_, convert, required, minimum), raw_values in zip(schema, zip(*rows))
+        ]
+        errors = []
+    except (TypeError, ValueError):
+        try:
+            columns, errors = _validate_columns(schema, rows, row_numbers)
+        except TypeError:
+            valid, errors = [], []
+            for row_number, row in zip(row_numbers, rows):
+                try:
+                    valid.append(validate(entity, row))
+                except ValueError as exc:
+                    errors.append((row_number, str(exc)))
+            columns = [list(values) for values in zip(*valid)] or [[] for _ in schema]
+    if entity == "measurements":
+        # Fill in BMI from weight and height when the file does not have it
+        columns[3] = [
+            calculate_bmi(weight, height) if bmi is None and height else bmi
+            for weight, height, bmi in zip(columns[1], columns[2], columns[3])
+        ]
+    return columns, errors
+
+def _insert_sql(entity):
+    model, columns = SCHEMAS[entity]
+    names = [name for name, *_ in columns]
+    if model is not Food:
+        names.append("created_at")
+    sql = (
+        f"INSERT INTO {model.__tablename__} ({', '.join(names)}) "
+        f"VALUES ({', '.join('?' * len(names))})"
+    )
+    if entity == "measurements":
+        # Like the form's update path: replace the values, keep created_at
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:-1])
+        sql += f" ON CONFLICT (date) DO UPDATE SET {updates}"
+    elif entity == "foods":
+        # The dataset's values replace any existing ones, keeping times_logged
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:])
+        sql += f" ON CONFLICT (name) DO UPDATE SET {updates}"
+    return sql
+
+def _timestamp():
+    # Same storage format SQLAlchemy uses for DateTime columns on SQLite
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def insert_columns(conn, entity, columns, created_at=None):
+    """Insert one chunk and its daily_summary totals on an open transaction
+
+    `columns` holds one list of already validated values per schema column,
+    with dates as ISO text. Returns the number of rows written.
+    """
+    created_at = created_at or _timestamp()
+    model, _ = SCHEMAS[entity]
+    if model is Food:
+        params = list(zip(*columns))
+    else:
+        # Date order keeps the date index inserts local; the sort is stable, so
+        # the last of several measurements on one date still wins the upsert
+        params = sorted(zip(*columns, repeat(created_at)), key=itemgetter(0))
+    if not params:
+        return 0
+    conn.exec_driver_sql(_insert_sql(entity), params)
+    if model in (Workout, Meal):
+        # The write lock is held since the insert, so the new ids are
+        # the last len(params) ones
+        last_id = conn.execute(select(func.max(model.id))).scalar()
+        summary.add_inserted(conn, model, last_id - len(params))
+        if model is Meal:
+            catalog.add_inserted(conn, last_id - len(params))
+    versions.touch(conn, *((entity, "foods") if model is Meal else (entity,)))
+    return len(params)
+
+def write_columns(entity, columns, bind=engine, created_at=None):
+    """Insert one chunk and its daily_summary totals in a single transaction"""
+    if not columns or not columns[0]:
+        return 0
+    with bind.begin() as conn:
+        return insert_columns(conn, entity, columns, created_at)
+
+def import_rows(entity, rows, bind=engine, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Validate and insert an iterable of raw rows in bounded transactions
+
+    `progress(result)` is called after every chunk. Invalid rows are counted
+    and skipped; the first few are reported in `result.errors`.
+    """
+    if entity not in SCHEMAS:
+        raise ValueError(f"Unknown entity: {entity}")
+    result = ImportResult(entity)
+    created_at = _timestamp()
+    start = time.perf_counter()
+    chunk, row_numbers = [], []
+
+    def reject(row_number, message):
+        result.rejected += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append((row_number, message))
+
+    def flush():
+        columns, errors = validate_chunk(entity, chunk, row_numbers)
+        for row_number, message in errors:
+            reject(row_number, message)
+        result.inserted += write_columns(entity, columns, bind, created_at)
+        chunk.clear()
+        row_numbers.clear()
+        result.elapsed = time.perf_counter() - start
+        if progress:
+            progress(result)
+
+    for row_number, row in enumerate(rows, start=1):
+        if isinstance(row, ValueError):
+            reject(row_number, str(row))
+            continue
+        chunk.append(row)
+        row_numbers.append(row_number)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def import_file(entity, stream, fmt, bind=engine, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Import a CSV or JSONL stream"""
+    return import_rows(
+        entity, read_rows(stream, fmt, entity), bind=bind, chunk_size=chunk_size, progress=progress
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import workouts, meals, body measurements or foods")
+    parser.add_argument("entity", choices=sorted(SCHEMAS))
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    def report(result):
+        print(
+            f"\r{result.processed:,} rows ({result.rows_per_second:,.0f} rows/s)",
+            end="", file=sys.stderr, flush=True
+        )
+
+    init_db()
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, newline="", encoding="utf-8-sig") as f:
+        result = import_file(args.entity, f, fmt, chunk_size=args.chunk_size, progress=report)
+    print(file=sys.stderr)
+    print(
+        f"✅ Imported {result.inserted:,} {args.entity}, rejected {result.rejected:,} "
+        f"in {result.elapsed:.2f}s ({result.rows_per_second:,.0f} rows/s)"
+    )
+    for row_number, message in result.errors:
+        print(f"  row {row_number}: {message}")
+
+if __name__ == "__main__":
+    main()
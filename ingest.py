@@ -0,0 +1,276 @@
+"""HTTP batch ingest for device data: workouts and body measurements.
+
+Watches and smart scales post their readings in batches rather than one
+form submit per record:
+
+    POST /ingest
+    Idempotency-Key: 3f0c9a52-...        (optional, recommended)
+
+    {"workouts": [{"date": "2024-03-01", "exercise_type": "Running",
+                   "duration": 45, "calories_burned": 450}, ...],
+     "measurements": [{"date": "2024-03-01", "weight": 74.8}, ...]}
+
+Records have the importer's columns and are validated the same way. A
+batch is written in one transaction: one executemany insert per entity
+plus the daily_summary update, with measurements upserted on their date.
+The response counts accepted and rejected records and lists the first
+errors by entity and position. Invalid records are skipped, not fatal.
+
+A request retried with the same Idempotency-Key is not applied twice: the
+key is claimed in the batch's transaction and the first response is
+returned again. Keys are kept for KEY_RETENTION_DAYS.
+
+    python ingest.py --port 8502
+    curl -X POST localhost:8502/ingest -H "Idempotency-Key: $(uuidgen)" -d @batch.json
+"""
+import argparse
+import gc
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from database import create_sqlite_engine, engine, init_db
+from models import IngestRequest
+import importer
+
+ENTITIES = ["workouts", "measurements"]
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_RECORDS = 50_000
+MAX_REPORTED_ERRORS = 20
+KEY_RETENTION_DAYS = 7
+# Seconds between deletions of expired idempotency keys
+PRUNE_INTERVAL = 3600
+# Seconds between WAL checkpoints, which the server runs instead of commits
+CHECKPOINT_INTERVAL = 1.0
+
+class IngestError(Exception):
+    """A request the service refuses as a whole, with its HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+@dataclass
+class IngestResult:
+    """Outcome of one batch"""
+    accepted: dict = field(default_factory=lambda: dict.fromkeys(ENTITIES, 0))
+    rejected: dict = field(default_factory=lambda: dict.fromkeys(ENTITIES, 0))
+    errors: list = field(default_factory=list)  # {"entity", "index", "message"}
+
+    def reject(self, entity, index, message):
+        self.rejected[entity] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"entity": entity, "index": index, "message": message})
+
+    def as_dict(self):
+        return {"accepted": self.accepted, "rejected": self.rejected, "errors": self.errors}
+
+def parse_batch(payload):
+    """Validate a decoded request body, returning ({entity: columns}, IngestResult)"""
+    if not isinstance(payload, dict):
+        raise IngestError(400, "expected a JSON object with workouts and/or measurements")
+    unknown = sorted(set(payload) - set(ENTITIES))
+    if unknown:
+        raise IngestError(400, f"unknown keys: {', '.join(unknown)}")
+    for entity in ENTITIES:
+        if not isinstance(payload.get(entity, []), list):
+            raise IngestError(400, f"{entity} must be a list")
+    if sum(len(payload.get(entity, [])) for entity in ENTITIES) > MAX_RECORDS:
+        raise IngestError(413, f"at most {MAX_RECORDS:,} records per request")
+
+    result = IngestResult()
+    columns = {}
+    for entity in ENTITIES:
+        _, schema = importer.SCHEMAS[entity]
+        names = [name for name, *_ in schema]
+        rows, indexes = [], []
+        for index, record in enumerate(payload.get(entity, [])):
+            if isinstance(record, dict):
+                rows.append([record.get(name) for name in names])
+                indexes.append(index)
+            else:
+                result.reject(entity, index, "expected a JSON object")
+        if rows:
+            columns[entity], errors = importer.validate_chunk(entity, rows, indexes)
+            for index, message in errors:
+                result.reject(entity, index, message)
+    result.errors.sort(key=lambda error: (ENTITIES.index(error["entity"]), error["index"]))
+    return columns, result
+
+class _AlreadyClaimed(Exception):
+    pass
+
+# One batch transaction at a time per process: request threads queue here
+# instead of in SQLite's busy handler, which sleeps up to 100 ms per try
+_write_lock = threading.Lock()
+
+def _stored_response(conn, key, body_hash):
+    row = conn.execute(
+        select(IngestRequest.body_hash, IngestRequest.response).where(IngestRequest.key == key)
+    ).first()
+    if row is None:
+        return None
+    if row.body_hash != body_hash:
+        raise IngestError(409, "Idempotency-Key was already used for a different request")
+    return json.loads(row.response)
+
+def ingest(body, key=None, bind=engine):
+    """Apply one request body, returning (response, replayed)
+
+    Raises IngestError for requests refused as a whole.
+    """
+    body_hash = hashlib.sha256(body).hexdigest()
+    if key:
+        with bind.connect() as conn:
+            stored = _stored_response(conn, key, body_hash)
+        if stored is not None:
+            return stored, True
+
+    try:
+        payload = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise IngestError(400, f"malformed JSON: {exc}") from None
+    columns, result = parse_batch(payload)
+
+    try:
+        with _write_lock, bind.begin() as conn:
+            if key:
+                # Taking the write lock with the claim: a concurrent retry
+                # waits here and then finds the key taken
+                claim = conn.execute(insert(IngestRequest).values(
+                    key=key, body_hash=body_hash
+                ).on_conflict_do_nothing())
+                if not claim.rowcount:
+                    raise _AlreadyClaimed
+            for entity, entity_columns in columns.items():
+                result.accepted[entity] = importer.insert_columns(conn, entity, entity_columns)
+            response = result.as_dict()
+            if key:
+                conn.execute(update(IngestRequest).where(IngestRequest.key == key).values(
+                    response=json.dumps(response)
+                ))
+    except _AlreadyClaimed:
+        with bind.connect() as conn:
+            return _stored_response(conn, key, body_hash), True
+    return response, False
+
+def prune_keys(bind=engine, days=KEY_RETENTION_DAYS):
+    """Delete idempotency keys older than `days`, returning how many"""
+    with bind.begin() as conn:
+        return conn.execute(delete(IngestRequest).where(
+            IngestRequest.created_at < datetime.utcnow() - timedelta(days=days)
+        )).rowcount
+
+class IngestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for devices posting in a row
+    # Headers and body go out in two writes; with Nagle on, the second
+    # waits for the client's delayed ACK, some 40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/ingest":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": f"request body over {MAX_BODY_BYTES // 2**20} MB"})
+            return
+        body = self.rfile.read(length)
+        try:
+            response, replayed = ingest(body, self.headers.get("Idempotency-Key"), self.server.bind)
+        except IngestError as exc:
+            self._send(exc.status, {"error": exc.message})
+        except OperationalError as exc:
+            # e.g. "database is locked" after the busy timeout; safe to retry
+            self._send(503, {"error": str(exc.orig)}, {"Retry-After": "1"})
+        else:
+            self._send(200, response, {"Idempotent-Replayed": "true"} if replayed else {})
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def _defer_checkpoints(dbapi_connection, connection_record):
+    # By default the commit that fills the WAL past 1000 pages copies it
+    # back into the database and syncs it, stalling that request
+    dbapi_connection.execute("PRAGMA wal_autocheckpoint = 0")
+
+class IngestServer(ThreadingHTTPServer):
+    """Threaded HTTP server writing to one database"""
+    daemon_threads = True
+
+    def __init__(self, address, bind=engine, verbose=False):
+        super().__init__(address, IngestHandler)
+        self.bind = bind
+        self.verbose = verbose
+        self._pruned = 0.0
+        self._checkpointed = 0.0
+        event.listen(bind, "connect", _defer_checkpoints)
+        bind.dispose()
+
+    def service_actions(self):
+        # Called by serve_forever between requests
+        now = time.monotonic()
+        if now - self._checkpointed > CHECKPOINT_INTERVAL:
+            self._checkpointed = now
+            with self.bind.connect() as conn:
+                # Copies most of the log alongside the batches, then the
+                # rest between two of them, so the next batch starts the
+                # log over instead of growing it
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+                with _write_lock:
+                    conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+        if now - self._pruned > PRUNE_INTERVAL:
+            self._pruned = now
+            prune_keys(self.bind)
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP batch ingest for workouts and body measurements")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--database", help="SQLAlchemy URL (default: the app's fittrack.db)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    bind = create_sqlite_engine(args.database) if args.database else engine
+    init_db(bind)
+    server = IngestServer((args.host, args.port), bind, args.verbose)
+    # Each batch allocates thousands of dicts, and every few batches a full
+    # collection would walk the modules and SQLAlchemy objects loaded above
+    gc.freeze()
+    print(f"✅ Ingest service listening on http://{args.host}:{args.port}/ingest")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
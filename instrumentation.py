@@ -0,0 +1,155 @@
+"""SQL query instrumentation: per-rerun query logs and a slow-query log.
+
+`instrument(engine)` hooks SQLAlchemy's cursor events. Every statement is
+timed and, when it takes longer than `SLOW_QUERY_MS`, appended to the
+slow-query log file. While a rerun is being recorded (`start_recording`),
+statements are also collected with their row count and the section that
+issued them, which the developer panel in app.py summarises. Outside a
+recording a statement costs two clock reads and remembering when it
+started; only a slow one gets a record.
+
+Configuration (environment variables):
+    FITTRACK_SLOW_QUERY_MS   threshold in milliseconds, 0 disables (default 200)
+    FITTRACK_SLOW_QUERY_LOG  log file path (default slow_queries.log)
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("FITTRACK_SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG = os.environ.get("FITTRACK_SLOW_QUERY_LOG", "slow_queries.log")
+
+slow_query_logger = logging.getLogger("fittrack.slow_queries")
+
+_section = ContextVar("query_section", default=None)
+_recording = ContextVar("query_log", default=None)
+_last = ContextVar("last_query", default=None)
+
+@dataclass
+class QueryRecord:
+    statement: str
+    section: str
+    started: float
+    duration_ms: float
+    rows: int = None
+    logged_slow: bool = False
+
+class QueryLog:
+    """Statements issued during one recording, e.g. one rerun"""
+
+    def __init__(self):
+        self.records = []
+
+    @property
+    def total_ms(self):
+        return sum(record.duration_ms for record in self.records)
+
+    @property
+    def total_rows(self):
+        return sum(record.rows or 0 for record in self.records)
+
+    def slowest(self, n=10):
+        """Get the `n` slowest statements, slowest first"""
+        return sorted(self.records, key=lambda r: r.duration_ms, reverse=True)[:n]
+
+    def by_section(self):
+        """Get {section: (statement count, total ms)}"""
+        totals = {}
+        for record in self.records:
+            count, ms = totals.get(record.section, (0, 0.0))
+            totals[record.section] = (count + 1, ms + record.duration_ms)
+        return totals
+
+@contextmanager
+def section(name):
+    """Attribute the statements issued inside the block to `name`"""
+    token = _section.set(name)
+    try:
+        yield
+    finally:
+        _section.reset(token)
+
+def start_recording():
+    """Start collecting statements in the current context, returning the log"""
+    log = QueryLog()
+    _recording.set(log)
+    return log
+
+def stop_recording():
+    _recording.set(None)
+
+def note_fetched(rows):
+    """Complete the last SELECT once its rows have been fetched
+
+    SQLite reports no row count for SELECTs and streams rows after execute,
+    so readers call this to record the count and the time including fetch.
+    """
+    record = _last.get()
+    if isinstance(record, tuple):
+        # Not recorded at execute: recorded now only if the fetch made it slow
+        _last.set(None)
+        statement, started = record
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= SLOW_QUERY_MS:
+            _check_slow(QueryRecord(statement, _section.get() or "unattributed", started, duration_ms, rows))
+    elif record is not None and record.rows is None:
+        record.rows = rows
+        record.duration_ms = (time.perf_counter() - record.started) * 1000
+        _check_slow(record)
+
+def _check_slow(record):
+    if SLOW_QUERY_MS and record.duration_ms >= SLOW_QUERY_MS and not record.logged_slow:
+        record.logged_slow = True
+        statement = " ".join(record.statement.split())
+        slow_query_logger.warning(
+            "%.1f ms | %s | rows=%s | %s",
+            record.duration_ms, record.section, record.rows, statement
+        )
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start_time"].pop()
+    duration_ms = (time.perf_counter() - started) * 1000
+    log = _recording.get()
+    if log is None and not (SLOW_QUERY_MS and duration_ms >= SLOW_QUERY_MS):
+        # Kept for note_fetched, which times a SELECT's fetch too
+        _last.set((statement, started) if SLOW_QUERY_MS else None)
+        return
+    rowcount = cursor.rowcount
+    record = QueryRecord(
+        statement=statement,
+        section=_section.get() or "unattributed",
+        started=started,
+        duration_ms=duration_ms,
+        rows=rowcount if rowcount >= 0 else None,
+    )
+    _last.set(record)
+    if log is not None:
+        log.records.append(record)
+    _check_slow(record)
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get("query_start_time") if context.connection else None
+    if starts:
+        starts.pop()
+
+def instrument(engine):
+    """Attach the timing hooks and the slow-query log file to an engine"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    if SLOW_QUERY_MS and SLOW_QUERY_LOG and not slow_query_logger.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG, delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.propagate = False
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
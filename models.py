@@ -1,9 +1,24 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, DDL, event, text
 from datetime import datetime
 from database import Base
 
+def calculate_bmi(weight, height):
+    """Calculate BMI from weight (kg) and height (cm)"""
+    if height > 0:
+        height_m = height / 100
+        return round(weight / (height_m ** 2), 2)
+    return None
+
 class Workout(Base):
     __tablename__ = "workouts"
+    __table_args__ = (
+        # Leading `date` column also serves the plain date-range filters
+        Index("ix_workouts_date_exercise_type", "date", "exercise_type"),
+        # Keyset pagination order of the history tables
+        Index("ix_workouts_date_id", "date", "id"),
+        # Ids stay unique across the hot table and the archive
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
@@ -18,6 +33,11 @@ class Workout(Base):
 
 class Meal(Base):
     __tablename__ = "meals"
+    __table_args__ = (
+        Index("ix_meals_date_meal_type", "date", "meal_type"),
+        Index("ix_meals_date_id", "date", "id"),
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
@@ -46,3 +66,152 @@ class BodyMeasurement(Base):
     
     def __repr__(self):
         return f"<BodyMeasurement(date='{self.date}', weight={self.weight})>"
+
+class DailySummary(Base):
+    __tablename__ = "daily_summary"
+    
+    date = Column(Date, primary_key=True)
+    workout_count = Column(Integer, nullable=False, default=0)
+    workout_duration = Column(Integer, nullable=False, default=0)  # in minutes
+    calories_burned = Column(Integer, nullable=False, default=0)
+    meal_count = Column(Integer, nullable=False, default=0)
+    calories_consumed = Column(Integer, nullable=False, default=0)
+    protein = Column(Float, nullable=False, default=0.0)  # in grams
+    carbs = Column(Float, nullable=False, default=0.0)  # in grams
+    fats = Column(Float, nullable=False, default=0.0)  # in grams
+    
+    def __repr__(self):
+        return f"<DailySummary(date='{self.date}', workouts={self.workout_count}, meals={self.meal_count})>"
+
+class DayChange(Base):
+    """A day whose daily_summary or body_measurements row changed, logged by
+    triggers in commit order so readers can catch up from the last id they saw"""
+    __tablename__ = "day_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+
+# Log entries kept; a reader further behind reads everything again
+DAY_CHANGES_KEEP = 100_000
+
+DAY_CHANGE_DDL = [
+    *(
+        f"CREATE TRIGGER IF NOT EXISTS {table}_{event_name}_day AFTER {event_name.upper()} ON {table} "
+        f"BEGIN INSERT INTO day_changes (date) VALUES ({row}.date); END"
+        for table in ("daily_summary", "body_measurements")
+        for event_name, row in (("insert", "new"), ("update", "new"), ("delete", "old"))
+    ),
+    # Amortised: one range delete per 1024 entries (no "%": DDL() formats the text)
+    "CREATE TRIGGER IF NOT EXISTS day_changes_prune AFTER INSERT ON day_changes "
+    f"WHEN (new.id & 1023) = 0 BEGIN DELETE FROM day_changes WHERE id <= new.id - {DAY_CHANGES_KEEP}; END",
+]
+
+class IngestRequest(Base):
+    __tablename__ = "ingest_requests"
+    
+    key = Column(String, primary_key=True)  # the client's Idempotency-Key
+    body_hash = Column(String, nullable=False)  # SHA-256 of the request body
+    response = Column(String, nullable=True)  # JSON sent back, replayed on retries
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<IngestRequest(key='{self.key}', created_at='{self.created_at}')>"
+
+class ArchivedMonth(Base):
+    __tablename__ = "archived_months"
+    
+    entity = Column(String, primary_key=True)  # "workouts" or "meals"
+    month = Column(Date, primary_key=True)  # first day of the month
+    file = Column(String, nullable=False)  # Parquet file in the entity's archive folder
+    rows = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ArchivedMonth(entity='{self.entity}', month='{self.month}', rows={self.rows})>"
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    
+    entity = Column(String, primary_key=True)  # "workouts", "meals", "measurements" or "foods"
+    version = Column(Integer, nullable=False)  # random token, replaced by every write (see versions.py)
+    
+    def __repr__(self):
+        return f"<DataVersion(entity='{self.entity}', version={self.version})>"
+
+class BulkOperation(Base):
+    __tablename__ = "bulk_operations"
+    
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)  # "workouts" or "meals"
+    action = Column(String, nullable=False)  # "delete", "edit" or "undo"
+    field = Column(String, nullable=True)  # edited column
+    value = Column(String, nullable=True)  # new value of the edited column, as text
+    description = Column(String, nullable=False)  # the rows' filter, for the journal list
+    rows = Column(Integer, nullable=False)
+    first_date = Column(Date, nullable=True)  # earliest date the operation changed
+    undoes = Column(Integer, nullable=True)  # the operation an "undo" reverted
+    status = Column(String, nullable=False, default="applied")  # "applied", "undone" or "expired"
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<BulkOperation(id={self.id}, action='{self.action}', rows={self.rows})>"
+
+class BulkUndoRow(Base):
+    __tablename__ = "bulk_undo_rows"
+    
+    operation_id = Column(Integer, primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    data = Column(String, nullable=False)  # JSON of the values the operation changed
+    
+    def __repr__(self):
+        return f"<BulkUndoRow(operation_id={self.operation_id}, row_id={self.row_id})>"
+
+class Food(Base):
+    __tablename__ = "foods"
+    __table_args__ = (
+        # Foods the user has logged, most often logged first
+        Index("ix_foods_times_logged", "times_logged", sqlite_where=text("times_logged > 0")),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(collation="NOCASE"), nullable=False, unique=True)
+    calories = Column(Integer, nullable=False)  # per serving
+    protein = Column(Float, nullable=True)  # in grams
+    carbs = Column(Float, nullable=True)  # in grams
+    fats = Column(Float, nullable=True)  # in grams
+    times_logged = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    def __repr__(self):
+        return f"<Food(name='{self.name}', calories={self.calories})>"
+
+# FTS5 index of food names for prefix search. It reads the names from
+# `foods` (external content) and triggers keep it in sync, so rows inserted
+# by any path are searchable once committed. Prefixes of 2 and 3 characters
+# get their own index entries, which keeps short, broad queries fast.
+FOOD_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5("
+    "name, content='foods', content_rowid='id', prefix='2 3', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS foods_fts_insert AFTER INSERT ON foods BEGIN "
+    "INSERT INTO foods_fts (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS foods_fts_delete AFTER DELETE ON foods BEGIN "
+    "INSERT INTO foods_fts (foods_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS foods_fts_update AFTER UPDATE OF name ON foods BEGIN "
+    "INSERT INTO foods_fts (foods_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO foods_fts (rowid, name) VALUES (new.id, new.name); END",
+]
+
+for statement in FOOD_SEARCH_DDL:
+    event.listen(Food.__table__, "after_create", DDL(statement))
+
+# Once every table exists, the watched ones included
+for statement in DAY_CHANGE_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement))
+
+# Every entity starts with a random token too, so a database file created
+# again under the same path never repeats the tokens of the one before
+event.listen(DataVersion.__table__, "after_create", DDL(
+    "INSERT INTO data_versions (entity, version) VALUES "
+    "('workouts', random()), ('meals', random()), ('measurements', random()), ('foods', random())"
+))
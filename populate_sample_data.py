@@ -1,92 +1,345 @@
+"""Fill the database with sample data.
+
+By default a synthetic history is generated with NumPy: workouts, meals with
+macros and a noisy weight trend, sized by years of history and entries per
+day, and written through the bulk import path. A seed makes runs repeatable,
+so the same dataset can be regenerated to measure performance changes. With
+--users, user<i>@example.com each get a shard (see shards.py) of their own.
+
+    python populate_sample_data.py --years 10 --workouts-per-day 1 --meals-per-day 4
+    python populate_sample_data.py --users 50 --out-dir shards/   # FITTRACK_SHARD_DIR=shards
+    python populate_sample_data.py --demo    # the small hand-written sample
+"""
+import argparse
+import os
+import time
 from datetime import date, timedelta
-from database import get_db, init_db
-from models import Workout, Meal, BodyMeasurement
-
-init_db()
-
-db = get_db()
-
-today = date.today()
-
-print("Clearing existing data...")
-db.query(Workout).delete()
-db.query(Meal).delete()
-db.query(BodyMeasurement).delete()
-db.commit()
-
-print("Adding sample workouts...")
-sample_workouts = [
-    Workout(date=today - timedelta(days=0), exercise_type="HIIT", duration=30, calories_burned=320, notes="Intense session!"),
-    Workout(date=today - timedelta(days=1), exercise_type="Running", duration=45, calories_burned=450, notes="5km morning run"),
-    Workout(date=today - timedelta(days=2), exercise_type="Weightlifting", duration=60, calories_burned=280, notes="Leg day - squats and deadlifts"),
-    Workout(date=today - timedelta(days=3), exercise_type="Yoga", duration=50, calories_burned=150, notes="Relaxing flow"),
-    Workout(date=today - timedelta(days=4), exercise_type="Cycling", duration=90, calories_burned=550, notes="Long ride in the park"),
-    Workout(date=today - timedelta(days=5), exercise_type="Swimming", duration=40, calories_burned=380, notes="Great pool session"),
-    Workout(date=today - timedelta(days=6), exercise_type="CrossFit", duration=45, calories_burned=400, notes="Box jumps and burpees"),
-    Workout(date=today - timedelta(days=7), exercise_type="Running", duration=35, calories_burned=350, notes="Easy recovery run"),
-    Workout(date=today - timedelta(days=8), exercise_type="Weightlifting", duration=65, calories_burned=300, notes="Upper body focus"),
-    Workout(date=today - timedelta(days=10), exercise_type="HIIT", duration=25, calories_burned=280, notes="Quick morning burn"),
-    Workout(date=today - timedelta(days=12), exercise_type="Basketball", duration=60, calories_burned=420, notes="Pickup game with friends"),
-    Workout(date=today - timedelta(days=14), exercise_type="Pilates", duration=45, calories_burned=180, notes="Core strength"),
-    Workout(date=today - timedelta(days=16), exercise_type="Running", duration=50, calories_burned=500, notes="10km personal record!"),
-    Workout(date=today - timedelta(days=18), exercise_type="Weightlifting", duration=70, calories_burned=320, notes="Full body workout"),
-    Workout(date=today - timedelta(days=20), exercise_type="Cycling", duration=60, calories_burned=450, notes="Spin class"),
-    Workout(date=today - timedelta(days=22), exercise_type="Swimming", duration=45, calories_burned=400, notes="Interval training"),
-    Workout(date=today - timedelta(days=25), exercise_type="HIIT", duration=30, calories_burned=310, notes="Tabata style"),
-    Workout(date=today - timedelta(days=28), exercise_type="Running", duration=40, calories_burned=380, notes="Trail run"),
+
+import numpy as np
+from sqlalchemy import delete, update
+
+import archive
+from database import engine, get_db, init_db
+from models import Workout, Meal, BodyMeasurement, DailySummary, Food, ArchivedMonth
+from catalog import seed_from_meals
+from importer import write_columns
+from summary import rebuild_daily_summary
+import shards
+import versions
+
+# (name, share of workouts, mean duration in minutes, calories per minute)
+EXERCISES = [
+    ("Running", 0.20, 40, 10.5),
+    ("Cycling", 0.14, 55, 8.0),
+    ("Swimming", 0.07, 40, 9.0),
+    ("Weightlifting", 0.18, 60, 5.0),
+    ("Yoga", 0.09, 50, 3.0),
+    ("Pilates", 0.05, 45, 4.0),
+    ("Walking", 0.10, 45, 4.5),
+    ("HIIT", 0.08, 30, 11.0),
+    ("CrossFit", 0.04, 45, 9.5),
+    ("Basketball", 0.02, 60, 7.5),
+    ("Soccer", 0.01, 75, 8.5),
+    ("Tennis", 0.01, 60, 7.0),
+    ("Other", 0.01, 40, 5.0),
 ]
 
-for workout in sample_workouts:
-    db.add(workout)
+# (name, share of meals, median calories, foods)
+MEAL_TYPES = [
+    ("Breakfast", 0.27, 380, ["Oatmeal with berries", "Scrambled eggs with toast",
+                              "Greek yogurt with granola", "Protein pancakes",
+                              "Avocado toast", "Smoothie bowl"]),
+    ("Lunch", 0.27, 520, ["Grilled chicken salad", "Turkey sandwich", "Quinoa bowl",
+                          "Tuna wrap", "Chicken burrito bowl", "Caesar salad with shrimp"]),
+    ("Dinner", 0.27, 620, ["Salmon with vegetables", "Pasta with chicken",
+                           "Steak with sweet potato", "Chicken stir fry",
+                           "Beef tacos", "Grilled fish with rice"]),
+    ("Snack", 0.19, 200, ["Protein shake", "Apple with almond butter", "Mixed nuts",
+                          "Banana", "Cottage cheese", "Protein bar"]),
+]
+
+CHUNK_DAYS = 365
+# Steps of the weight recurrence solved at once; longer blocks would
+# overflow the powers of its decay
+RECURRENCE_BLOCK = 1000
+
+def _dates(start, days):
+    """ISO date strings for `days` consecutive days from `start`"""
+    return np.arange(np.datetime64(start), np.datetime64(start) + days).astype(str)
+
+def _pick(rng, table, size):
+    """Sample row indexes of a (name, share, ...) table by share"""
+    shares = np.array([row[1] for row in table])
+    return rng.choice(len(table), size=size, p=shares / shares.sum())
+
+def generate_workouts(rng, days, per_day):
+    """Columns of synthetic workouts for an array of ISO dates"""
+    counts = rng.poisson(per_day, size=len(days))
+    n = int(counts.sum())
+    kind = _pick(rng, EXERCISES, n)
+    mean_minutes = np.array([row[2] for row in EXERCISES])[kind]
+    rate = np.array([row[3] for row in EXERCISES])[kind]
+    duration = np.clip(rng.normal(mean_minutes, mean_minutes * 0.25), 10, 240).round().astype(int)
+    calories = np.clip(duration * rate * rng.normal(1.0, 0.12, n), 20, None).round().astype(int)
+    names = np.array([row[0] for row in EXERCISES], dtype=object)
+    return [
+        np.repeat(days, counts).tolist(),
+        names[kind].tolist(),
+        duration.tolist(),
+        calories.tolist(),
+        [None] * n,
+    ]
+
+def generate_meals(rng, days, per_day):
+    """Columns of synthetic meals with macros for an array of ISO dates"""
+    counts = rng.poisson(per_day, size=len(days))
+    n = int(counts.sum())
+    kind = _pick(rng, MEAL_TYPES, n)
+    median = np.array([row[2] for row in MEAL_TYPES])[kind]
+    calories = np.clip(rng.lognormal(np.log(median), 0.25), 50, 2000).round()
+    # Share of calories from protein, carbs and fats; 4, 4 and 9 kcal per gram
+    split = rng.dirichlet([3, 5, 3], size=n)
+    protein = (calories * split[:, 0] / 4).round(1)
+    carbs = (calories * split[:, 1] / 4).round(1)
+    fats = (calories * split[:, 2] / 9).round(1)
+    food = rng.integers(0, 6, size=n)
+    foods = np.array([food for row in MEAL_TYPES for food in row[3]], dtype=object)
+    return [
+        np.repeat(days, counts).tolist(),
+        np.array([row[0] for row in MEAL_TYPES], dtype=object)[kind].tolist(),
+        foods[kind * 6 + food].tolist(),
+        calories.astype(int).tolist(),
+        protein.tolist(),
+        carbs.tolist(),
+        fats.tolist(),
+    ]
+
+def _decaying_sum(steps, decay, start):
+    """Solve x[i] = decay * x[i - 1] + steps[i] from x[-1] = `start`
+
+    Solved a block at a time in closed form:
+
+        x[i] = decay**(i + 1) * (start + sum of steps[k] / decay**(k + 1) for k <= i)
+    """
+    out = np.empty(len(steps))
+    for begin in range(0, len(steps), RECURRENCE_BLOCK):
+        block = steps[begin:begin + RECURRENCE_BLOCK]
+        powers = decay ** np.arange(1, len(block) + 1)
+        out[begin:begin + len(block)] = powers * (start + np.cumsum(block / powers))
+        start = out[begin + len(block) - 1]
+    return out
+
+def generate_measurements(rng, days, every):
+    """Columns of a weight trend measured every `every` days"""
+    days = days[::every]
+    n = len(days)
+    height = round(float(rng.normal(172, 9)), 1)
+    start_weight = float(rng.normal(78, 10))
+    # Slow drift with mean reversion towards a goal weight, plus daily noise
+    goal = start_weight + rng.normal(-4, 3)
+    steps = rng.normal(0, 0.35, size=n)
+    trend = goal + _decaying_sum(steps, 0.98, start_weight - goal)
+    weight = (trend + rng.normal(0, 0.4, size=n)).round(1)
+    bmi = (weight / (height / 100) ** 2).round(2)
+    body_fat = np.clip(bmi * 1.2 - 5.4 + rng.normal(0, 1.0, size=n), 5, 50).round(1)
+    return [
+        days.tolist(),
+        weight.tolist(),
+        [height] * n,
+        bmi.tolist(),
+        body_fat.tolist(),
+        [None] * n,
+    ]
+
+def clear(bind):
+    """Delete every workout, meal, measurement and daily summary row,
+    archived months included
+
+    The food catalog stays, but no food counts as logged any more.
+    """
+    with bind.begin() as conn:
+        for model in (Workout, Meal, BodyMeasurement, DailySummary, ArchivedMonth):
+            conn.execute(delete(model))
+        conn.execute(update(Food).values(times_logged=0))
+        versions.touch(conn, *versions.ENTITIES)
+    for entity in archive.ENTITIES:
+        archive.remove_superseded(bind, entity, grace=0)
 
-print("Adding sample meals...")
-sample_meals = [
-    Meal(date=today, meal_type="Breakfast", food_name="Oatmeal with berries", calories=320, protein=12.0, carbs=58.0, fats=6.0),
-    Meal(date=today, meal_type="Lunch", food_name="Grilled chicken salad", calories=450, protein=38.0, carbs=35.0, fats=18.0),
-    Meal(date=today, meal_type="Snack", food_name="Protein shake", calories=180, protein=25.0, carbs=15.0, fats=3.0),
-    Meal(date=today, meal_type="Dinner", food_name="Salmon with vegetables", calories=520, protein=42.0, carbs=28.0, fats=26.0),
+def populate(bind, years=1, workouts_per_day=0.8, meals_per_day=4.0,
+             measure_every=3, seed=0, end=None):
+    """Generate a synthetic history ending at `end` (default today)
+
+    Rows are generated and inserted a year at a time, so memory stays flat
+    whatever the size. Returns the number of rows written per entity.
+    """
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    total_days = int(round(years * 365))
+    start = end - timedelta(days=total_days - 1)
+    counts = {"workouts": 0, "meals": 0, "measurements": 0}
+
+    # Measurements are few and their trend spans the whole history
+    all_days = _dates(start, total_days)
+    counts["measurements"] += write_columns(
+        "measurements", generate_measurements(rng, all_days, measure_every), bind
+    )
+    for offset in range(0, total_days, CHUNK_DAYS):
+        days = all_days[offset:offset + CHUNK_DAYS]
+        counts["workouts"] += write_columns(
+            "workouts", generate_workouts(rng, days, workouts_per_day), bind
+        )
+        counts["meals"] += write_columns(
+            "meals", generate_meals(rng, days, meals_per_day), bind
+        )
+    return counts
+
+def load_demo():
+    """Replace the data with a small hand-written sample of the last month"""
+    db = get_db()
     
-    Meal(date=today - timedelta(days=1), meal_type="Breakfast", food_name="Greek yogurt with granola", calories=280, protein=18.0, carbs=42.0, fats=8.0),
-    Meal(date=today - timedelta(days=1), meal_type="Lunch", food_name="Turkey sandwich", calories=380, protein=28.0, carbs=48.0, fats=12.0),
-    Meal(date=today - timedelta(days=1), meal_type="Snack", food_name="Apple with almond butter", calories=220, protein=6.0, carbs=28.0, fats=11.0),
-    Meal(date=today - timedelta(days=1), meal_type="Dinner", food_name="Pasta with chicken", calories=620, protein=35.0, carbs=72.0, fats=18.0),
+    today = date.today()
     
-    Meal(date=today - timedelta(days=2), meal_type="Breakfast", food_name="Scrambled eggs with toast", calories=340, protein=22.0, carbs=32.0, fats=14.0),
-    Meal(date=today - timedelta(days=2), meal_type="Lunch", food_name="Quinoa bowl", calories=480, protein=18.0, carbs=62.0, fats=16.0),
-    Meal(date=today - timedelta(days=2), meal_type="Dinner", food_name="Steak with sweet potato", calories=680, protein=48.0, carbs=52.0, fats=28.0),
+    print("Clearing existing data...")
+    clear(engine)
     
-    Meal(date=today - timedelta(days=3), meal_type="Breakfast", food_name="Smoothie bowl", calories=350, protein=15.0, carbs=58.0, fats=9.0),
-    Meal(date=today - timedelta(days=3), meal_type="Lunch", food_name="Tuna wrap", calories=420, protein=32.0, carbs=44.0, fats=14.0),
-    Meal(date=today - timedelta(days=3), meal_type="Dinner", food_name="Chicken stir fry", calories=540, protein=40.0, carbs=48.0, fats=20.0),
+    print("Adding sample workouts...")
+    sample_workouts = [
+        Workout(date=today - timedelta(days=0), exercise_type="HIIT", duration=30, calories_burned=320, notes="Intense session!"),
+        Workout(date=today - timedelta(days=1), exercise_type="Running", duration=45, calories_burned=450, notes="5km morning run"),
+        Workout(date=today - timedelta(days=2), exercise_type="Weightlifting", duration=60, calories_burned=280, notes="Leg day - squats and deadlifts"),
+        Workout(date=today - timedelta(days=3), exercise_type="Yoga", duration=50, calories_burned=150, notes="Relaxing flow"),
+        Workout(date=today - timedelta(days=4), exercise_type="Cycling", duration=90, calories_burned=550, notes="Long ride in the park"),
+        Workout(date=today - timedelta(days=5), exercise_type="Swimming", duration=40, calories_burned=380, notes="Great pool session"),
+        Workout(date=today - timedelta(days=6), exercise_type="CrossFit", duration=45, calories_burned=400, notes="Box jumps and burpees"),
+        Workout(date=today - timedelta(days=7), exercise_type="Running", duration=35, calories_burned=350, notes="Easy recovery run"),
+        Workout(date=today - timedelta(days=8), exercise_type="Weightlifting", duration=65, calories_burned=300, notes="Upper body focus"),
+        Workout(date=today - timedelta(days=10), exercise_type="HIIT", duration=25, calories_burned=280, notes="Quick morning burn"),
+        Workout(date=today - timedelta(days=12), exercise_type="Basketball", duration=60, calories_burned=420, notes="Pickup game with friends"),
+        Workout(date=today - timedelta(days=14), exercise_type="Pilates", duration=45, calories_burned=180, notes="Core strength"),
+        Workout(date=today - timedelta(days=16), exercise_type="Running", duration=50, calories_burned=500, notes="10km personal record!"),
+        Workout(date=today - timedelta(days=18), exercise_type="Weightlifting", duration=70, calories_burned=320, notes="Full body workout"),
+        Workout(date=today - timedelta(days=20), exercise_type="Cycling", duration=60, calories_burned=450, notes="Spin class"),
+        Workout(date=today - timedelta(days=22), exercise_type="Swimming", duration=45, calories_burned=400, notes="Interval training"),
+        Workout(date=today - timedelta(days=25), exercise_type="HIIT", duration=30, calories_burned=310, notes="Tabata style"),
+        Workout(date=today - timedelta(days=28), exercise_type="Running", duration=40, calories_burned=380, notes="Trail run"),
+    ]
     
-    Meal(date=today - timedelta(days=4), meal_type="Breakfast", food_name="Protein pancakes", calories=380, protein=28.0, carbs=48.0, fats=10.0),
-    Meal(date=today - timedelta(days=4), meal_type="Lunch", food_name="Caesar salad with shrimp", calories=460, protein=35.0, carbs=22.0, fats=24.0),
-    Meal(date=today - timedelta(days=4), meal_type="Dinner", food_name="Beef tacos", calories=580, protein=38.0, carbs=56.0, fats=22.0),
+    for workout in sample_workouts:
+        db.add(workout)
     
-    Meal(date=today - timedelta(days=5), meal_type="Breakfast", food_name="Avocado toast", calories=320, protein=12.0, carbs=38.0, fats=16.0),
-    Meal(date=today - timedelta(days=5), meal_type="Lunch", food_name="Chicken burrito bowl", calories=620, protein=42.0, carbs=68.0, fats=20.0),
-    Meal(date=today - timedelta(days=5), meal_type="Dinner", food_name="Grilled fish with rice", calories=480, protein=38.0, carbs=54.0, fats=12.0),
-]
+    print("Adding sample meals...")
+    sample_meals = [
+        Meal(date=today, meal_type="Breakfast", food_name="Oatmeal with berries", calories=320, protein=12.0, carbs=58.0, fats=6.0),
+        Meal(date=today, meal_type="Lunch", food_name="Grilled chicken salad", calories=450, protein=38.0, carbs=35.0, fats=18.0),
+        Meal(date=today, meal_type="Snack", food_name="Protein shake", calories=180, protein=25.0, carbs=15.0, fats=3.0),
+        Meal(date=today, meal_type="Dinner", food_name="Salmon with vegetables", calories=520, protein=42.0, carbs=28.0, fats=26.0),
+    
+        Meal(date=today - timedelta(days=1), meal_type="Breakfast", food_name="Greek yogurt with granola", calories=280, protein=18.0, carbs=42.0, fats=8.0),
+        Meal(date=today - timedelta(days=1), meal_type="Lunch", food_name="Turkey sandwich", calories=380, protein=28.0, carbs=48.0, fats=12.0),
+        Meal(date=today - timedelta(days=1), meal_type="Snack", food_name="Apple with almond butter", calories=220, protein=6.0, carbs=28.0, fats=11.0),
+        Meal(date=today - timedelta(days=1), meal_type="Dinner", food_name="Pasta with chicken", calories=620, protein=35.0, carbs=72.0, fats=18.0),
+    
+        Meal(date=today - timedelta(days=2), meal_type="Breakfast", food_name="Scrambled eggs with toast", calories=340, protein=22.0, carbs=32.0, fats=14.0),
+        Meal(date=today - timedelta(days=2), meal_type="Lunch", food_name="Quinoa bowl", calories=480, protein=18.0, carbs=62.0, fats=16.0),
+        Meal(date=today - timedelta(days=2), meal_type="Dinner", food_name="Steak with sweet potato", calories=680, protein=48.0, carbs=52.0, fats=28.0),
+    
+        Meal(date=today - timedelta(days=3), meal_type="Breakfast", food_name="Smoothie bowl", calories=350, protein=15.0, carbs=58.0, fats=9.0),
+        Meal(date=today - timedelta(days=3), meal_type="Lunch", food_name="Tuna wrap", calories=420, protein=32.0, carbs=44.0, fats=14.0),
+        Meal(date=today - timedelta(days=3), meal_type="Dinner", food_name="Chicken stir fry", calories=540, protein=40.0, carbs=48.0, fats=20.0),
+    
+        Meal(date=today - timedelta(days=4), meal_type="Breakfast", food_name="Protein pancakes", calories=380, protein=28.0, carbs=48.0, fats=10.0),
+        Meal(date=today - timedelta(days=4), meal_type="Lunch", food_name="Caesar salad with shrimp", calories=460, protein=35.0, carbs=22.0, fats=24.0),
+        Meal(date=today - timedelta(days=4), meal_type="Dinner", food_name="Beef tacos", calories=580, protein=38.0, carbs=56.0, fats=22.0),
+    
+        Meal(date=today - timedelta(days=5), meal_type="Breakfast", food_name="Avocado toast", calories=320, protein=12.0, carbs=38.0, fats=16.0),
+        Meal(date=today - timedelta(days=5), meal_type="Lunch", food_name="Chicken burrito bowl", calories=620, protein=42.0, carbs=68.0, fats=20.0),
+        Meal(date=today - timedelta(days=5), meal_type="Dinner", food_name="Grilled fish with rice", calories=480, protein=38.0, carbs=54.0, fats=12.0),
+    ]
+    
+    for meal in sample_meals:
+        db.add(meal)
+    
+    print("Adding sample body measurements...")
+    sample_measurements = [
+        BodyMeasurement(date=today, weight=75.2, height=175, bmi=24.55, body_fat_percentage=15.5, notes="Feeling strong"),
+        BodyMeasurement(date=today - timedelta(days=7), weight=75.8, height=175, bmi=24.75, body_fat_percentage=16.0, notes="Good progress"),
+        BodyMeasurement(date=today - timedelta(days=14), weight=76.5, height=175, bmi=24.98, body_fat_percentage=16.5),
+        BodyMeasurement(date=today - timedelta(days=21), weight=77.0, height=175, bmi=25.14, body_fat_percentage=17.0),
+        BodyMeasurement(date=today - timedelta(days=28), weight=77.5, height=175, bmi=25.31, body_fat_percentage=17.2, notes="Starting weight"),
+    ]
+    
+    for measurement in sample_measurements:
+        db.add(measurement)
+    
+    db.flush()
+    rebuild_daily_summary(db)
+    seed_from_meals(db)
+    versions.touch(db, *versions.ENTITIES)
+    db.commit()
+    db.close()
+    
+    print("✅ Sample data successfully added!")
+    print(f"Added {len(sample_workouts)} workouts")
+    print(f"Added {len(sample_meals)} meals")
+    print(f"Added {len(sample_measurements)} body measurements")
 
-for meal in sample_meals:
-    db.add(meal)
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with sample data")
+    parser.add_argument("--demo", action="store_true", help="load the small hand-written sample instead")
+    parser.add_argument("--years", type=float, default=1, help="years of history (default 1)")
+    parser.add_argument("--workouts-per-day", type=float, default=0.8)
+    parser.add_argument("--meals-per-day", type=float, default=4.0)
+    parser.add_argument("--measure-every", type=int, default=3, help="days between weigh-ins")
+    parser.add_argument("--users", type=int, default=1,
+                        help="with more than one, write a shard per user into --out-dir")
+    parser.add_argument("--out-dir", default=shards.SHARD_DIR or "shards", help="shard folder")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--append", action="store_true", help="keep existing rows")
+    args = parser.parse_args()
 
-print("Adding sample body measurements...")
-sample_measurements = [
-    BodyMeasurement(date=today, weight=75.2, height=175, bmi=24.55, body_fat_percentage=15.5, notes="Feeling strong"),
-    BodyMeasurement(date=today - timedelta(days=7), weight=75.8, height=175, bmi=24.75, body_fat_percentage=16.0, notes="Good progress"),
-    BodyMeasurement(date=today - timedelta(days=14), weight=76.5, height=175, bmi=24.98, body_fat_percentage=16.5),
-    BodyMeasurement(date=today - timedelta(days=21), weight=77.0, height=175, bmi=25.14, body_fat_percentage=17.0),
-    BodyMeasurement(date=today - timedelta(days=28), weight=77.5, height=175, bmi=25.31, body_fat_percentage=17.2, notes="Starting weight"),
-]
+    if args.demo:
+        init_db()
+        load_demo()
+        return
+
+    if args.users > 1:
+        paths = [shards.shard_file(f"user{i}@example.com", args.out_dir) for i in range(args.users)]
+    else:
+        paths = [None]
 
-for measurement in sample_measurements:
-    db.add(measurement)
+    start = time.perf_counter()
+    totals = {"workouts": 0, "meals": 0, "measurements": 0}
+    for user, path in enumerate(paths):
+        # One shard open at a time, so thousands of users stay within the file limit
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            bind = shards.create_shard_engine(path)
+        else:
+            bind = engine
+        try:
+            init_db(bind)
+            if not args.append:
+                clear(bind)
+            counts = populate(
+                bind,
+                years=args.years,
+                workouts_per_day=args.workouts_per_day,
+                meals_per_day=args.meals_per_day,
+                measure_every=args.measure_every,
+                # Distinct but reproducible history per user
+                seed=args.seed + user,
+            )
+        finally:
+            if path:
+                bind.dispose()
+        for name, count in counts.items():
+            totals[name] += count
+    elapsed = time.perf_counter() - start
 
-db.commit()
-db.close()
+    rows = sum(totals.values())
+    print(f"✅ Generated {len(paths)} user(s) in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    for name, count in totals.items():
+        print(f"Added {count:,} {name}")
 
-print("✅ Sample data successfully added!")
-print(f"Added {len(sample_workouts)} workouts")
-print(f"Added {len(sample_meals)} meals")
-print(f"Added {len(sample_measurements)} body measurements")
+if __name__ == "__main__":
+    main()
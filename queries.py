@@ -0,0 +1,344 @@
+"""Read queries and aggregations behind the app's views, served through the query cache.
+
+Each function opens its own short-lived session and returns plain rows
+(attribute access like `row.date`, no session attached) or DataFrames, so
+results can be shared between reruns and browser sessions until a write to
+one of the entities named in `@query_cache.cached(...)` invalidates them.
+Cached results are shared: callers must not modify them. The undecorated
+function is available as `.uncached`, which the benchmarks time. Frames and
+dicts are also shared with the other server processes of the host
+(`shared=True`, see shared_cache.py).
+
+Reads of raw workout and meal rows also take the archived months their
+date range reaches (see archive.py), listed in the same snapshot as the
+SQLite query.
+"""
+import threading
+
+from sqlalchemy import event, func, or_, select
+
+from analytics import RollingAnalytics
+import archive
+from cache import query_cache
+from database import SessionLocal, current_engine, database_key
+from instrumentation import note_fetched
+from models import Workout, Meal, BodyMeasurement
+import summary
+from timeseries import CHART_POINTS, bucket_start, choose_bucket, downsample
+
+WORKOUT_COLUMNS = (
+    Workout.id, Workout.date, Workout.exercise_type,
+    Workout.duration, Workout.calories_burned, Workout.notes,
+)
+MEAL_COLUMNS = (
+    Meal.id, Meal.date, Meal.meal_type, Meal.food_name,
+    Meal.calories, Meal.protein, Meal.carbs, Meal.fats,
+)
+WORKOUT_NAMES = [column.key for column in WORKOUT_COLUMNS]
+MEAL_NAMES = [column.key for column in MEAL_COLUMNS]
+MEASUREMENT_COLUMNS = (
+    BodyMeasurement.date, BodyMeasurement.weight, BodyMeasurement.height,
+    BodyMeasurement.bmi, BodyMeasurement.body_fat_percentage,
+)
+
+def _fetch(stmt):
+    with SessionLocal() as db:
+        rows = db.execute(stmt).all()
+    note_fetched(len(rows))
+    return rows
+
+def _cursor_rows(db, stmt):
+    """Run a Core select and get the DBAPI cursor's own rows"""
+    result = db.connection().execute(stmt)
+    rows = result.cursor.fetchall()
+    result.close()
+    return rows
+
+def _frame(rows, dtypes):
+    """Build a DataFrame with typed columns from raw rows, dates as ISO text"""
+    import pandas as pd  # only views with tables and charts need it
+
+    frame = pd.DataFrame.from_records(rows, columns=list(dtypes), coerce_float=True)
+    for name, dtype in dtypes.items():
+        if dtype == "date":
+            frame[name] = pd.to_datetime(frame[name], format="%Y-%m-%d")
+        else:
+            frame[name] = frame[name].astype(dtype)
+    return frame
+
+def _fetch_frame(stmt, dtypes):
+    """Run a Core select straight into a DataFrame with typed columns
+
+    Rows are taken from the DBAPI cursor, skipping SQLAlchemy's per-value
+    result processing and ORM objects, so dates arrive as the ISO text
+    SQLite stores and are parsed for the whole column at once. `dtypes`
+    names the selected columns in order, mapped to a pandas dtype or "date".
+    """
+    with SessionLocal() as db:
+        rows = _cursor_rows(db, stmt)
+    note_fetched(len(rows))
+    return _frame(rows, dtypes)
+
+@query_cache.cached("workouts", "meals", shared=True)
+def get_dashboard_totals(today, week_ago):
+    """Get the dashboard metrics from the daily rollup"""
+    with SessionLocal() as db:
+        return summary.get_dashboard_totals(db, today, week_ago)
+
+@query_cache.cached("measurements")
+def get_latest_measurement():
+    """Get the most recent body measurement, or None"""
+    rows = _fetch(
+        select(*MEASUREMENT_COLUMNS).order_by(BodyMeasurement.date.desc()).limit(1)
+    )
+    return rows[0] if rows else None
+
+@query_cache.cached("measurements")
+def get_measurement_history(limit=10):
+    """Get the latest `limit` body measurements, newest first"""
+    return _fetch(
+        select(*MEASUREMENT_COLUMNS).order_by(BodyMeasurement.date.desc()).limit(limit)
+    )
+
+@query_cache.cached("workouts")
+def get_recent_workouts(limit=5):
+    """Get the latest `limit` workouts, newest first"""
+    with SessionLocal() as db:
+        archive.begin_snapshot(db)
+        rows = db.execute(
+            select(*WORKOUT_COLUMNS).order_by(Workout.date.desc()).limit(limit)
+        ).all()
+        # Only archived months from the oldest of these on can hold later ones
+        since = rows[-1].date if len(rows) == limit else None
+        archived = archive.read_rows(
+            db, "workouts", WORKOUT_NAMES, start_date=since, descending=True, limit=limit
+        )
+    if archived:
+        rows = sorted([*rows, *archived], key=lambda row: (row.date, row.id), reverse=True)[:limit]
+    note_fetched(len(rows))
+    return rows
+
+@query_cache.cached("meals")
+def get_meals_on(day):
+    """Get the meals logged on `day` in the order they were entered"""
+    with SessionLocal() as db:
+        archive.begin_snapshot(db)
+        rows = db.execute(
+            select(*MEAL_COLUMNS).where(Meal.date == day).order_by(Meal.created_at)
+        ).all()
+        # Still in SQLite if logged after the day's month was archived
+        archived = archive.read_rows(db, "meals", MEAL_NAMES, day, day)
+    note_fetched(len(rows) + len(archived))
+    return [*archived, *rows]
+
+@query_cache.cached("workouts", shared=True)
+def get_workout_activity(start_date, bucket="day"):
+    """Get duration and calories burned per day, week or month since `start_date`"""
+    return _fetch_frame(summary.daily_workouts_query(start_date, bucket), {
+        'Date': "date",
+        'Duration': "int64",
+        'Calories': "int64",
+    })
+
+@query_cache.cached("measurements", shared=True)
+def get_weight_trend(max_points=CHART_POINTS):
+    """Get weight and BMI over all measurements, in at most `max_points` points
+
+    Measurements are averaged per day, week or month depending on how far
+    back they go, then thinned with LTTB if still over the budget.
+    """
+    span = _fetch(select(func.min(BodyMeasurement.date), func.max(BodyMeasurement.date)))[0]
+    bucket = choose_bucket(*span, max_points) if span[0] else "day"
+    period = bucket_start(BodyMeasurement.date, bucket)
+    trend = _fetch_frame(
+        select(period, func.avg(BodyMeasurement.weight), func.avg(BodyMeasurement.bmi))
+        .group_by(period).order_by(period),
+        {'Date': "date", 'Weight': "float64", 'BMI': "float64"}
+    )
+    return downsample(trend, 'Date', 'Weight', max_points)
+
+@query_cache.cached("meals", shared=True)
+def get_meal_macros(day):
+    """Get calories and macro totals eaten on `day`"""
+    with SessionLocal() as db:
+        return summary.get_meal_totals(db, day)
+
+@query_cache.cached("workouts", "meals", shared=True)
+def get_range_totals(start_date, end_date):
+    """Get workout and meal counts and totals for a date range"""
+    with SessionLocal() as db:
+        return summary.get_range_totals(db, start_date, end_date)
+
+def _keyset(model, start_date, end_date, after, descending):
+    """Get the filter and order for the page of a date range following `after`
+
+    Pages are ordered on (date, id), which the (date, id) index serves
+    directly, and continue from the (date, id) of the previous page's last
+    row, so every page costs the same however deep into the range it is.
+    """
+    conditions = [model.date >= start_date, model.date <= end_date]
+    if after is not None:
+        after_date, after_id = after
+        if descending:
+            conditions += [
+                model.date <= after_date,
+                or_(model.date < after_date, model.id < after_id)
+            ]
+        else:
+            conditions += [
+                model.date >= after_date,
+                or_(model.date > after_date, model.id > after_id)
+            ]
+    if descending:
+        return conditions, (model.date.desc(), model.id.desc())
+    return conditions, (model.date, model.id)
+
+WORKOUT_PAGE_COLUMNS = {
+    'id': "int64",
+    'Date': "date",
+    'Exercise': "category",
+    'Duration (min)': "int64",
+    'Calories Burned': "int64",
+    'Notes': "object",
+}
+MEAL_PAGE_COLUMNS = {
+    'id': "int64",
+    'Date': "date",
+    'Meal Type': "category",
+    'Food': "object",
+    'Calories': "int64",
+    'Protein (g)': "float64",
+    'Carbs (g)': "float64",
+    'Fats (g)': "float64",
+}
+
+def _fetch_page(stmt, entity, columns, fill, dtypes, start_date, end_date, after, page_size, descending):
+    """Run a history page query and merge in the archived rows the page reaches
+
+    Archived months are read in page order until they give a page of their
+    own, which is usually one file.
+    """
+    with SessionLocal() as db:
+        archive.begin_snapshot(db)
+        rows = _cursor_rows(db, stmt)
+        archived = archive.read_raw(
+            db, entity, columns, start_date, end_date, after, descending, page_size, fill
+        )
+    if archived:
+        # Ordered on (date, id), the second and first columns
+        rows = sorted([*rows, *archived], key=lambda row: (row[1], row[0]), reverse=descending)
+        rows = rows[:page_size]
+    note_fetched(len(rows))
+    return _frame(rows, dtypes)
+
+@query_cache.cached("workouts", shared=True)
+def get_workout_page(start_date, end_date, after=None, page_size=50, descending=True):
+    """Get one page of the workouts in a date range
+
+    `after` is the (date, id) of the last row of the previous page.
+    """
+    conditions, order = _keyset(Workout, start_date, end_date, after, descending)
+    return _fetch_page(
+        select(
+            Workout.id, Workout.date, Workout.exercise_type, Workout.duration,
+            Workout.calories_burned, func.coalesce(Workout.notes, ''),
+        ).where(*conditions).order_by(*order).limit(page_size),
+        "workouts", WORKOUT_NAMES, {"notes": ""},
+        WORKOUT_PAGE_COLUMNS, start_date, end_date, after, page_size, descending
+    )
+
+@query_cache.cached("meals", shared=True)
+def get_meal_page(start_date, end_date, after=None, page_size=50, descending=True):
+    """Get one page of the meals in a date range
+
+    `after` is the (date, id) of the last row of the previous page.
+    """
+    conditions, order = _keyset(Meal, start_date, end_date, after, descending)
+    return _fetch_page(
+        select(
+            Meal.id, Meal.date, Meal.meal_type, Meal.food_name, Meal.calories,
+            func.coalesce(Meal.protein, 0.0),
+            func.coalesce(Meal.carbs, 0.0),
+            func.coalesce(Meal.fats, 0.0),
+        ).where(*conditions).order_by(*order).limit(page_size),
+        "meals", MEAL_NAMES, {"protein": 0.0, "carbs": 0.0, "fats": 0.0},
+        MEAL_PAGE_COLUMNS, start_date, end_date, after, page_size, descending
+    )
+
+@query_cache.cached("workouts", shared=True)
+def get_exercise_breakdown(start_date, end_date):
+    """Get total duration and calories per exercise type in a date range"""
+    with SessionLocal() as db:
+        archive.begin_snapshot(db)
+        rows = _cursor_rows(db, select(
+            Workout.exercise_type,
+            func.sum(Workout.duration),
+            func.sum(Workout.calories_burned),
+        ).where(
+            Workout.date >= start_date,
+            Workout.date <= end_date
+        ).group_by(Workout.exercise_type))
+        archived = archive.sum_by(
+            db, "workouts", ["exercise_type"], ["duration", "calories_burned"], start_date, end_date
+        )
+    if archived:
+        totals = {exercise_type: [duration, calories] for exercise_type, duration, calories in rows}
+        for exercise_type, _, duration, calories in archived:
+            total = totals.setdefault(exercise_type, [0, 0])
+            total[0] += duration
+            total[1] += calories
+        rows = [(exercise_type, *total) for exercise_type, total in totals.items()]
+    note_fetched(len(rows))
+    return _frame(
+        rows, {'Exercise': "category", 'Duration (min)': "int64", 'Calories Burned': "int64"}
+    )
+
+@query_cache.cached("meals", shared=True)
+def get_calorie_intake(start_date, end_date, bucket="day", max_points=CHART_POINTS):
+    """Get the average daily calories eaten per day, week or month in a date range
+
+    Only days with meals count towards the averages. The series is thinned
+    with LTTB to at most `max_points` points.
+    """
+    intake = _fetch_frame(
+        summary.daily_calories_query(start_date, end_date, bucket),
+        {'Date': "date", 'Calories': "float64"}
+    )
+    return downsample(intake, 'Date', 'Calories', max_points)
+
+# One incrementally refreshed set of daily series per database, shared by
+# every session reading it
+_analytics = {}  # database key -> (RollingAnalytics, lock)
+_analytics_lock = threading.Lock()
+
+def _forget(bind):
+    # A closed shard (see shards.py) takes its series with it
+    with _analytics_lock:
+        _analytics.pop(database_key(bind), None)
+
+def _track(bind):
+    if not event.contains(bind, "engine_disposed", _forget):
+        event.listen(bind, "engine_disposed", _forget)
+
+@query_cache.cached("workouts", "meals", "measurements", shared=True)
+def get_rolling_analytics(today, days=90, weeks=12):
+    """Get moving averages, calorie balance, streaks and weekly load as of `today`
+
+    A cache miss after a write refreshes the shared series from the first
+    changed day only.
+    """
+    bind = current_engine()
+    with _analytics_lock:
+        if database_key(bind) not in _analytics:
+            _track(bind)
+            _analytics[database_key(bind)] = (RollingAnalytics(), threading.Lock())
+        analytics, lock = _analytics[database_key(bind)]
+    with lock, SessionLocal() as db:
+        analytics.refresh(db, today)
+        current_streak, longest_streak = analytics.streaks(today)
+        return {
+            "daily": analytics.daily_frame(today, days),
+            "weekly_volume": analytics.weekly_volume(today, weeks),
+            "current_streak": current_streak,
+            "longest_streak": longest_streak,
+        }
@@ -0,0 +1,436 @@
+"""Weekly and monthly progress reports as static HTML, for every user at once.
+
+A report covers one week (Monday to Sunday) or calendar month: workouts,
+minutes and calories per exercise type, calories eaten against burned,
+average macros on days with meals, and the change in weight and BMI, with
+the dashboard's charts drawn as inline SVG so a report is one
+self-contained file that needs no browser to render.
+
+Each user is one database: every shard in FITTRACK_SHARD_DIR, or the app's
+own database. A user's reports for all requested periods come from one
+pass over it: three queries read the daily_summary rows, the workouts per
+day and exercise type (archived months included) and the measurements of
+the whole span, and numpy assigns every row to its week and month at once.
+Users are spread over a process pool; workers write each report as soon
+as it is built, and index.html lists them as users finish.
+
+    python reports.py --period week month --count 4
+    python reports.py --all-shards --out reports --workers 8
+"""
+import argparse
+import html
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+import archive
+import shards
+from database import DATABASE_URL, create_sqlite_engine
+from models import Workout, BodyMeasurement, DailySummary
+
+PERIODS = ["week", "month"]
+DAY_COLUMNS = [
+    "workout_count", "workout_duration", "calories_burned",
+    "meal_count", "calories_consumed", "protein", "carbs", "fats",
+]
+# Plotly's default colors, as in the app's charts
+COLORS = ["#636efa", "#ef553b", "#00cc96", "#ab63fa", "#ffa15a"]
+WEIGHT_COLOR = "#1f77b4"
+
+# ------------------------------------------------------------------ windows
+
+def period_start(day, period):
+    """Get the first day of the week or month holding `day`"""
+    return day - timedelta(days=day.weekday()) if period == "week" else day.replace(day=1)
+
+def windows(period, count, end):
+    """Get (first day, last day) of the last `count` whole weeks or months
+    ending on or before `end`, oldest first"""
+    last = period_start(end + timedelta(days=1), period) - timedelta(days=1)
+    spans = []
+    for _ in range(count):
+        first = period_start(last, period)
+        spans.append((first, last))
+        last = first - timedelta(days=1)
+    return spans[::-1]
+
+def _window_index(days, firsts, lasts):
+    """Get the window of every day (-1 outside them); windows are sorted
+    and do not overlap"""
+    index = np.searchsorted(firsts, days, side="right") - 1
+    inside = (index >= 0) & (days <= lasts[index.clip(0)])
+    return np.where(inside, index, -1)
+
+# -------------------------------------------------------------- aggregation
+
+def _as_days(values):
+    # SQLite rows bring dates, archived ones ISO text
+    return np.array(values.astype(str), dtype="datetime64[D]")
+
+def read_user(bind, first, last):
+    """Read everything the reports of a date range need, in one snapshot"""
+    with bind.connect() as conn:
+        archive.begin_snapshot(conn)
+        days = conn.execute(select(
+            DailySummary.date, *(getattr(DailySummary, name) for name in DAY_COLUMNS)
+        ).where(DailySummary.date.between(first, last)).order_by(DailySummary.date)).all()
+        exercises = conn.execute(select(
+            Workout.date, Workout.exercise_type, func.count(),
+            func.sum(Workout.duration), func.sum(Workout.calories_burned),
+        ).where(Workout.date.between(first, last)).group_by(Workout.date, Workout.exercise_type)).all()
+        exercises += archive.sum_by(
+            conn, "workouts", ["date", "exercise_type"], ["duration", "calories_burned"], first, last
+        )
+        # The latest measurement before the range is where its weight starts
+        before = select(func.max(BodyMeasurement.date)).where(BodyMeasurement.date < first).scalar_subquery()
+        measurements = conn.execute(select(
+            BodyMeasurement.date, BodyMeasurement.weight, BodyMeasurement.bmi
+        ).where(
+            BodyMeasurement.date.between(func.coalesce(before, first), last)
+        ).order_by(BodyMeasurement.date)).all()
+
+    days = pd.DataFrame(days, columns=["date", *DAY_COLUMNS])
+    days["date"] = _as_days(days["date"])
+    exercises = pd.DataFrame(exercises, columns=["date", "exercise", "workouts", "duration", "calories"])
+    exercises["date"] = _as_days(exercises["date"])
+    measurements = pd.DataFrame(measurements, columns=["date", "weight", "bmi"])
+    measurements["date"] = _as_days(measurements["date"])
+    return days, exercises, measurements
+
+def summarize(data, spans):
+    """Get the figures of every window in `spans` from one user's data
+
+    Returns a list with, per window: the totals, the per-day series, the
+    per-exercise totals and the measurements to chart.
+    """
+    days, exercises, measurements = data
+    firsts = np.array([first for first, _ in spans], dtype="datetime64[D]")
+    lasts = np.array([last for _, last in spans], dtype="datetime64[D]")
+    # Every day of the span, so a window's days are a slice
+    calendar = days.set_index("date").reindex(np.arange(firsts[0], lasts[-1] + 1), fill_value=0)
+    offsets = (firsts - firsts[0]).astype(int)
+
+    day_window = _window_index(days["date"].values, firsts, lasts)
+    # By row as Python numbers, each column keeping its type
+    totals = days.drop(columns="date").groupby(day_window).sum().to_dict("index")
+    meal_days = (days["meal_count"] > 0).groupby(day_window).sum()
+    exercise_window = _window_index(exercises["date"].values, firsts, lasts)
+    by_exercise = exercises.drop(columns="date").groupby([exercise_window, "exercise"]).sum()
+
+    # Weight at the start: the last measurement before the window, else its
+    # first; at the end: the last one up to its last day
+    dates = measurements["date"].values
+    weights = measurements[["weight", "bmi"]].to_numpy(dtype=float)
+    first_inside = np.searchsorted(dates, firsts, side="left")
+    start = np.where(first_inside > 0, first_inside - 1, first_inside)
+    end = np.searchsorted(dates, lasts, side="right") - 1
+    has_weight = (end >= 0) & (start <= end)
+
+    reports = []
+    for number, (first, last) in enumerate(spans):
+        with_meals = int(meal_days.get(number, 0))
+        figures = dict(totals.get(number, dict.fromkeys(DAY_COLUMNS, 0)))
+        figures["days"] = (last - first).days + 1
+        figures["meal_days"] = with_meals
+        for name in ("protein", "carbs", "fats", "calories_consumed"):
+            figures[f"{name}_per_day"] = figures[name] / with_meals if with_meals else None
+        figures["balance"] = figures["calories_consumed"] - figures["calories_burned"]
+        figures["weight"] = figures["bmi"] = None
+        if has_weight[number]:
+            (weight_from, bmi_from), (weight_to, bmi_to) = weights[start[number]], weights[end[number]]
+            figures["weight"] = (weight_from, weight_to)
+            if not (np.isnan(bmi_from) or np.isnan(bmi_to)):
+                figures["bmi"] = (bmi_from, bmi_to)
+
+        daily = calendar.iloc[offsets[number]:offsets[number] + figures["days"]]
+        exercise_totals = (
+            by_exercise.loc[number].sort_values("duration", ascending=False)
+            if number in by_exercise.index.get_level_values(0) else by_exercise.iloc[:0]
+        )
+        reports.append({
+            "first": first, "last": last, "figures": figures, "daily": daily,
+            "exercises": exercise_totals,
+            "measurements": measurements.iloc[first_inside[number]:end[number] + 1],
+        })
+    return reports
+
+# ------------------------------------------------------------------- charts
+
+# Margins of the plot area in a chart
+LEFT, RIGHT, TOP, BOTTOM = 60, 12, 28, 28
+
+def _axis(width, height, low, high, y_label):
+    """Gridlines and labels of a y axis covering low..high in round steps
+
+    Returns the SVG parts and the function placing a value on the axis.
+    """
+    rough = max(high - low, 1e-9) / 4
+    magnitude = 10 ** np.floor(np.log10(rough))
+    step = next(size * magnitude for size in (1, 2, 2.5, 5, 10) if size * magnitude >= rough)
+    low = np.floor(low / step) * step
+    steps = max(1, int(np.ceil((high - low) / step - 1e-9)))
+    bottom = height - BOTTOM
+    y = lambda value: bottom - (bottom - TOP) * (value - low) / (step * steps)
+    digits = 0 if step >= 1 else 1
+    parts = []
+    for number in range(steps + 1):
+        level = low + step * number
+        parts.append(f'<line x1="{LEFT}" y1="{y(level):.1f}" x2="{width - RIGHT}" y2="{y(level):.1f}" stroke="#e5ecf6"/>')
+        parts.append(f'<text x="{LEFT - 6}" y="{y(level) + 4:.1f}" text-anchor="end">{level:,.{digits}f}</text>')
+    parts.append(f'<text x="12" y="{height / 2:.0f}" transform="rotate(-90 12 {height / 2:.0f})" '
+                 f'text-anchor="middle">{html.escape(y_label)}</text>')
+    return parts, y
+
+def _x_labels(labels, positions, height, every):
+    return [
+        f'<text x="{x:.1f}" y="{height - BOTTOM + 16}" text-anchor="middle">{html.escape(str(label))}</text>'
+        for i, (label, x) in enumerate(zip(labels, positions)) if i % every == 0
+    ]
+
+def _svg(width, height, title, parts, legend=()):
+    keys = "".join(
+        f'<rect x="{LEFT + 90 * i}" y="6" width="10" height="10" fill="{color}"/>'
+        f'<text x="{LEFT + 14 + 90 * i}" y="15">{html.escape(name)}</text>'
+        for i, (name, color) in enumerate(legend)
+    )
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11" fill="#2a3f5f">'
+            f'<title>{html.escape(title)}</title>{"".join(parts)}{keys}</svg>')
+
+def bar_chart(labels, series, title, y_label, width=640, height=260):
+    """SVG bars of one or more series side by side; `series` maps names to values"""
+    high = max((max(values, default=0) for values in series.values()), default=0)
+    parts, y = _axis(width, height, 0, high or 1, y_label)
+    slot = (width - RIGHT - LEFT) / max(len(labels), 1)
+    bar = slot * 0.8 / max(len(series), 1)
+    for number, values in enumerate(series.values()):
+        color = COLORS[number % len(COLORS)]
+        for i, value in enumerate(values):
+            x = LEFT + slot * (i + 0.1) + bar * number
+            parts.append(f'<rect x="{x:.1f}" y="{y(value):.1f}" width="{bar:.1f}" '
+                         f'height="{y(0) - y(value):.1f}" fill="{color}"/>')
+    centers = [LEFT + slot * (i + 0.5) for i in range(len(labels))]
+    parts += _x_labels(labels, centers, height, max(1, len(labels) // 10))
+    legend = [(name, COLORS[i % len(COLORS)]) for i, name in enumerate(series)] if len(series) > 1 else ()
+    return _svg(width, height, title, parts, legend)
+
+def line_chart(days, values, title, y_label, width=640, height=260):
+    """SVG line with markers over a window's days; `values` maps days to values"""
+    low, high = min(values.values()), max(values.values())
+    # Weights move little; the axis spans their range, not zero up
+    margin = max((high - low) * 0.1, 0.5)
+    parts, y = _axis(width, height, low - margin, high + margin, y_label)
+    first, count = days[0], len(days)
+    # Days sit half a slot in from the edges, clear of the axis labels
+    slot = (width - RIGHT - LEFT) / count
+    x = lambda day: LEFT + slot * ((day - first).days + 0.5)
+    points = " ".join(f"{x(day):.1f},{y(value):.1f}" for day, value in values.items())
+    parts.append(f'<polyline points="{points}" fill="none" stroke="{WEIGHT_COLOR}" stroke-width="2"/>')
+    parts += [f'<circle cx="{x(day):.1f}" cy="{y(value):.1f}" r="3" fill="{WEIGHT_COLOR}"/>'
+              for day, value in values.items()]
+    labels = [f"{day:%d %b}" for day in days]
+    parts += _x_labels(labels, [x(day) for day in days], height, max(1, count // 7))
+    return _svg(width, height, title, parts)
+
+# --------------------------------------------------------------------- html
+
+PAGE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; color: #2a3f5f; max-width: 680px; margin: 2em auto; }}
+table {{ border-collapse: collapse; width: 100%; margin-bottom: 1.5em; }}
+td, th {{ padding: 4px 8px; border-bottom: 1px solid #e5ecf6; text-align: left; }}
+td.number {{ text-align: right; }}
+.empty {{ color: #8c9bb0; }}
+</style></head><body>
+<h1>{title}</h1>
+{body}
+</body></html>
+"""
+
+def _change(pair, unit, digits=1):
+    if pair is None:
+        return "No measurements"
+    start, end = pair
+    return f"{start:.{digits}f} → {end:.{digits}f}{unit} ({end - start:+.{digits}f})"
+
+def _per_day(value, unit):
+    return "No meals logged" if value is None else f"{value:,.0f} {unit}"
+
+def render(user, period, report):
+    """Get the HTML page of one report"""
+    first, last, figures = report["first"], report["last"], report["figures"]
+    balance = figures["balance"]
+    when = f"week of {first:%d %B %Y}" if period == "week" else f"{first:%B %Y}"
+    title = f"{'Weekly' if period == 'week' else 'Monthly'} progress, {when}"
+    rows = [
+        ("Workouts", f"{figures['workout_count']:,}"),
+        ("Minutes trained", f"{figures['workout_duration']:,}"),
+        ("Calories burned", f"{figures['calories_burned']:,}"),
+        ("Calories eaten", f"{figures['calories_consumed']:,}"),
+        ("Calorie balance", f"{balance:+,} ({'surplus' if balance > 0 else 'deficit' if balance < 0 else 'even'})"),
+        ("Calories per day with meals", _per_day(figures["calories_consumed_per_day"], "cal")),
+        ("Protein per day", _per_day(figures["protein_per_day"], "g")),
+        ("Carbs per day", _per_day(figures["carbs_per_day"], "g")),
+        ("Fats per day", _per_day(figures["fats_per_day"], "g")),
+        ("Weight", _change(figures["weight"], " kg")),
+        ("BMI", _change(figures["bmi"], "")),
+    ]
+    body = [f"<p>{html.escape(user)} · {first:%d %b} to {last:%d %b %Y} · "
+            f"meals logged on {figures['meal_days']} of {figures['days']} days</p>"]
+    body.append("<table>" + "".join(
+        f'<tr><th>{name}</th><td class="number">{html.escape(value)}</td></tr>' for name, value in rows
+    ) + "</table>")
+
+    exercises = report["exercises"]
+    if len(exercises):
+        body.append("<h2>By exercise</h2><table><tr><th>Exercise</th><th>Workouts</th>"
+                    "<th>Minutes</th><th>Calories</th></tr>" + "".join(
+            f'<tr><td>{html.escape(str(row.Index))}</td><td class="number">{row.workouts:,}</td>'
+            f'<td class="number">{row.duration:,}</td><td class="number">{row.calories:,}</td></tr>'
+            for row in exercises.itertuples()
+        ) + "</table>")
+        body.append(bar_chart(
+            list(exercises.index), {"Minutes": exercises["duration"].tolist()},
+            "Minutes per exercise", "Minutes"
+        ))
+    else:
+        body.append('<p class="empty">No workouts logged.</p>')
+
+    daily = report["daily"]
+    labels = [f"{day:%a}" if period == "week" else f"{day.day}" for day in daily.index.astype(object)]
+    body.append("<h2>Calories</h2>")
+    body.append(bar_chart(labels, {
+        "Eaten": daily["calories_consumed"].tolist(), "Burned": daily["calories_burned"].tolist()
+    }, "Calories eaten and burned per day", "Calories"))
+
+    measurements = report["measurements"]
+    if len(measurements):
+        body.append("<h2>Weight</h2>")
+        body.append(line_chart(
+            list(daily.index.astype(object)),
+            dict(zip(measurements["date"].astype(object), measurements["weight"])),
+            "Weight over the period", "Weight (kg)"
+        ))
+    return PAGE.format(title=html.escape(title), body="\n".join(body))
+
+def _write(path, text):
+    """Write a file aside and rename it, so a reader never sees half of it"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def report_file(period, first):
+    return f"week-{first:%Y-%m-%d}.html" if period == "week" else f"month-{first:%Y-%m}.html"
+
+# ------------------------------------------------------------------ batches
+
+def build_user(task):
+    """Build and write every report of one user, in a worker process
+
+    Returns (user, files written, error message or None).
+    """
+    user, url, out_dir, spans = task
+    written = []
+    bind = create_sqlite_engine(url, pool_size=1, max_overflow=0)
+    try:
+        first = min(first for periods in spans.values() for first, _ in periods)
+        last = max(last for periods in spans.values() for _, last in periods)
+        data = read_user(bind, first, last)
+        folder = os.path.join(out_dir, user)
+        os.makedirs(folder, exist_ok=True)
+        for period, periods in spans.items():
+            for report in summarize(data, periods):
+                name = report_file(period, report["first"])
+                _write(os.path.join(folder, name), render(user, period, report))
+                written.append(name)
+    except Exception as exc:
+        # One broken database must not stop the reports of everyone else
+        return user, written, f"{type(exc).__name__}: {str(exc).splitlines()[0] if str(exc) else ''}"
+    finally:
+        bind.dispose()
+    return user, written, None
+
+def users(shard_dir=None, database=None):
+    """Get (name, URL) of every user: each shard in `shard_dir`, or the one database"""
+    if shard_dir:
+        return [
+            (os.path.splitext(os.path.basename(path))[0], f"sqlite:///{path}")
+            for path in shards.iter_shards(shard_dir)
+        ]
+    url = database or DATABASE_URL
+    return [(os.path.splitext(os.path.basename(url))[0], url)]
+
+def build_all(targets, spans, out_dir, workers, progress=None, build=build_user):
+    """Build the reports of every (user, URL) in `targets` on `workers`
+    processes, calling `progress` with each user's result as it finishes"""
+    tasks = [(user, url, out_dir, spans) for user, url in targets]
+    if workers <= 1:
+        results = map(build, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        # Chunks amortize the hand-off of tasks but still spread the tail
+        chunksize = max(1, len(tasks) // (workers * 8))
+        results = pool.imap_unordered(build, tasks, chunksize)
+    try:
+        for result in results:
+            if progress:
+                progress(result)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build weekly and monthly progress reports as HTML")
+    parser.add_argument("--period", choices=PERIODS, nargs="+", default=PERIODS)
+    parser.add_argument("--count", type=int, default=1, help="periods per user, the latest last")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(),
+                        help="only periods over by this day (default: today)")
+    parser.add_argument("--out", default="reports", help="output folder")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: the app's fittrack.db)")
+    parser.add_argument("--all-shards", action="store_true",
+                        help="every user shard in $FITTRACK_SHARD_DIR instead (see shards.py)")
+    args = parser.parse_args()
+    if args.all_shards and not shards.SHARD_DIR:
+        parser.error("--all-shards needs FITTRACK_SHARD_DIR")
+
+    start = time.perf_counter()
+    spans = {period: windows(period, args.count, args.end) for period in args.period}
+    targets = users(shards.SHARD_DIR if args.all_shards else None, args.database)
+    os.makedirs(args.out, exist_ok=True)
+    done = {"users": 0, "reports": 0, "failed": 0}
+    with open(os.path.join(args.out, "index.html"), "w", encoding="utf-8") as index:
+        index.write(PAGE.split("{body}")[0].format(title="Progress reports") + "<ul>\n")
+
+        def progress(result):
+            user, files, error = result
+            done["users"] += 1
+            done["reports"] += len(files)
+            links = " ".join(f'<a href="{user}/{name}">{name[:-5]}</a>' for name in files)
+            if error:
+                done["failed"] += 1
+                print(f"❌ {user}: {error}")
+                links += f' <span class="empty">{html.escape(error)}</span>'
+            index.write(f"<li>{html.escape(user)}: {links}</li>\n")
+            if done["users"] % 100 == 0:
+                index.flush()
+                print(f"📄 {done['users']:,} of {len(targets):,} users")
+
+        build_all(targets, spans, args.out, args.workers, progress)
+        index.write("</ul>\n" + PAGE.split("{body}")[1])
+    failed = f", {done['failed']} failed" if done["failed"] else ""
+    print(f"✅ Wrote {done['reports']:,} reports for {done['users']:,} users{failed} to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 1 if done["failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,143 @@
+"""Per-user SQLite shards for multi-user deployments.
+
+With FITTRACK_SHARD_DIR set, every signed-in user gets a database file of
+their own instead of sharing fittrack.db, so each user has their own write
+lock, WAL and indexes sized to their own history. Files are named by a hash
+of the user id and spread over 256 subfolders:
+
+    shards/3f/3fa94c0e1b7d52e8a6c4b90d1e2f7a35.db
+
+The app activates the signed-in user's shard for a rerun (`database.activate`);
+sessions, the query cache, the rolling analytics and the writer all follow
+the active database. `shard_pool` keeps at most MAX_OPEN_SHARDS engines open,
+closing the least recently used one when another user arrives; a shard is
+created and migrated the first time this process opens it. Maintenance
+tools go through every shard with `open_shards`:
+
+    python shards.py list
+    python shards.py migrate
+    python archive.py --all-shards
+
+Configuration (environment variables):
+    FITTRACK_SHARD_DIR          folder of the user shards; unset, one shared fittrack.db
+    FITTRACK_MAX_OPEN_SHARDS    engines kept open at once (default 64)
+"""
+import argparse
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database import create_sqlite_engine, get_schema_version, init_db
+
+SHARD_DIR = os.environ.get("FITTRACK_SHARD_DIR")
+MAX_OPEN_SHARDS = int(os.environ.get("FITTRACK_MAX_OPEN_SHARDS", 64))
+# A shard serves one user's sessions: few connections each, which also keeps
+# the open files (three per connection in WAL mode) of all shards in bounds
+SHARD_POOL_SIZE = 2
+SHARD_MAX_OVERFLOW = 2
+
+def shard_file(user, root=SHARD_DIR):
+    """Get the path of a user's shard; user ids are compared case-insensitively"""
+    digest = hashlib.sha256(user.strip().lower().encode("utf-8")).hexdigest()[:32]
+    return os.path.join(root, digest[:2], f"{digest}.db")
+
+def create_shard_engine(path):
+    """Create an engine for a shard file with the per-shard pool size"""
+    return create_sqlite_engine(
+        f"sqlite:///{path}", pool_size=SHARD_POOL_SIZE, max_overflow=SHARD_MAX_OVERFLOW
+    )
+
+class ShardPool:
+    """Bounded LRU cache of open shard engines"""
+
+    def __init__(self, root, max_open=MAX_OPEN_SHARDS):
+        self.root = root
+        self.max_open = max_open
+        self.opened = 0
+        self._engines = OrderedDict()  # path -> engine
+        self._ready = set()  # paths created or migrated by this process
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+
+    def engine(self, user):
+        """Get the engine of a user's shard, creating the shard on first use"""
+        return self.open(shard_file(user, self.root))
+
+    def open(self, path):
+        """Get the engine of a shard file, opening it if needed"""
+        evicted = []
+        with self._lock:
+            bind = self._engines.get(path)
+            if bind is not None:
+                self._engines.move_to_end(path)
+            else:
+                bind = self._engines[path] = create_shard_engine(path)
+                self.opened += 1
+                while len(self._engines) > self.max_open:
+                    evicted.append(self._engines.popitem(last=False)[1])
+        # Connections still checked out finish their work; only idle ones close
+        for old in evicted:
+            old.dispose()
+        if path not in self._ready:
+            with self._migrate_lock:
+                if path not in self._ready:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    init_db(bind)
+                    self._ready.add(path)
+        return bind
+
+    def close(self):
+        """Close every open shard"""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for bind in engines:
+            bind.dispose()
+
+    def stats(self):
+        """Get the number of open shards and how many were opened so far"""
+        with self._lock:
+            return {"open": len(self._engines), "opened": self.opened, "max_open": self.max_open}
+
+# Shared by every session served from this process; None without sharding
+shard_pool = ShardPool(SHARD_DIR) if SHARD_DIR else None
+
+def iter_shards(root=SHARD_DIR):
+    """Yield the path of every shard file under `root`"""
+    yield from sorted(glob.glob(os.path.join(root, "??", "*.db")))
+
+def open_shards(root=SHARD_DIR):
+    """Yield (path, engine) for every shard, one open at a time"""
+    for path in iter_shards(root):
+        bind = create_shard_engine(path)
+        try:
+            yield path, bind
+        finally:
+            bind.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="List or migrate the user shards")
+    parser.add_argument("command", choices=["list", "migrate"])
+    parser.add_argument("--shard-dir", default=SHARD_DIR, help="default: $FITTRACK_SHARD_DIR")
+    args = parser.parse_args()
+    if not args.shard_dir:
+        parser.error("no shard folder: set FITTRACK_SHARD_DIR or pass --shard-dir")
+
+    start = time.perf_counter()
+    count, size = 0, 0
+    for path, bind in open_shards(args.shard_dir):
+        if args.command == "migrate":
+            init_db(bind)
+        count += 1
+        size += os.path.getsize(path)
+        if args.command == "list":
+            print(f"{os.path.relpath(path, args.shard_dir)}  v{get_schema_version(bind)}"
+                  f"{os.path.getsize(path) / 1e6:>10,.1f} MB")
+    verb = "Migrated" if args.command == "migrate" else "Found"
+    print(f"✅ {verb} {count:,} shards ({size / 1e6:,.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""On-disk cache of query results shared by the server processes of a host.
+
+Behind a load balancer, every Streamlit process keeps its own query cache
+(cache.py), cold on the processes that did not compute a result yet. With
+FITTRACK_SHARED_CACHE set, functions cached with `shared=True` also go
+through a SQLite file all processes open: a miss in a process's own cache
+looks there before querying, and a result computed anywhere is stored there
+for the others.
+
+Entries are keyed by the database, the function and its arguments, and the
+data version tokens (versions.py) of the entities the function reads. Every
+write replaces the tokens of what it changed in the same transaction, and
+the tokens are read before computing a result, so a result is only ever
+found by a process that cannot see a newer write yet. Results of older
+tokens are never asked for again and age out.
+
+The file is kept under FITTRACK_SHARED_CACHE_MB by dropping the least
+recently used entries; last use is refreshed at most once a minute per
+entry, so hits stay read-only. WAL lets every process read while one
+stores, and the cache gives up rather than waits when the file is busy.
+
+    python shared_cache.py stats
+    python shared_cache.py clear
+
+Configuration (environment variables):
+    FITTRACK_SHARED_CACHE      cache file; unset or empty, no shared cache
+    FITTRACK_SHARED_CACHE_MB   size bound in megabytes (default 256)
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from database import create_sqlite_engine, current_engine
+import versions
+
+SHARED_CACHE = os.environ.get("FITTRACK_SHARED_CACHE")
+MAX_BYTES = int(float(os.environ.get("FITTRACK_SHARED_CACHE_MB", 256)) * 1024 * 1024)
+# A cache lookup must never be slower than the query it saves
+BUSY_TIMEOUT_MS = 200
+# Seconds between refreshes of an entry's last use
+TOUCH_INTERVAL = 60
+# Share of the size bound freed at once, so not every store has to evict
+EVICT_SHARE = 0.1
+
+CACHE_DDL = [
+    "CREATE TABLE IF NOT EXISTS entries ("
+    "key BLOB PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_entries_used ON entries (used)",
+]
+
+_MISSING = object()
+
+def _key(scope, name, args, tokens):
+    return hashlib.sha256(repr((scope, name, args, tokens)).encode("utf-8")).digest()
+
+def _set_busy_timeout(dbapi_connection, connection_record):
+    dbapi_connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+
+class SharedCache:
+    """Size-bounded cache of pickled results in a SQLite file"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0  # lookups and stores given up on a busy file
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        with self._lock:
+            if self._engine is None:
+                bind = create_sqlite_engine(f"sqlite:///{self.path}")
+                event.listen(bind, "connect", _set_busy_timeout)
+                with bind.begin() as conn:
+                    for statement in CACHE_DDL:
+                        conn.exec_driver_sql(statement)
+                self._engine = bind
+        return self._engine
+
+    def get_or_compute(self, scope, name, args, entities, compute):
+        """Get a result stored by any process, running `compute()` on a miss"""
+        key = _key(scope, name, args, versions.tokens(current_engine(), entities))
+        try:
+            value = self._get(key)
+        except OperationalError:
+            self.errors += 1
+            value = _MISSING
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = compute()
+        try:
+            self._put(key, value)
+        except OperationalError:
+            self.errors += 1
+        return value
+
+    def _get(self, key):
+        with self.engine.connect() as conn:
+            row = conn.exec_driver_sql("SELECT value, used FROM entries WHERE key = ?", (key,)).first()
+            if row is None:
+                return _MISSING
+            now = time.time()
+            if now - row.used > TOUCH_INTERVAL:
+                conn.exec_driver_sql("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+                conn.commit()
+        return pickle.loads(row.value)
+
+    def _put(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes * EVICT_SHARE:
+            return
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT OR REPLACE INTO entries (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            # Pages in use, not the file size: the file keeps freed pages for reuse
+            used = conn.exec_driver_sql(
+                "SELECT (page_count - freelist_count) * page_size "
+                "FROM pragma_page_count(), pragma_freelist_count(), pragma_page_size()"
+            ).scalar()
+            if used > self.max_bytes:
+                self._evict(conn, used - self.max_bytes * (1 - EVICT_SHARE))
+
+    def _evict(self, conn, excess):
+        keys, freed = [], 0
+        for key, size in conn.exec_driver_sql("SELECT key, size FROM entries ORDER BY used"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.exec_driver_sql("DELETE FROM entries WHERE key = ?", keys)
+
+    def clear(self):
+        """Drop every entry"""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM entries")
+
+    def stats(self):
+        """Get this process's hit/miss counters and the file's entries and size"""
+        with self.engine.connect() as conn:
+            entries, size = conn.exec_driver_sql("SELECT count(*), coalesce(sum(size), 0) FROM entries").one()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+# Shared by every session served from this process; None when not configured
+shared_cache = SharedCache(SHARED_CACHE) if SHARED_CACHE else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the shared query cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=SHARED_CACHE, help="default: $FITTRACK_SHARED_CACHE")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("no cache file: set FITTRACK_SHARED_CACHE or pass --path")
+
+    cache = SharedCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+        print(f"✅ Cleared {args.path}")
+    else:
+        stats = cache.stats()
+        print(f"{args.path}: {stats['entries']:,} entries, {stats['bytes'] / 1e6:,.1f} MB "
+              f"(bound {cache.max_bytes / 1e6:,.0f} MB)")
+
+if __name__ == "__main__":
+    main()
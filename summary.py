@@ -0,0 +1,254 @@
+"""Daily rollup of workouts and meals backing the dashboard.
+
+`daily_summary` holds one row per date with that day's totals. The write
+paths call `add_workout`/`remove_workout`/`add_meal`/`remove_meal` on the
+same session as the insert or delete, so the rollup commits together with
+the raw row. `rebuild_daily_summary` recomputes it from scratch:
+
+    python summary.py rebuild
+"""
+import argparse
+from datetime import date
+
+from sqlalchemy import case, delete, func, literal, literal_column, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+
+import archive
+import shards
+import versions
+from database import engine, init_db
+from models import Workout, Meal, DailySummary
+from timeseries import bucket_start
+
+COUNTERS = [
+    "workout_count", "workout_duration", "calories_burned",
+    "meal_count", "calories_consumed", "protein", "carbs", "fats",
+]
+
+def _accumulating(stmt):
+    """Make an insert into daily_summary add to days that already exist"""
+    return stmt.on_conflict_do_update(
+        index_elements=[DailySummary.date],
+        set_={
+            name: getattr(DailySummary, name) + getattr(stmt.excluded, name)
+            for name in COUNTERS
+        }
+    )
+
+def _apply(db, day, **deltas):
+    """Add the given deltas to the summary row of `day`, creating it if needed"""
+    values = {name: deltas.get(name, 0) for name in COUNTERS}
+    db.execute(_accumulating(insert(DailySummary).values(date=day, **values)))
+
+def _workout_deltas(workout, sign):
+    return dict(
+        workout_count=sign,
+        workout_duration=sign * workout.duration,
+        calories_burned=sign * workout.calories_burned,
+    )
+
+def _meal_deltas(meal, sign):
+    return dict(
+        meal_count=sign,
+        calories_consumed=sign * meal.calories,
+        protein=sign * (meal.protein or 0),
+        carbs=sign * (meal.carbs or 0),
+        fats=sign * (meal.fats or 0),
+    )
+
+def add_workout(db, workout):
+    """Count a newly added workout in its day's summary"""
+    _apply(db, workout.date, **_workout_deltas(workout, 1))
+
+def remove_workout(db, workout):
+    """Take a deleted workout out of its day's summary"""
+    _apply(db, workout.date, **_workout_deltas(workout, -1))
+
+def add_meal(db, meal):
+    """Count a newly added meal in its day's summary"""
+    _apply(db, meal.date, **_meal_deltas(meal, 1))
+
+def remove_meal(db, meal):
+    """Take a deleted meal out of its day's summary"""
+    _apply(db, meal.date, **_meal_deltas(meal, -1))
+
+def _per_day(model, sign=1):
+    """Select per-day totals of a workout or meal table in COUNTERS order,
+    negated with `sign` -1"""
+    zero, zero_f = literal(0), literal(0.0)
+    if model is Workout:
+        counters = [
+            func.count(),
+            func.sum(Workout.duration),
+            func.sum(Workout.calories_burned),
+            zero, zero, zero_f, zero_f, zero_f,
+        ]
+    else:
+        counters = [
+            zero, zero, zero,
+            func.count(),
+            func.sum(Meal.calories),
+            func.coalesce(func.sum(Meal.protein), 0.0),
+            func.coalesce(func.sum(Meal.carbs), 0.0),
+            func.coalesce(func.sum(Meal.fats), 0.0),
+        ]
+    if sign != 1:
+        counters = [counter * sign for counter in counters]
+    return select(
+        model.date, *(c.label(name) for c, name in zip(counters, COUNTERS))
+    ).group_by(model.date)
+
+def add_inserted(db, model, after_id):
+    """Count every workout or meal with an id above `after_id`
+
+    Lets bulk writers update the rollup with one aggregate statement per
+    batch; call it in the same transaction as the insert.
+    """
+    # Grouped by "+date", otherwise SQLite walks the whole date index to
+    # save a sort instead of reading the new rows' short id range
+    new_rows = _per_day(model).where(model.id > after_id).group_by(None).group_by(
+        literal_column(f"+{model.__tablename__}.date")
+    )
+    db.execute(_accumulating(insert(DailySummary).from_select(["date", *COUNTERS], new_rows)))
+
+def add_matching(db, model, condition, sign=1):
+    """Count every workout or meal matching `condition`, or with `sign` -1
+    take them out
+
+    For set-based changes: take the rows out before changing them and count
+    them again after, in the same transaction.
+    """
+    rows = _per_day(model, sign).where(condition)
+    db.execute(_accumulating(insert(DailySummary).from_select(["date", *COUNTERS], rows)))
+
+def _archived_per_day(conn):
+    """Per-day totals of the archived workouts and meals, as insert parameters"""
+    workouts = archive.sum_by(conn, "workouts", ["date"], ["duration", "calories_burned"])
+    meals = archive.sum_by(conn, "meals", ["date"], ["calories", "protein", "carbs", "fats"])
+    return [
+        dict(zip(["date", *COUNTERS], (date.fromisoformat(day), *counters)))
+        for day, *counters in [
+            *((day, count, duration, burned, 0, 0, 0.0, 0.0, 0.0)
+              for day, count, duration, burned in workouts),
+            *((day, 0, 0, 0, count, calories, protein, carbs, fats)
+              for day, count, calories, protein, carbs, fats in meals),
+        ]
+    ]
+
+def rebuild_daily_summary(conn):
+    """Recompute the whole summary table from the raw workout and meal rows,
+    archived months included
+
+    Accepts a connection or session; runs inside its current transaction.
+    """
+    per_day = union_all(_per_day(Workout), _per_day(Meal)).subquery()
+    totals = select(
+        per_day.c.date, *(func.sum(per_day.c[name]) for name in COUNTERS)
+    ).group_by(per_day.c.date)
+
+    conn.execute(delete(DailySummary))
+    conn.execute(insert(DailySummary).from_select(["date", *COUNTERS], totals))
+    archived = _archived_per_day(conn)
+    if archived:
+        conn.execute(_accumulating(insert(DailySummary)), archived)
+
+def get_dashboard_totals(db, today, week_ago):
+    """Get all-time, weekly and today's totals for the dashboard metrics"""
+    in_week = DailySummary.date >= week_ago
+    is_today = DailySummary.date == today
+    row = db.execute(select(
+        func.coalesce(func.sum(DailySummary.workout_count), 0),
+        func.coalesce(func.sum(case((in_week, DailySummary.workout_count), else_=0)), 0),
+        func.coalesce(func.sum(DailySummary.calories_burned), 0),
+        func.coalesce(func.sum(case((in_week, DailySummary.calories_burned), else_=0)), 0),
+        func.coalesce(func.sum(case((is_today, DailySummary.calories_burned), else_=0)), 0),
+        func.coalesce(func.sum(case((is_today, DailySummary.calories_consumed), else_=0)), 0),
+    )).one()
+    return dict(zip([
+        "total_workouts", "workouts_this_week",
+        "total_calories_burned", "calories_this_week",
+        "calories_burned_today", "calories_consumed_today",
+    ], row))
+
+def daily_workouts_query(start_date, bucket="day"):
+    """Select (bucket start, duration, calories burned) per day, week or month
+    with workouts since `start_date`"""
+    period = bucket_start(DailySummary.date, bucket)
+    return select(
+        period,
+        func.sum(DailySummary.workout_duration),
+        func.sum(DailySummary.calories_burned),
+    ).where(
+        DailySummary.date >= start_date,
+        DailySummary.workout_count > 0
+    ).group_by(period).order_by(period)
+
+def get_range_totals(db, start_date, end_date):
+    """Get workout and meal totals over a date range"""
+    in_range = (DailySummary.date >= start_date, DailySummary.date <= end_date)
+    row = db.execute(select(
+        func.coalesce(func.sum(DailySummary.workout_count), 0),
+        func.coalesce(func.sum(DailySummary.workout_duration), 0),
+        func.coalesce(func.sum(DailySummary.calories_burned), 0),
+        func.coalesce(func.sum(DailySummary.meal_count), 0),
+        func.coalesce(func.sum(DailySummary.calories_consumed), 0),
+        func.coalesce(func.sum(case((DailySummary.meal_count > 0, 1), else_=0)), 0),
+    ).where(*in_range)).one()
+    return dict(zip([
+        "workout_count", "workout_duration", "calories_burned",
+        "meal_count", "calories_consumed", "meal_days",
+    ], row))
+
+def daily_calories_query(start_date, end_date, bucket="day"):
+    """Select (bucket start, average daily calories) per day, week or month
+    over the days with meals in a date range"""
+    period = bucket_start(DailySummary.date, bucket)
+    return select(
+        period,
+        func.round(func.avg(DailySummary.calories_consumed)),
+    ).where(
+        DailySummary.date >= start_date,
+        DailySummary.date <= end_date,
+        DailySummary.meal_count > 0
+    ).group_by(period).order_by(period)
+
+def get_meal_totals(db, day):
+    """Get calories, protein, carbs and fats eaten on `day`"""
+    row = db.execute(
+        select(
+            DailySummary.calories_consumed,
+            DailySummary.protein,
+            DailySummary.carbs,
+            DailySummary.fats,
+        ).where(DailySummary.date == day)
+    ).first()
+    return dict(zip(["calories", "protein", "carbs", "fats"], row or (0, 0.0, 0.0, 0.0)))
+
+def _rebuild(bind):
+    init_db(bind)
+    with bind.begin() as conn:
+        rebuild_daily_summary(conn)
+        versions.touch(conn, "workouts", "meals")
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(DailySummary)).scalar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily_summary rollup table")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--all-shards", action="store_true",
+                        help="every user shard in $FITTRACK_SHARD_DIR (see shards.py)")
+    args = parser.parse_args()
+
+    if not args.all_shards:
+        print(f"✅ Rebuilt daily_summary ({_rebuild(engine)} days)")
+        return
+    if not shards.SHARD_DIR:
+        parser.error("--all-shards needs FITTRACK_SHARD_DIR")
+    count = 0
+    for _, bind in shards.open_shards():
+        _rebuild(bind)
+        count += 1
+    print(f"✅ Rebuilt daily_summary in {count:,} shards")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: F401  (registers the tables init_db creates)
+from database import activate, create_sqlite_engine, init_db
+
+@pytest.fixture
+def bind(tmp_path):
+    """A new, migrated database file, active for the test's sessions and writes"""
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'fittrack.db'}")
+    init_db(engine)
+    activate(engine)
+    yield engine
+    activate(None)
+    engine.dispose()
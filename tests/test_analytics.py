@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, select
+
+import writer
+from analytics import RollingAnalytics
+from database import SessionLocal
+from models import DayChange, Workout
+
+TODAY = date(2024, 6, 12)
+
+def _refresh(series):
+    with SessionLocal() as db:
+        return series.refresh(db, TODAY)
+
+def _volume(series):
+    frame = series.weekly_volume(TODAY, weeks=1)
+    return dict(zip(frame['Exercise'], frame['Minutes']))
+
+def _log(**values):
+    writer.add_workout(**values).result()
+
+def test_workout_replaced_on_the_same_day(bind):
+    _log(date=TODAY, exercise_type="Running", duration=37, calories_burned=200)
+    _log(date=TODAY, exercise_type="Running", duration=30, calories_burned=200)
+    series = RollingAnalytics()
+    _refresh(series)
+    assert _volume(series) == {"Running": 67}
+
+    with SessionLocal() as db:
+        running = db.query(Workout).filter(Workout.duration == 30).one()
+    writer.delete_workout(running).result()
+    _log(date=TODAY, exercise_type="Tennis", duration=30, calories_burned=200)
+
+    assert _refresh(series) is not None
+    assert _volume(series) == {"Running": 37, "Tennis": 30}
+
+def test_incremental_refresh_matches_a_full_build(bind):
+    for days_ago in range(40):
+        day = TODAY - timedelta(days=days_ago)
+        if days_ago % 3:
+            _log(date=day, exercise_type="Cycling", duration=20 + days_ago, calories_burned=150)
+        writer.add_meal(date=day, meal_type="Lunch", food_name="Oatmeal", calories=400 + days_ago).result()
+    series = RollingAnalytics()
+    _refresh(series)
+    assert _refresh(series) is None
+
+    _log(date=TODAY - timedelta(days=10), exercise_type="Yoga", duration=45, calories_burned=120)
+    assert _refresh(series) == series.day_index(TODAY - timedelta(days=10))
+
+    fresh = RollingAnalytics()
+    _refresh(fresh)
+    assert fresh.streaks(TODAY) == series.streaks(TODAY)
+    assert fresh.weekly_volume(TODAY).equals(series.weekly_volume(TODAY))
+    np.testing.assert_allclose(
+        fresh.daily_frame(TODAY).drop(columns='Date').to_numpy(dtype=float),
+        series.daily_frame(TODAY).drop(columns='Date').to_numpy(dtype=float),
+    )
+
+def test_refresh_reads_from_the_earliest_changed_day(bind):
+    for days_ago in range(30):
+        _log(date=TODAY - timedelta(days=days_ago), exercise_type="Running", duration=30, calories_burned=300)
+    series = RollingAnalytics()
+    assert _refresh(series) == 0
+
+    day = TODAY - timedelta(days=20)
+    writer.save_measurement(date=day, weight=80.0, height=180.0, bmi=24.69).result()
+    assert _refresh(series) == series.day_index(day)
+    assert series.weight[series.day_index(day)] == 80.0
+
+    # Only today moved on: the new day is appended, nothing is read again
+    assert _refresh(series) is None
+    with SessionLocal() as db:
+        assert series.refresh(db, TODAY + timedelta(days=1)) == len(series) - 1
+
+def test_pruned_change_log_reads_everything_again(bind):
+    _log(date=TODAY, exercise_type="Running", duration=30, calories_burned=300)
+    series = RollingAnalytics()
+    _refresh(series)
+    _log(date=TODAY - timedelta(days=1), exercise_type="Yoga", duration=40, calories_burned=100)
+    _log(date=TODAY, exercise_type="Yoga", duration=20, calories_burned=60)
+    with bind.begin() as conn:
+        conn.execute(delete(DayChange).where(DayChange.id < select(func.max(DayChange.id)).scalar_subquery()))
+
+    assert _refresh(series) == 0
+    assert series.start == TODAY - timedelta(days=1)
+    assert _volume(series) == {"Running": 30, "Yoga": 60}
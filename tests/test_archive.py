@@ -0,0 +1,52 @@
+import os
+from datetime import date
+
+from sqlalchemy import func, select
+
+import archive
+import queries
+import summary
+import writer
+from database import SessionLocal
+from models import DailySummary, Workout
+
+TODAY = date(2024, 6, 12)
+
+def _log(day, minutes):
+    writer.add_workout(date=day, exercise_type="Running", duration=minutes, calories_burned=10 * minutes).result()
+
+def _page():
+    page = queries.get_workout_page.uncached(date(2024, 1, 1), TODAY)
+    return list(zip(page['Date'].dt.date, page['Duration (min)']))
+
+def _daily_totals():
+    with SessionLocal() as db:
+        return db.execute(select(
+            DailySummary.date, DailySummary.workout_count, DailySummary.workout_duration
+        ).where(DailySummary.workout_count != 0).order_by(DailySummary.date)).all()
+
+def test_archived_and_hot_rows_read_once(bind):
+    _log(date(2024, 1, 5), 30)
+    _log(date(2024, 1, 20), 40)
+    _log(date(2024, 6, 1), 50)
+    before = _page()
+
+    moved = archive.archive_months(bind, keep_months=3, today=TODAY)
+    assert moved == [("workouts", date(2024, 1, 1), 2)]
+    with SessionLocal() as db:
+        assert db.execute(select(func.count()).select_from(Workout)).scalar() == 1
+    assert _page() == before
+
+    # Logged later for the archived month: read from SQLite until folded in
+    _log(date(2024, 1, 10), 20)
+    expected = sorted([*before, (date(2024, 1, 10), 20)], reverse=True)
+    assert _page() == expected
+    archive.archive_months(bind, keep_months=3, today=TODAY)
+    assert _page() == expected
+    files = os.listdir(os.path.join(archive.archive_dir(bind), "workouts"))
+    assert sorted(files) == ["2024-01.1.parquet", "2024-01.2.parquet"]
+
+    totals = _daily_totals()
+    with bind.begin() as conn:
+        summary.rebuild_daily_summary(conn)
+    assert _daily_totals() == totals
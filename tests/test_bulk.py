@@ -0,0 +1,57 @@
+from datetime import date
+
+from sqlalchemy import select
+
+import archive
+import bulk
+import writer
+from database import SessionLocal
+from models import DailySummary, Food, Meal
+
+START, END = date(2024, 1, 1), date(2024, 6, 30)
+TODAY = date(2024, 6, 12)
+
+def _state():
+    with SessionLocal() as db:
+        meals = db.execute(select(
+            Meal.id, Meal.date, Meal.meal_type, Meal.food_name, Meal.calories
+        ).order_by(Meal.id)).all()
+        totals = db.execute(select(
+            DailySummary.date, DailySummary.meal_count, DailySummary.calories_consumed
+        ).order_by(DailySummary.date)).all()
+        foods = dict(db.execute(select(Food.name, Food.times_logged)).all())
+    return meals, totals, foods
+
+def _meal(day, meal_type, food_name, calories):
+    writer.add_meal(date=day, meal_type=meal_type, food_name=food_name, calories=calories).result()
+
+def test_undo_restores_rows_summary_and_catalog(bind):
+    _meal(date(2024, 6, 1), "Breakfast", "Oatmeal", 300)
+    _meal(date(2024, 6, 2), "Breakfast", "oatmeal", 320)
+    _meal(date(2024, 6, 2), "Lunch", "Tuna wrap", 450)
+    before = _state()
+
+    selection = bulk.Selection("meals", START, END, food_name="Oatmeal")
+    assert bulk.edit_rows(selection, "food_name", "Porridge", bind) == 2
+    meals, _, foods = _state()
+    assert [meal.food_name for meal in meals] == ["Porridge", "Porridge", "Tuna wrap"]
+    assert foods["Oatmeal"] == 0 and foods["Porridge"] == 2
+
+    assert bulk.delete_rows(bulk.Selection("meals", START, END, kind="Lunch"), bind) == 1
+    meals, totals, foods = _state()
+    assert len(meals) == 2 and foods["Tuna wrap"] == 0
+    assert totals[-1].calories_consumed == 320
+
+    assert bulk.undo_last(bind).action == "delete"
+    assert bulk.undo_last(bind).action == "edit"
+    assert bulk.undo_last(bind) is None
+    meals, totals, foods = _state()
+    assert (meals, totals) == before[:2]
+    assert foods["Oatmeal"] == 2 and foods["Tuna wrap"] == 1 and foods["Porridge"] == 0
+
+def test_kinds_include_archived_months(bind):
+    _meal(date(2024, 1, 5), "Brunch", "Pancakes", 600)
+    _meal(date(2024, 6, 1), "Lunch", "Tuna wrap", 450)
+    archive.archive_months(bind, keep_months=3, today=TODAY)
+    assert bulk.kinds("meals", START, END, bind) == ["Brunch", "Lunch"]
+    assert bulk.kinds("meals", date(2024, 5, 1), END, bind) == ["Lunch"]
@@ -0,0 +1,35 @@
+from datetime import date
+
+from sqlalchemy import select
+
+import writer
+from cache import query_cache
+from database import SessionLocal
+from models import Food, Meal
+
+DAY = date(2024, 6, 12)
+
+def _times_logged(name):
+    with SessionLocal() as db:
+        return db.execute(select(Food.times_logged).where(Food.name == name)).scalar()
+
+def test_deleting_a_meal_uncounts_its_food(bind):
+    for _ in range(2):
+        writer.add_meal(date=DAY, meal_type="Lunch", food_name="Oatmeal", calories=300).result()
+    assert _times_logged("Oatmeal") == 2
+
+    with SessionLocal() as db:
+        meal = db.execute(select(Meal).limit(1)).scalar_one()
+    assert writer.delete_meal(meal).result() == 1
+    assert _times_logged("oatmeal") == 1
+
+def test_failed_invalidation_still_resolves_the_write(bind, monkeypatch):
+    def broken(*tokens, scope=None):
+        raise RuntimeError("cache unavailable")
+
+    monkeypatch.setattr(query_cache, "bump", broken)
+    future = writer.add_workout(date=DAY, exercise_type="Running", duration=30, calories_burned=300)
+    assert future.result(timeout=5) is None
+    monkeypatch.undo()
+    # The writer thread survived
+    writer.add_workout(date=DAY, exercise_type="Yoga", duration=20, calories_burned=80).result(timeout=5)
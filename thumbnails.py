@@ -0,0 +1,76 @@
+"""Resized copies of the hero images, made once and kept on disk.
+
+The stock photos are several megapixels but shown a third of the page
+wide, and st.image reads and processes the whole file on every rerun.
+`thumbnail` returns the JPEG bytes of a copy `width` pixels wide, stored in
+a thumbs/ folder next to the original and remade only when the original
+changes, so neither reruns nor restarts decode the full-size file. The
+copies can be made ahead of a deployment:
+
+    python thumbnails.py attached_assets/stock_images --width 640
+"""
+import argparse
+import io
+import os
+import tempfile
+
+THUMBNAIL_WIDTH = 640
+JPEG_QUALITY = 82
+
+def thumbnail_path(path, width=THUMBNAIL_WIDTH):
+    folder, name = os.path.split(path)
+    stem, _ = os.path.splitext(name)
+    return os.path.join(folder, "thumbs", f"{stem}_{width}w.jpg")
+
+def make_thumbnail(path, width=THUMBNAIL_WIDTH, quality=JPEG_QUALITY):
+    """Get the JPEG bytes of an image scaled down to `width` pixels wide"""
+    from PIL import Image  # Pillow ships with Streamlit
+
+    with Image.open(path) as image:
+        height = round(image.height * width / image.width)
+        # JPEGs are decoded straight at a fraction of their size
+        image.draft("RGB", (width, height))
+        image = image.convert("RGB")
+        if image.width > width:
+            image = image.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+def thumbnail(path, width=THUMBNAIL_WIDTH):
+    """Get the bytes of an image's thumbnail, making it if missing or stale"""
+    target = thumbnail_path(path, width)
+    try:
+        if os.path.getmtime(target) >= os.path.getmtime(path):
+            with open(target, "rb") as f:
+                return f.read()
+    except FileNotFoundError:
+        pass
+
+    data = make_thumbnail(path, width)
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written aside and renamed, so a concurrent reader never sees half a file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, target)
+    except OSError:
+        # Read-only deployment: serve the copy from memory
+        pass
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Make the thumbnails of a folder of images")
+    parser.add_argument("folder")
+    parser.add_argument("--width", type=int, default=THUMBNAIL_WIDTH)
+    args = parser.parse_args()
+
+    for name in sorted(os.listdir(args.folder)):
+        path = os.path.join(args.folder, name)
+        if os.path.isfile(path) and name.lower().endswith((".jpg", ".jpeg", ".png")):
+            size = len(thumbnail(path, args.width))
+            print(f"✅ {thumbnail_path(path, args.width)} ({size / 1024:,.0f} KB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Time bucketing and downsampling that keep chart payloads bounded.
+
+A chart over any span gets at most about `CHART_POINTS` points. The data is
+aggregated in SQL per day, week or month, whichever is the finest bucket
+that fits the budget, and line series still over the budget are thinned
+with largest-triangle-three-buckets (LTTB), which keeps the peaks and
+troughs a reader would notice.
+"""
+import numpy as np
+from sqlalchemy import func
+
+CHART_POINTS = 250
+
+# bucket -> approximate length in days
+BUCKET_DAYS = {"day": 1, "week": 7, "month": 30.44}
+
+def choose_bucket(start_date, end_date, max_points=CHART_POINTS):
+    """Get the finest bucket that spans the range in at most `max_points` points"""
+    days = (end_date - start_date).days + 1
+    for bucket, length in BUCKET_DAYS.items():
+        if days / length <= max_points:
+            return bucket
+    return "month"
+
+def bucket_start(date_column, bucket):
+    """SQL expression for the first day of the bucket holding `date_column`
+
+    Weeks start on Monday. Dates are stored as ISO text, so every bucket
+    comes back as ISO text too.
+    """
+    if bucket == "day":
+        return date_column
+    if bucket == "week":
+        # Forward to Sunday (or stay on it), then back to its Monday
+        return func.date(date_column, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", date_column)
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+def lttb(x, y, n_out):
+    """Get the indices of the `n_out` points LTTB keeps from a series
+
+    The first and last points are always kept. Between them the series is
+    split into `n_out - 2` equal buckets, and each bucket keeps the point
+    forming the largest triangle with the point kept before it and the
+    average of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_lo, next_hi = edges[i + 1], edges[i + 2]
+            cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        areas = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+def downsample(frame, x, y, max_points=CHART_POINTS):
+    """Thin a line series DataFrame to at most `max_points` rows with LTTB
+
+    `x` must be a datetime or numeric column; rows are kept whole, so other
+    columns follow the points chosen for `y`.
+    """
+    if len(frame) <= max_points:
+        return frame
+    xs = frame[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[D]").astype(np.int64)
+    kept = lttb(xs, frame[y].to_numpy(), max_points)
+    return frame.iloc[kept].reset_index(drop=True)
@@ -0,0 +1,47 @@
+"""Per-entity data version tokens stored in the database itself.
+
+`data_versions` holds a random token for each entity. Every write path
+replaces the tokens of the entities it changes with `touch`, in the same
+transaction as the write, so any process reading the file sees new tokens
+exactly when it sees the new rows. The shared cache (shared_cache.py) keys
+its entries by these tokens, and the change feed (changes.py) compares them
+to tell which entities another connection changed.
+
+Tokens are random rather than counters: a database restored from a backup
+comes back with the tokens of its state at the time, and a recreated file
+starts over with new ones, where counters would repeat values for
+different data. Writes made outside the app's code (the sqlite3 shell, for
+one) do not touch the tokens; clear the shared cache after those.
+"""
+import secrets
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import DataVersion
+
+ENTITIES = ("workouts", "meals", "measurements", "foods")
+
+def touch(conn, *entities):
+    """Give `entities` new tokens on an open transaction (Connection or Session)
+
+    Returns the new tokens by entity.
+    """
+    # From the OS, so forked processes never draw the same ones
+    new = {entity: secrets.randbits(63) for entity in entities}
+    if new:
+        stmt = insert(DataVersion).values([
+            {"entity": entity, "version": token} for entity, token in new.items()
+        ])
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[DataVersion.entity], set_={"version": stmt.excluded.version}
+        ))
+    return new
+
+def tokens(bind, entities):
+    """Get the current tokens of `entities`, in order"""
+    with bind.connect() as conn:
+        found = dict(conn.execute(
+            select(DataVersion.entity, DataVersion.version).where(DataVersion.entity.in_(entities))
+        ).all())
+    return tuple(found.get(entity) for entity in entities)
@@ -0,0 +1,194 @@
+"""Background write queue: the app's inserts, updates and deletes, batched.
+
+SQLite lets one writer commit at a time, so instead of every browser
+session opening its own write transaction, writes are handed to a single
+writer thread. Whatever piles up while a transaction commits goes into the
+next one, so a burst of clicks costs one commit instead of one each. Each
+submitted write gets a Future: the submitting session keeps it and waits on
+it before its next read (read-your-writes), and a write that failed raises
+its error there. A failing write is retried on its own so it cannot take the
+rest of its batch down with it. In a multi-user deployment a write goes to
+the database active when it was submitted, and a batch commits one
+transaction per database.
+
+    future = writer.add_workout(date=day, exercise_type="Running", duration=30, calories_burned=300)
+    future.result()  # committed, cache invalidated
+"""
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import delete
+
+from cache import query_cache
+from changes import change_feed
+from database import SessionLocal, current_engine, database_key
+from models import Workout, Meal, BodyMeasurement, calculate_bmi
+import catalog
+import summary
+import versions
+
+MAX_BATCH = 500
+# Seconds to wait for queued writes when the process exits
+EXIT_TIMEOUT = 10
+
+logger = logging.getLogger("fittrack.writer")
+
+class WriteQueue:
+    """Single writer thread committing submitted writes in batches"""
+
+    def __init__(self, session_factory=SessionLocal, max_batch=MAX_BATCH):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, entities, apply):
+        """Queue `apply(db)` as a write to `entities`, returning a Future of its result"""
+        future = Future()
+        self._start()
+        self._queue.put((entities, apply, future, current_engine()))
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far is committed or failed"""
+        future = Future()
+        self._start()
+        self._queue.put(((), None, future, None))
+        future.result(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fittrack-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            per_database, flushes = {}, []
+            for item in batch:
+                if item[3] is None:
+                    flushes.append(item[2])
+                else:
+                    per_database.setdefault(item[3], []).append(item)
+            for bind, writes in per_database.items():
+                self._write(bind, writes)
+            # Resolved last: everything queued before them is in this batch or an earlier one
+            for future in flushes:
+                future.set_result(None)
+
+    def _write(self, bind, batch):
+        try:
+            with self.session_factory(bind=bind) as db:
+                results = [apply(db) for _, apply, _, _ in batch]
+                tokens = versions.touch(db, *_entities(batch))
+                db.commit()
+        except Exception as exc:
+            if len(batch) == 1:
+                batch[0][2].set_exception(exc)
+                return
+            # Find the culprit: every write gets its own transaction
+            for item in batch:
+                self._write(bind, [item])
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        try:
+            query_cache.bump(*tokens, scope=database_key(bind))
+            change_feed.record(bind, tokens)
+        except Exception:
+            # Committed all the same; the change feed picks it up on its next sync
+            logger.exception("Invalidating caches after a write failed")
+        for (_, _, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        """Get the number of committed writes and transactions"""
+        return {"writes": self.writes, "batches": self.batches, "queued": self._queue.qsize()}
+
+def _entities(batch):
+    return sorted({entity for entities, _, _, _ in batch for entity in entities})
+
+# Shared by every session served from this process
+write_queue = WriteQueue()
+
+@atexit.register
+def _drain():
+    if write_queue._thread is not None:
+        try:
+            write_queue.flush(EXIT_TIMEOUT)
+        except TimeoutError:
+            pass
+
+def _add_workout(values, db):
+    workout = Workout(**values)
+    db.add(workout)
+    summary.add_workout(db, workout)
+
+def _delete_workout(workout, db):
+    result = db.execute(delete(Workout).where(Workout.id == workout.id))
+    if result.rowcount:
+        summary.remove_workout(db, workout)
+    return result.rowcount
+
+def _add_meal(values, db):
+    meal = Meal(**values)
+    db.add(meal)
+    summary.add_meal(db, meal)
+    catalog.add_meal(db, meal)
+
+def _delete_meal(meal, db):
+    result = db.execute(delete(Meal).where(Meal.id == meal.id))
+    if result.rowcount:
+        summary.remove_meal(db, meal)
+        catalog.remove_meal(db, meal)
+    return result.rowcount
+
+def _save_measurement(values, db):
+    existing = db.query(BodyMeasurement).filter(
+        BodyMeasurement.date == values["date"]
+    ).first()
+    if existing:
+        for name, value in values.items():
+            setattr(existing, name, value)
+        return "updated"
+    db.add(BodyMeasurement(**values))
+    return "added"
+
+def add_workout(**values):
+    """Queue a new workout"""
+    return write_queue.submit(("workouts",), lambda db: _add_workout(values, db))
+
+def delete_workout(workout):
+    """Queue the deletion of a workout row (id, date, duration, calories_burned)"""
+    return write_queue.submit(("workouts",), lambda db: _delete_workout(workout, db))
+
+def add_meal(**values):
+    """Queue a new meal, recording its food in the catalog"""
+    return write_queue.submit(("meals", "foods"), lambda db: _add_meal(values, db))
+
+def delete_meal(meal):
+    """Queue the deletion of a meal row (id, date, food name and its nutrition values)"""
+    return write_queue.submit(("meals", "foods"), lambda db: _delete_meal(meal, db))
+
+def save_measurement(**values):
+    """Queue saving the measurement of a date, replacing any existing one
+
+    BMI is calculated from weight and height when not given. The Future
+    resolves to "added" or "updated".
+    """
+    if values.get("bmi") is None:
+        values["bmi"] = calculate_bmi(values["weight"], values.get("height"))
+    return write_queue.submit(("measurements",), lambda db: _save_measurement(values, db))